@@ -0,0 +1,224 @@
+"""
+Benchmark gửi cảnh báo Luồng Lạnh -> Lambda_Alert -> SNS khi có đợt gian lận dồn dập (fraud burst).
+
+BURST_USERS khách hàng bị model đánh dấu gian lận liên tục trong NUM_BATCHES batch Kinesis (BURST_RATIO số giao dịch).
+So sánh:
+  - per-record (cách cũ): 1 lần invoke Lambda_Alert + 1 SNS Publish / giao dịch gian lận
+  - batched: cả batch trong 1 lần invoke ({"alerts": [...]}), Lambda_Alert gửi bằng PublishBatch,
+    gộp theo nameOrig trong batch; WINDOW_SECONDS > 0: tối đa 1 cảnh báo / khách hàng / cửa sổ, cảnh báo bị giữ lại
+    được đếm và gắn vào cảnh báo kế tiếp sau khi hết cửa sổ
+    (mốc trong container, hoặc trên Redis dùng chung => container mới vẫn nhận ra khách hàng vừa được cảnh báo)
+Đếm số invoke, số request SNS, số cảnh báo người nhận thực sự nhận được. Sau khi hết cửa sổ (giả lập) phải có
+count + suppressed_count == số giao dịch gian lận (không cảnh báo nào bị mất); invoke lỗi chỉ xoá mốc do batch đó đặt.
+
+Chạy:
+  python benchmarks/bench_alert_coalescing.py
+  BURST_USERS=50 AWS_LATENCY_MS=20 python benchmarks/bench_alert_coalescing.py
+"""
+import contextlib
+import io
+import json
+import logging
+import os
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict, List
+
+from cold_path_stubs import kinesis_event, load_cold_path
+from local_redis import ROOT_DIR, make_redis
+from traffic import PaySimTraffic
+
+# --- CẤU HÌNH ---
+NUM_BATCHES: int = int(os.getenv("NUM_BATCHES", "10"))
+KINESIS_BATCH: int = int(os.getenv("KINESIS_BATCH", "100"))
+BURST_USERS: int = int(os.getenv("BURST_USERS", "10"))
+BURST_RATIO: float = float(os.getenv("BURST_RATIO", "0.3"))
+AWS_LATENCY_MS: float = float(os.getenv("AWS_LATENCY_MS", "10"))
+WINDOW_SECONDS: float = float(os.getenv("WINDOW_SECONDS", "60"))
+# --- KẾT THÚC CẤU HÌNH ---
+
+ALERT_DIR: str = os.path.join(ROOT_DIR, "src", "lambda_alert")
+
+
+class StubSns:
+    def __init__(self, latency_ms: float) -> None:
+        self.latency_seconds = latency_ms / 1000.0
+        self.calls: Counter = Counter()
+        self.messages: int = 0
+
+    def publish(self, **kwargs: Any) -> Dict[str, Any]:
+        self.calls["publish"] += 1
+        self.messages += 1
+        time.sleep(self.latency_seconds)
+        return {"MessageId": "1"}
+
+    def publish_batch(self, PublishBatchRequestEntries: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+        assert len(PublishBatchRequestEntries) <= 10, "PublishBatch accepts at most 10 entries"
+        self.calls["publish_batch"] += 1
+        self.messages += len(PublishBatchRequestEntries)
+        time.sleep(self.latency_seconds)
+        return {"Successful": [{"Id": e["Id"]} for e in PublishBatchRequestEntries], "Failed": []}
+
+
+class StubAlertLambda:
+    # lambda client giả: invoke bất đồng bộ chỉ tốn latency, payload được Lambda_Alert xử lý sau, tính thời gian riêng
+    def __init__(self, latency_ms: float) -> None:
+        self.latency_seconds = latency_ms / 1000.0
+        self.payloads: List[Dict[str, Any]] = []
+
+    def invoke(self, FunctionName: str, InvocationType: str, Payload: str, **kwargs: Any) -> Dict[str, Any]:
+        time.sleep(self.latency_seconds)
+        self.payloads.append(json.loads(Payload))
+        return {"StatusCode": 202}
+
+
+def load_alert_lambda(sns: StubSns):
+    import boto3
+
+    os.environ.setdefault("ALERT_TOPIC_ARN", "arn:aws:sns:us-east-1:000000000000:fraud-alerts")
+    sys.path.insert(0, ALERT_DIR)
+    original_client = boto3.client
+    boto3.client = lambda service, *args, **kwargs: sns
+    try:
+        import lambda_function as alert_lambda
+    finally:
+        boto3.client = original_client
+    return alert_lambda
+
+
+def expire_window(merge, redis_client) -> None:
+    # giả lập hết cửa sổ: xoá mốc "đã cảnh báo" (trong container + Redis), giữ nguyên số cảnh báo bị giữ lại
+    merge.alert_coalescer.last_sent.clear()
+    keys = list(redis_client.scan_iter(f"{merge.ALERT_SENT_KEY_PREFIX}:*"))
+    if keys:
+        redis_client.delete(*keys)
+
+
+class FailingAlertLambda:
+    def invoke(self, **kwargs: Any) -> Dict[str, Any]:
+        raise RuntimeError("Lambda_Alert throttled")
+
+
+def failed_invoke_releases_own_markers(merge, redis_client) -> None:
+    # C_OLD đã được cảnh báo (mốc có sẵn) => bị giữ lại; C_NEW vừa đặt mốc nhưng invoke lỗi => chỉ mốc của C_NEW bị xoá
+    redis_client.flushall()
+    logging.getLogger().setLevel(logging.CRITICAL)  # lỗi invoke là cố ý
+    coalescer = merge.AlertCoalescer(WINDOW_SECONDS, redis_client=redis_client)
+    coalescer.claim(["C_OLD"], time.monotonic())
+    merge.alert_coalescer = coalescer
+    merge.lambda_client = FailingAlertLambda()
+    alerts = [({"id": i}, {"nameOrig": c, "transactionId": str(i), "amount": 10.0, "ai_probability": 0.9})
+              for i, c in enumerate(["C_OLD", "C_NEW", "C_NEW"])]
+    retry = merge.deliver_alerts(alerts)
+    assert [r["id"] for r in retry] == [1, 2], retry
+    assert redis_client.exists(coalescer.sent_key("C_OLD")) and not redis_client.exists(coalescer.sent_key("C_NEW"))
+    assert coalescer.take_suppressed(["C_OLD"]) == {"C_OLD": (1, 10.0)}
+    print("failed invoke: retry only the new customer's records, existing window marker kept")
+
+
+def main() -> None:
+    merge, _, _, _ = load_cold_path()
+    logging.getLogger().setLevel(logging.ERROR)
+    sns = StubSns(AWS_LATENCY_MS)
+    alert_lambda = load_alert_lambda(sns)
+    lambda_client = StubAlertLambda(AWS_LATENCY_MS)
+    merge.lambda_client = lambda_client
+    merge.executor = None
+
+    # fraud burst: BURST_RATIO giao dịch thuộc BURST_USERS khách hàng, model đánh dấu toàn bộ là gian lận
+    traffic = PaySimTraffic(seed=21)
+    burst_users = [f"C_BURST_{i}" for i in range(BURST_USERS)]
+    transactions = []
+    for i, txn in enumerate(traffic.stream(NUM_BATCHES * KINESIS_BATCH)):
+        if i % int(1 / BURST_RATIO) == 0:
+            txn = dict(txn, nameOrig=burst_users[i % BURST_USERS])
+        transactions.append(dict(txn, step=i))
+    events = [kinesis_event(transactions[i:i + KINESIS_BATCH], i) for i in range(0, len(transactions), KINESIS_BATCH)]
+    merge.get_cached_predictions = lambda txns, executor=None: [
+        {"prediction": int(t["nameOrig"].startswith("C_BURST_")), "probability": 0.97 if t["nameOrig"].startswith("C_BURST_") else 0.01}
+        for t in txns
+    ]
+    flagged = sum(1 for t in transactions if t["nameOrig"].startswith("C_BURST_"))
+    flagged_first_batch = sum(1 for t in transactions[:KINESIS_BATCH] if t["nameOrig"].startswith("C_BURST_"))
+
+    # chỉ tính thời gian stage cảnh báo của Lambda_FraudScoring
+    deliver_alerts = merge.deliver_alerts
+    alert_stage = [0.0]
+
+    def timed_deliver_alerts(alerts, executor=None):
+        started = time.perf_counter()
+        try:
+            return deliver_alerts(alerts, executor)
+        finally:
+            alert_stage[0] += (time.perf_counter() - started) * 1000
+
+    merge.deliver_alerts = timed_deliver_alerts
+
+    print(f"batches={NUM_BATCHES}x{KINESIS_BATCH} flagged={flagged} burst_users={BURST_USERS} aws_latency={AWS_LATENCY_MS}ms")
+    print(f"{'mode':<28}{'alert stage ms':>15}{'invokes':>9}{'SNS requests':>14}{'alerts':>8}{'alert Lambda ms':>17}")
+
+    # per-record: 1 invoke + 1 Publish / giao dịch gian lận (cách cũ)
+    sns.calls.clear()
+    sns.messages = 0
+    started = time.perf_counter()
+    for txn in transactions:
+        if txn["nameOrig"].startswith("C_BURST_"):
+            lambda_client.invoke(FunctionName="Lambda_Alert", InvocationType="Event", Payload=json.dumps(txn))
+    invoke_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # Lambda_Alert print log mỗi lần gửi
+        for payload in lambda_client.payloads:
+            alert_lambda.lambda_handler(payload)
+    handler_ms = (time.perf_counter() - started) * 1000
+    print(f"{'per-record':<28}{invoke_ms:>15.1f}{len(lambda_client.payloads):>9}{sum(sns.calls.values()):>14}{sns.messages:>8}{handler_ms:>17.1f}")
+
+    shared_redis, _ = make_redis()
+    modes = [
+        ("batched, window=0s", lambda: merge.AlertCoalescer(0.0)),
+        (f"window={WINDOW_SECONDS:g}s, container", lambda: merge.AlertCoalescer(WINDOW_SECONDS)),
+        (f"window={WINDOW_SECONDS:g}s, Redis", lambda: merge.AlertCoalescer(WINDOW_SECONDS, redis_client=shared_redis)),
+        # container mới (mất mốc trong bộ nhớ) nhưng Redis vẫn còn mốc của các lần gửi trước
+        (f"window={WINDOW_SECONDS:g}s, Redis, new ctr", lambda: merge.AlertCoalescer(WINDOW_SECONDS, redis_client=shared_redis)),
+    ]
+    for label, make_coalescer in modes:
+        merge.alert_coalescer = make_coalescer()
+        lambda_client.payloads.clear()
+        sns.calls.clear()
+        sns.messages = 0
+        alert_stage[0] = 0.0
+        for event in events:
+            sent_before = len(lambda_client.payloads)
+            assert not merge.lambda_handler(event, None)["batchItemFailures"]
+            if merge.alert_coalescer.window_seconds <= 0:
+                flagged_in_batch = sum(
+                    1 for record in event["Records"]
+                    if json.loads(merge.base64.b64decode(record["kinesis"]["data"]))["nameOrig"].startswith("C_BURST_")
+                )
+                delivered_in_batch = sum(a["count"] for p in lambda_client.payloads[sent_before:] for a in p["alerts"])
+                assert delivered_in_batch == flagged_in_batch, "cảnh báo bị giữ lại khi không bật cửa sổ"
+        in_window = Counter(a["nameOrig"] for p in lambda_client.payloads for a in p["alerts"])
+        if merge.alert_coalescer.window_seconds > 0:
+            assert max(in_window.values(), default=0) <= 1, "more than one alert per customer within the window"
+
+        # hết cửa sổ (giả lập): batch kế tiếp mang theo số cảnh báo bị giữ lại
+        expire_window(merge, shared_redis)
+        assert not merge.lambda_handler(events[0], None)["batchItemFailures"]
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            responses = [alert_lambda.lambda_handler(payload) for payload in lambda_client.payloads]
+        assert all(response["statusCode"] == 200 for response in responses)
+        handler_ms = (time.perf_counter() - started) * 1000
+
+        alerts = [alert for payload in lambda_client.payloads for alert in payload["alerts"]]
+        delivered = sum(alert["count"] for alert in alerts)
+        suppressed = sum(alert.get("suppressed_count", 0) for alert in alerts)
+        assert delivered + suppressed == flagged + flagged_first_batch, "flagged transactions lost by coalescing"
+        print(f"{label:<28}{alert_stage[0]:>15.1f}{len(lambda_client.payloads):>9}{sum(sns.calls.values()):>14}{sns.messages:>8}{handler_ms:>17.1f}"
+              f"   ({delivered} delivered + {suppressed} suppressed, {sum(in_window.values())} alerts within window)")
+
+    failed_invoke_releases_own_markers(merge, shared_redis)
+
+
+if __name__ == "__main__":
+    main()
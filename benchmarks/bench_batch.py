@@ -0,0 +1,111 @@
+"""
+So sánh throughput của lambda_handler: 1 giao dịch / request vs batch N giao dịch / request.
+Redis local có giả lập RTT, Kinesis / S3 là client giả có độ trễ.
+Overhead cố định mỗi lần gọi Lambda (API Gateway, TLS, invoke) được cộng thêm bằng INVOKE_OVERHEAD_MS.
+
+Chạy:
+  python benchmarks/bench_batch.py
+  BATCH_SIZE=200 RTT_MS=1 INVOKE_OVERHEAD_MS=20 python benchmarks/bench_batch.py
+"""
+import contextlib
+import io
+import json
+import os
+import random
+import time
+
+from hot_path_stubs import load_hot_path
+
+# --- CẤU HÌNH ---
+NUM_TXNS: int = int(os.getenv("NUM_TXNS", "1000"))
+BATCH_SIZE: int = int(os.getenv("BATCH_SIZE", "100"))
+RTT_MS: float = float(os.getenv("RTT_MS", "0.5"))
+AWS_LATENCY_MS: float = float(os.getenv("AWS_LATENCY_MS", "5"))
+INVOKE_OVERHEAD_MS: float = float(os.getenv("INVOKE_OVERHEAD_MS", "10"))
+# --- KẾT THÚC CẤU HÌNH ---
+
+
+def make_transactions(n: int):
+    rnd = random.Random(3)
+    return [{
+        "step": 1,
+        "type": rnd.choice(["PAYMENT", "TRANSFER", "CASH_OUT"]),
+        "amount": round(rnd.uniform(1.0, 50000.0), 2),
+        "nameOrig": f"C{rnd.randrange(10 ** 6):09d}",
+        "nameDest": f"M{rnd.randrange(10 ** 6):09d}",
+        "oldbalanceOrg": 100000.0,
+        "newbalanceOrig": 50000.0,
+        "oldbalanceDest": 0.0,
+        "newbalanceDest": 50000.0,
+    } for _ in range(n)]
+
+
+def run(txns, batch_size: int):
+    lambda_function, _, redis_stats, kinesis_stub, s3_stub = load_hot_path(RTT_MS, AWS_LATENCY_MS)
+
+    invocations = 0
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for offset in range(0, len(txns), batch_size):
+            chunk = txns[offset:offset + batch_size]
+            body = json.dumps(chunk if batch_size > 1 else chunk[0])
+            time.sleep(INVOKE_OVERHEAD_MS / 1000.0)
+            response = lambda_function.lambda_handler({"body": body})
+            assert response["statusCode"] in (200, 400), response
+            invocations += 1
+    elapsed = time.perf_counter() - start
+
+    return {
+        "txn_per_s": len(txns) / elapsed,
+        "invocations": invocations,
+        "redis_rtt": redis_stats.round_trips,
+        "aws_calls": sum(kinesis_stub.calls.values()) + sum(s3_stub.calls.values()),
+    }
+
+
+def check_failed_batch(txns) -> None:
+    """
+    Batch lỗi giữa chừng (vd: S3 lỗi sau khi đã buffer một phần giao dịch Approved) => 500 và không để lại record trong
+    buffer Kinesis / archive S3 cho request sau gửi hộ (trùng với lần client retry).
+    """
+    lambda_function, _, _, kinesis_stub, _ = load_hot_path()
+    import kinesis_publisher
+    import save_s3
+
+    buffer_transaction = lambda_function.buffer_transaction
+    buffered = [0]
+
+    def failing_buffer_transaction(transaction):
+        buffered[0] += 1
+        if buffered[0] > len(txns) // 2:
+            raise RuntimeError("[S3] ERROR: simulated failure")
+        buffer_transaction(transaction)
+
+    lambda_function.buffer_transaction = failing_buffer_transaction
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = lambda_function.lambda_handler({"body": json.dumps(txns)})
+    finally:
+        lambda_function.buffer_transaction = buffer_transaction
+    assert response["statusCode"] == 500, response
+    assert not kinesis_publisher.kinesis_buffer.records and not save_s3.violation_archive.partitions, "buffer còn record sau batch lỗi"
+
+    kinesis_stub.calls.clear()
+    with contextlib.redirect_stdout(io.StringIO()):
+        lambda_function.lambda_handler({"body": json.dumps(txns[0])})
+    assert not kinesis_stub.calls["put_records"], "request sau gửi record của batch lỗi"
+    print(f"failed batch: 500, buffer discarded ({len(txns) // 2} buffered records not published)")
+
+
+def main() -> None:
+    txns = make_transactions(NUM_TXNS)
+    print(f"txns={NUM_TXNS} redis_rtt={RTT_MS}ms aws_latency={AWS_LATENCY_MS}ms invoke_overhead={INVOKE_OVERHEAD_MS}ms")
+    print(f"{'mode':<14}{'txn/s':>10}{'invokes':>10}{'redis RTT':>12}{'AWS calls':>12}")
+    for name, size in (("single", 1), (f"batch({BATCH_SIZE})", BATCH_SIZE)):
+        stats = run(txns, size)
+        print(f"{name:<14}{stats['txn_per_s']:>10.0f}{stats['invocations']:>10}{stats['redis_rtt']:>12}{stats['aws_calls']:>12}")
+    check_failed_batch(txns[:BATCH_SIZE])
+
+
+if __name__ == "__main__":
+    main()
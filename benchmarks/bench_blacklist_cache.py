@@ -0,0 +1,136 @@
+"""
+Đo hiệu quả near-cache blacklist (bloom filter) trong check_rules:
+số lệnh Redis / txn, số RTT / txn và độ trễ p50/p99, có và không có cache.
+Kèm chi phí refresh(): kiểm tra version (không đổi => không build lại, kể cả khi chưa có meta:blacklist:version)
+so với build lại snapshot khi blacklist đổi.
+
+Chạy:
+  python benchmarks/bench_blacklist_cache.py
+  BLACKLIST_SIZE=200000 HIT_RATIO=0.05 python benchmarks/bench_blacklist_cache.py
+"""
+import os
+import random
+import statistics
+import time
+
+from local_redis import add_hot_path_to_sys_path, make_redis
+
+add_hot_path_to_sys_path()
+from blacklist_cache import BlacklistNearCache  # noqa: E402
+from rules_engine import check_rules  # noqa: E402
+
+# --- CẤU HÌNH ---
+NUM_TXNS: int = int(os.getenv("NUM_TXNS", "2000"))
+BLACKLIST_SIZE: int = int(os.getenv("BLACKLIST_SIZE", "50000"))
+HIT_RATIO: float = float(os.getenv("HIT_RATIO", "0.01"))  # tỉ lệ giao dịch có nameOrig nằm trong blacklist
+RTT_MS: float = float(os.getenv("RTT_MS", "0.5"))
+# --- KẾT THÚC CẤU HÌNH ---
+
+BASE_TIME: float = 1_700_000_000.0
+
+
+def make_transactions(n: int):
+    rnd = random.Random(7)
+    txns = []
+    for i in range(n):
+        if rnd.random() < HIT_RATIO:
+            name_orig = f"CBLACK{rnd.randrange(BLACKLIST_SIZE):09d}"
+        else:
+            name_orig = f"C{i:09d}"
+        txns.append({
+            "type": "TRANSFER",
+            "amount": 1000.0,
+            "nameOrig": name_orig,
+            "nameDest": f"M{rnd.randrange(10 ** 6):09d}",
+            "oldbalanceOrg": 1000.0,
+            "newbalanceOrig": 0.0,
+            "oldbalanceDest": 0.0,
+            "newbalanceDest": 1000.0,
+        })
+    return txns
+
+
+def run(mode: str, use_cache: bool, txns):
+    redis_client, stats = make_redis(rtt_ms=RTT_MS)
+    members = [f"CBLACK{i:09d}" for i in range(BLACKLIST_SIZE)]
+    for start in range(0, len(members), 10000):
+        redis_client.sadd("blacklist:nameOrig", *members[start:start + 10000])
+    redis_client.sadd("blacklist:nameDes", *[f"MBLACK{i:09d}" for i in range(BLACKLIST_SIZE // 10)])
+
+    cache = None
+    if use_cache:
+        cache = BlacklistNearCache(redis_client, refresh_seconds=3600)
+        build_start = time.perf_counter()
+        cache.refresh(force=True)
+        print(f"  snapshot build: {(time.perf_counter() - build_start) * 1000:.1f} ms")
+    stats.reset()
+
+    results = []
+    latencies = []
+    for i, txn in enumerate(txns):
+        start = time.perf_counter()
+        # cố định đồng hồ để 2 lần chạy rơi vào cùng bucket velocity => so sánh được kết quả
+        results.append(check_rules(redis_client, txn, now=BASE_TIME + i * 0.01, mode=mode, blacklist_cache=cache))
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "results": results,
+        "cmd_per_txn": stats.commands / len(txns),
+        "rtt_per_txn": stats.round_trips / len(txns),
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": statistics.quantiles(latencies, n=100)[98],
+        "counters": cache.counters() if cache else None,
+    }
+
+
+def main() -> None:
+    txns = make_transactions(NUM_TXNS)
+    print(f"txns={NUM_TXNS} blacklist_size={BLACKLIST_SIZE} hit_ratio={HIT_RATIO} simulated_rtt={RTT_MS}ms")
+    rows = []
+    for mode in ("legacy", "pipeline"):
+        baseline = run(mode, False, txns)
+        cached = run(mode, True, txns)
+        # bloom filter không có false negative => kết quả phải giống hệt
+        assert baseline["results"] == cached["results"], f"near-cache thay đổi kết quả ({mode})"
+        rows.append((f"{mode}", baseline))
+        rows.append((f"{mode}+cache", cached))
+
+    print(f"{'mode':<16}{'cmd/txn':>10}{'RTT/txn':>10}{'p50 (ms)':>12}{'p99 (ms)':>12}")
+    for name, stats in rows:
+        print(f"{name:<16}{stats['cmd_per_txn']:>10.2f}{stats['rtt_per_txn']:>10.2f}{stats['p50_ms']:>12.3f}{stats['p99_ms']:>12.3f}")
+    print(f"cache counters (pipeline): {rows[-1][1]['counters']}")
+    # check_rules không bao giờ build snapshot (refresh chạy ngoài stage rules)
+    assert all(stats["counters"]["rebuilds"] == 1 for name, stats in rows if stats["counters"]), "snapshot build trong check_rules"
+    check_refresh()
+
+
+def check_refresh() -> None:
+    redis_client, stats = make_redis(rtt_ms=RTT_MS)
+    members = [f"CBLACK{i:09d}" for i in range(BLACKLIST_SIZE)]
+    for start in range(0, len(members), 10000):
+        redis_client.sadd("blacklist:nameOrig", *members[start:start + 10000])
+    cache = BlacklistNearCache(redis_client, refresh_seconds=0)
+    cache.refresh(force=True)
+
+    def timed_refresh():
+        stats.reset()
+        start = time.perf_counter()
+        cache.refresh()
+        return (time.perf_counter() - start) * 1000, stats.round_trips
+
+    # chưa có meta:blacklist:version, blacklist không đổi => chỉ 1 round trip, không build lại
+    unchanged_ms, unchanged_rtt = timed_refresh()
+    assert cache.rebuilds == 1 and unchanged_rtt == 1, cache.counters()
+    # sửa blacklist không qua web_cache (SCARD đổi) => build lại, member mới có trong snapshot
+    redis_client.sadd("blacklist:nameOrig", "CNEW000000001")
+    changed_ms, _ = timed_refresh()
+    assert cache.rebuilds == 2 and cache.might_contain("blacklist:nameOrig", "CNEW000000001")
+    # web_cache tăng version => build lại
+    redis_client.incr("meta:blacklist:version")
+    timed_refresh()
+    assert cache.rebuilds == 3
+    print(f"refresh: unchanged {unchanged_ms:.3f} ms ({unchanged_rtt} RTT), rebuild {changed_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Benchmark circuit breaker khi ElastiCache chậm / mất kết nối (brownout).
+
+Redis giả lập sự cố: mỗi lệnh chờ đúng REDIS_TIMEOUT_MS (như socket_timeout) rồi ném TimeoutError.
+So sánh độ trễ check_rules trong lúc sự cố:
+  - không có breaker: mọi request chờ hết timeout rồi lỗi (=> 500)
+  - có breaker: sau CB_FAILURE_THRESHOLD lỗi thì mạch mở, request được quyết định local (degraded mode)
+và độ chính xác của quyết định degraded (blacklist snapshot + REDIS_FAILURE_POLICY).
+Kiểm tra thêm: RuleSet.current() không chờ timeout khi mạch mở (giữ plan đang chạy), threshold rule trên field
+không bắt buộc (step) không làm hỏng request khi giao dịch thiếu field đó.
+
+Chạy:
+  python benchmarks/bench_circuit_breaker.py
+  REDIS_TIMEOUT_MS=500 NUM_TXNS=200 python benchmarks/bench_circuit_breaker.py
+"""
+import os
+import statistics
+import time
+
+import redis
+
+from local_redis import add_hot_path_to_sys_path, make_redis
+from traffic import PaySimTraffic
+
+add_hot_path_to_sys_path()
+import rules_engine  # noqa: E402
+from blacklist_cache import BlacklistNearCache  # noqa: E402
+from circuit_breaker import CircuitBreaker  # noqa: E402
+from rule_definitions import DEFAULT_RULES, CompiledRules, RuleSet, default_rule_definitions  # noqa: E402
+
+# --- CẤU HÌNH ---
+NUM_TXNS: int = int(os.getenv("NUM_TXNS", "100"))
+REDIS_TIMEOUT_MS: float = float(os.getenv("REDIS_TIMEOUT_MS", "200"))
+BLACKLIST_RATIO: float = float(os.getenv("BLACKLIST_RATIO", "0.1"))
+# --- KẾT THÚC CẤU HÌNH ---
+
+
+class BrownoutPipeline:
+    def __init__(self, timeout_seconds: float) -> None:
+        self.timeout_seconds = timeout_seconds
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        time.sleep(self.timeout_seconds)
+        raise redis.TimeoutError("Timeout reading from socket")
+
+
+class BrownoutRedis:
+    # chỉ cần pipeline(): check_rules ở mode pipeline gửi mọi lệnh qua đây
+    def __init__(self, timeout_seconds: float) -> None:
+        self.timeout_seconds = timeout_seconds
+
+    def pipeline(self, transaction: bool = True) -> BrownoutPipeline:
+        return BrownoutPipeline(self.timeout_seconds)
+
+    def hget(self, name: str, key: str):
+        # RuleSet.current() đọc version rule qua HGET
+        time.sleep(self.timeout_seconds)
+        raise redis.TimeoutError("Timeout reading from socket")
+
+
+def percentile(samples, p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def run(label: str, txns, breaker, blacklist_cache, traffic: PaySimTraffic):
+    faulty = BrownoutRedis(REDIS_TIMEOUT_MS / 1000.0)
+    latencies = []
+    errors = declined = missed_blacklist = 0
+    blacklisted = set(traffic.blacklisted_users()) | set(traffic.blacklisted_devices())
+
+    for txn in txns:
+        started = time.perf_counter()
+        try:
+            result = rules_engine.check_rules(faulty, txn, mode="pipeline", blacklist_cache=blacklist_cache, breaker=breaker)
+            if rules_engine.is_declined(result):
+                declined += 1
+            elif txn["nameOrig"] in blacklisted or txn["nameDest"] in blacklisted:
+                missed_blacklist += 1
+        except RuntimeError:
+            errors += 1
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    print(
+        f"{label:<40} p50={statistics.median(latencies):8.3f} ms  p99={percentile(latencies, 0.99):8.3f} ms  "
+        f"total={sum(latencies) / 1000:6.2f} s  errors={errors:<4} declined={declined:<4} missed_blacklist={missed_blacklist}"
+    )
+    return errors, declined, missed_blacklist
+
+
+def rule_refresh(breaker) -> float:
+    rule_set = RuleSet(BrownoutRedis(REDIS_TIMEOUT_MS / 1000.0), config_path="", refresh_seconds=0, breaker=breaker)
+    started = time.perf_counter()
+    for _ in range(5):
+        assert rule_set.current() is DEFAULT_RULES
+    return (time.perf_counter() - started) * 1000
+
+
+def main() -> None:
+    traffic = PaySimTraffic(blacklist_ratio=BLACKLIST_RATIO, seed=7)
+    txns = [rules_engine.validate_transaction(t) for t in traffic.stream(NUM_TXNS)]
+
+    # snapshot blacklist được build lúc Redis còn khoẻ
+    healthy_client, _ = make_redis()
+    healthy_client.sadd("blacklist:nameOrig", *traffic.blacklisted_users())
+    healthy_client.sadd("blacklist:nameDes", *traffic.blacklisted_devices())
+    snapshot = BlacklistNearCache(healthy_client)
+    snapshot.refresh(force=True)
+
+    print(f"Brownout: every Redis call waits {REDIS_TIMEOUT_MS:.0f} ms then times out, {NUM_TXNS} transactions\n")
+    run("no breaker", txns, None, None, traffic)
+    outcomes = {}
+    for policy in ("fail_closed", "fail_open"):
+        rules_engine.REDIS_FAILURE_POLICY = policy
+        outcomes[policy, False] = run(f"breaker, {policy}, no snapshot", txns, CircuitBreaker("bench"), None, traffic)
+        outcomes[policy, True] = run(f"breaker, {policy}, blacklist snapshot", txns, CircuitBreaker("bench"), snapshot, traffic)
+    rules_engine.REDIS_FAILURE_POLICY = "fail_closed"
+
+    # degraded: rule không đánh giá được là "unknown", không báo là dính blacklist
+    degraded = rules_engine.check_rules(BrownoutRedis(0), txns[0], breaker=CircuitBreaker("bench", failure_threshold=1))
+    assert set(degraded.values()) <= {"unknown", False, True} and degraded["blackUser"] == "unknown", degraded
+    # snapshot quyết định kết quả kể cả khi fail_closed: chỉ giao dịch dính blacklist (hoặc dương tính giả) bị Declined
+    assert outcomes["fail_closed", False][1] > outcomes["fail_closed", True][1], "snapshot không đổi kết quả fail_closed"
+    assert outcomes["fail_closed", True][1:] == outcomes["fail_open", True][1:] and outcomes["fail_closed", True][2] == 0
+
+    # refresh rule đi qua breaker: mạch mở => không HGET, giữ plan đang chạy
+    open_breaker = CircuitBreaker("bench")
+    open_breaker.trip()
+    without_breaker_ms, with_breaker_ms = rule_refresh(None), rule_refresh(open_breaker)
+    print(f"\n5x RuleSet.current() during brownout: no breaker {without_breaker_ms:.1f} ms, open breaker {with_breaker_ms:.1f} ms")
+    assert with_breaker_ms < REDIS_TIMEOUT_MS, "rule refresh waited for the Redis timeout while the breaker was open"
+
+    # threshold rule trên field không bắt buộc: giao dịch thiếu step => rule không khớp, không KeyError
+    rules = CompiledRules(default_rule_definitions() + [{"name": "LateStep", "kind": "threshold", "field": "step", "op": ">", "value": 700}])
+    txn = {k: v for k, v in txns[0].items() if k != "step"}
+    result = rules_engine.check_rules(healthy_client, txn, rules=rules)
+    assert result["LateStep"] is False, result
+
+
+if __name__ == "__main__":
+    main()
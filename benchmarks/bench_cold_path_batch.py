@@ -0,0 +1,85 @@
+"""
+Benchmark Luồng Lạnh: records/second của Lambda_FraudScoring khi gọi SageMaker từng record (SAGEMAKER_BATCH_SIZE=1)
+so với gửi cả batch Kinesis trong 1 (hoặc vài) invoke_endpoint.
+Endpoint giả chạy thật inference.py + ENDPOINT_LATENCY_MS độ trễ mạng / overhead mỗi lần gọi.
+
+Chạy:
+  python benchmarks/bench_cold_path_batch.py
+  ENDPOINT_LATENCY_MS=30 KINESIS_BATCH=500 python benchmarks/bench_cold_path_batch.py
+"""
+import logging
+import os
+import time
+
+from cold_path_stubs import kinesis_event, load_cold_path
+from traffic import PaySimTraffic
+
+# --- CẤU HÌNH ---
+NUM_BATCHES: int = int(os.getenv("NUM_BATCHES", "5"))
+KINESIS_BATCH: int = int(os.getenv("KINESIS_BATCH", "100"))
+ENDPOINT_LATENCY_MS: float = float(os.getenv("ENDPOINT_LATENCY_MS", "15"))
+AWS_LATENCY_MS: float = float(os.getenv("AWS_LATENCY_MS", "0"))
+# --- KẾT THÚC CẤU HÌNH ---
+
+
+def main() -> None:
+    merge, endpoint, table, _ = load_cold_path(ENDPOINT_LATENCY_MS, AWS_LATENCY_MS)
+    logging.getLogger().setLevel(logging.ERROR)
+
+    traffic = PaySimTraffic(seed=11)
+    events = [kinesis_event(list(traffic.stream(KINESIS_BATCH)), i * KINESIS_BATCH) for i in range(NUM_BATCHES)]
+    total = NUM_BATCHES * KINESIS_BATCH
+
+    print(f"batches={NUM_BATCHES}x{KINESIS_BATCH} endpoint_latency={ENDPOINT_LATENCY_MS}ms aws_latency={AWS_LATENCY_MS}ms")
+    print(f"{'SAGEMAKER_BATCH_SIZE':<22}{'records/s':>10}{'invokes':>10}")
+    predictions = {}
+    for batch_size in (1, 25, KINESIS_BATCH):
+        merge.SAGEMAKER_BATCH_SIZE = batch_size
+        endpoint.calls.clear()
+        started = time.perf_counter()
+        for event in events:
+            merge.lambda_handler(event, None)
+        elapsed = time.perf_counter() - started
+        print(f"{batch_size:<22}{total / elapsed:>10.0f}{endpoint.calls['invoke_endpoint']:>10}")
+
+        # kết quả chấm điểm theo batch phải giống hệt từng record
+        transactions = [merge.json.loads(merge.base64.b64decode(r["kinesis"]["data"])) for r in events[0]["Records"]]
+        predictions[batch_size] = merge.get_fraud_predictions(transactions)
+    assert all(p == predictions[1] for p in predictions.values()), "batched predictions differ from per-record predictions"
+
+    # 1 giao dịch hỏng (thiếu type => ModelError) không làm cả chunk bị retry mãi: chỉ nó nhận item -1, không retry
+    transactions = list(traffic.stream(KINESIS_BATCH))
+    poison = KINESIS_BATCH // 3
+    del transactions[poison]["type"]
+    event = kinesis_event(transactions, NUM_BATCHES * KINESIS_BATCH)
+    endpoint.calls.clear()
+    logging.getLogger().setLevel(logging.CRITICAL)  # lỗi endpoint là cố ý
+    merge.write_transaction_results, write_transaction_results = (lambda items, executor=None: (written.extend(items), (set(), set()))[1]), merge.write_transaction_results
+    written = []
+    try:
+        response = merge.lambda_handler(event, None)
+        assert not response["batchItemFailures"], "lỗi do dữ liệu không được retry"
+        errors = [item for item in written if "ai_error" in item]
+        assert len(written) == KINESIS_BATCH and len(errors) == 1 and errors[0]["ai_prediction_label"] == -1
+        print(f"poison record: 1 item -1 (ai_error), {KINESIS_BATCH - 1} scored, {endpoint.calls['invoke_endpoint']} invokes, no retry")
+
+        # payload là JSON hợp lệ nhưng không phải object => bỏ qua như record hỏng, không retry, không làm hỏng cả batch
+        written.clear()
+        event = kinesis_event(list(traffic.stream(KINESIS_BATCH)), 0)
+        event["Records"][poison]["kinesis"]["data"] = merge.base64.b64encode(b'"hello"').decode("ascii")
+        response = merge.lambda_handler(event, None)
+        assert not response["batchItemFailures"] and len(written) == KINESIS_BATCH - 1
+        print(f"non-object payload: skipped, {len(written)} scored, no retry")
+
+        # throttle => retry được: cả chunk báo trong batchItemFailures, không ghi item -1
+        written.clear()
+        endpoint.throttle = 1
+        response = merge.lambda_handler(kinesis_event(list(traffic.stream(KINESIS_BATCH)), 0), None)
+        assert len(response["batchItemFailures"]) == KINESIS_BATCH and not written
+        print(f"throttled chunk: {len(response['batchItemFailures'])} records reported for retry")
+    finally:
+        merge.write_transaction_results = write_transaction_results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark pipeline song song của Lambda_FraudScoring: records/s theo SCORING_CONCURRENCY
+khi DynamoDB put_item / Lambda invoke có độ trễ mạng (AWS_LATENCY_MS), kèm timing theo stage của batch cuối.
+Kiểm tra thứ tự gửi cảnh báo của từng nameOrig giữ đúng thứ tự Kinesis.
+
+Chạy:
+  python benchmarks/bench_cold_path_concurrency.py
+  AWS_LATENCY_MS=20 SAGEMAKER_BATCH_SIZE=25 python benchmarks/bench_cold_path_concurrency.py
+"""
+import logging
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from cold_path_stubs import kinesis_event, load_cold_path
+from traffic import PaySimTraffic
+
+# --- CẤU HÌNH ---
+NUM_BATCHES: int = int(os.getenv("NUM_BATCHES", "3"))
+KINESIS_BATCH: int = int(os.getenv("KINESIS_BATCH", "100"))
+ENDPOINT_LATENCY_MS: float = float(os.getenv("ENDPOINT_LATENCY_MS", "15"))
+AWS_LATENCY_MS: float = float(os.getenv("AWS_LATENCY_MS", "10"))
+SAGEMAKER_BATCH_SIZE: int = int(os.getenv("SAGEMAKER_BATCH_SIZE", "100"))
+NUM_USERS: int = int(os.getenv("NUM_USERS", "1000"))
+ZIPF_S: float = float(os.getenv("ZIPF_S", "1.1"))  # lớn hơn => 1 vài khách hàng chiếm phần lớn batch (lane dài)
+# --- KẾT THÚC CẤU HÌNH ---
+
+
+class StageLogCapture(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__(logging.INFO)
+        self.last = ""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        message = record.getMessage()
+        if message.startswith("Stage timings"):
+            self.last = message
+
+
+def main() -> None:
+    merge, _, dynamodb, _ = load_cold_path(ENDPOINT_LATENCY_MS, AWS_LATENCY_MS)
+    merge.SAGEMAKER_BATCH_SIZE = SAGEMAKER_BATCH_SIZE
+    # cold_path_stubs đặt METRICS_ENABLED=false: bật lại stage timer, dòng EMF vẫn tắt
+    merge.stage_timer.enabled = True
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.handlers = []
+    capture = StageLogCapture()
+    root.addHandler(capture)
+
+    # ghi lại thứ tự cảnh báo gửi Lambda Alert để kiểm tra thứ tự theo nameOrig
+    alerted = []
+    original_invoke = merge.trigger_alerts
+
+    def trigger_alerts(alerts):
+        alerted.extend((alert["nameOrig"], int(alert["step"])) for alert in alerts)
+        return original_invoke(alerts)
+
+    merge.trigger_alerts = trigger_alerts
+
+    traffic = PaySimTraffic(num_users=NUM_USERS, zipf_s=ZIPF_S, seed=3)
+    transactions = []
+    for i, txn in enumerate(traffic.stream(NUM_BATCHES * KINESIS_BATCH)):
+        transactions.append(dict(txn, step=i))  # step tăng dần = thứ tự Kinesis
+    events = [kinesis_event(transactions[i:i + KINESIS_BATCH], i) for i in range(0, len(transactions), KINESIS_BATCH)]
+    users = {txn["nameOrig"] for txn in transactions}
+
+    print(f"batches={NUM_BATCHES}x{KINESIS_BATCH} endpoint_latency={ENDPOINT_LATENCY_MS}ms aws_latency={AWS_LATENCY_MS}ms "
+          f"sagemaker_batch={SAGEMAKER_BATCH_SIZE} users={len(users)}")
+    for concurrency in (1, 4, 8, 16):
+        merge.SCORING_CONCURRENCY = concurrency
+        merge.executor = ThreadPoolExecutor(max_workers=concurrency) if concurrency > 1 else None
+        alerted.clear()
+        merge.alert_coalescer = merge.AlertCoalescer()
+        started = time.perf_counter()
+        for event in events:
+            merge.lambda_handler(event, None)
+        elapsed = time.perf_counter() - started
+        print(f"concurrency={concurrency:<3} {len(transactions) / elapsed:8.0f} records/s  alerts={len(alerted):<4} {capture.last}")
+
+        actual = defaultdict(list)
+        for name_orig, step in alerted:
+            actual[name_orig].append(step)
+        assert all(steps == sorted(steps) for steps in actual.values()), "per-nameOrig alert order changed"
+
+
+if __name__ == "__main__":
+    main()
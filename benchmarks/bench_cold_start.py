@@ -0,0 +1,85 @@
+"""
+Đo thời gian import + khởi tạo module handler của Lambda_ProcessTransaction (cold start),
+mỗi lần chạy trong 1 process Python mới để không dính cache import.
+Giả lập môi trường Lambda (AWS_LAMBDA_FUNCTION_NAME) để đi đúng đường import production.
+
+Chạy:
+  python benchmarks/bench_cold_start.py
+  RUNS=20 MAX_IMPORT_MS=300 python benchmarks/bench_cold_start.py   # exit 1 nếu median vượt ngưỡng
+  SHOW_IMPORTTIME=1 python benchmarks/bench_cold_start.py           # top module import chậm nhất
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from local_redis import HOT_PATH_DIR
+
+# --- CẤU HÌNH ---
+RUNS: int = int(os.getenv("RUNS", "10"))
+MAX_IMPORT_MS: float = float(os.getenv("MAX_IMPORT_MS", "0"))  # 0 = không kiểm tra ngưỡng
+SHOW_IMPORTTIME: bool = os.getenv("SHOW_IMPORTTIME", "0") == "1"
+# --- KẾT THÚC CẤU HÌNH ---
+
+CHILD_CODE = """
+import json, sys, time
+start = time.perf_counter()
+import lambda_function
+elapsed_ms = (time.perf_counter() - start) * 1000
+heavy = [m for m in ("boto3", "botocore", "dotenv") if m in sys.modules]
+print(json.dumps({"import_ms": elapsed_ms, "loaded": heavy}))
+"""
+
+
+def child_env():
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    env.update({
+        "AWS_LAMBDA_FUNCTION_NAME": "Lambda_ProcessTransaction",
+        "AWS_REGION": env.get("AWS_REGION", "us-east-1"),
+    })
+    return env
+
+
+def run_once():
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD_CODE],
+        cwd=HOT_PATH_DIR, env=child_env(), capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def show_importtime() -> None:
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import lambda_function"],
+        cwd=HOT_PATH_DIR, env=child_env(), capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in out.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].rstrip()))
+    print("Top 15 cumulative import time (us):")
+    for cumulative, name in sorted(rows, reverse=True)[:15]:
+        print(f"  {cumulative:>10} {name}")
+
+
+def main() -> None:
+    run_once()  # warm-up: ghi bytecode cache (.pyc) giống package đã deploy
+    samples = [run_once() for _ in range(RUNS)]
+    times = [s["import_ms"] for s in samples]
+    median = statistics.median(times)
+
+    print(f"runs={RUNS} import+init lambda_function: median={median:.1f} ms  min={min(times):.1f} ms  max={max(times):.1f} ms")
+    print(f"heavy modules loaded at import: {samples[-1]['loaded'] or 'none'}")
+    if SHOW_IMPORTTIME:
+        show_importtime()
+
+    if MAX_IMPORT_MS and median > MAX_IMPORT_MS:
+        print(f"FAIL: median {median:.1f} ms > MAX_IMPORT_MS {MAX_IMPORT_MS} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark ghi kết quả Luồng Lạnh vào DynamoDB:
+  legacy : json.dumps + json.loads(parse_float=Decimal) rồi put_item từng item (bản cũ)
+  batch  : to_dynamodb (float -> Decimal trực tiếp) + BatchWriteItem 25 item / request, retry UnprocessedItems
+In items/s (có độ trễ mạng AWS_LATENCY_MS / request) và CPU (µs) / item cho riêng phần chuyển đổi Decimal.
+
+Chạy:
+  python benchmarks/bench_dynamo_writer.py
+  UNPROCESSED_RATIO=0.2 AWS_LATENCY_MS=8 python benchmarks/bench_dynamo_writer.py
+"""
+import json
+import logging
+import os
+import time
+import uuid
+from decimal import Decimal
+
+from cold_path_stubs import load_cold_path
+from traffic import PaySimTraffic
+
+# --- CẤU HÌNH ---
+NUM_ITEMS: int = int(os.getenv("NUM_ITEMS", "500"))
+AWS_LATENCY_MS: float = float(os.getenv("AWS_LATENCY_MS", "5"))
+UNPROCESSED_RATIO: float = float(os.getenv("UNPROCESSED_RATIO", "0.1"))
+CONVERT_ROUNDS: int = int(os.getenv("CONVERT_ROUNDS", "20"))
+# --- KẾT THÚC CẤU HÌNH ---
+
+DYNAMODB_CHUNK: int = 25
+
+
+def make_items(n: int):
+    traffic = PaySimTraffic(seed=5)
+    items = []
+    for txn in traffic.stream(n):
+        item = dict(txn, transactionId=str(uuid.uuid4()), ai_prediction_label=0, ai_probability=0.0123456789,
+                    cold_path_processed_utc="2025-11-01T00:00:00")
+        items.append(item)
+    return items
+
+
+def legacy_convert(item):
+    return json.loads(json.dumps(item), parse_float=Decimal)
+
+
+def cpu_us_per_item(convert, items) -> float:
+    started = time.process_time()
+    for _ in range(CONVERT_ROUNDS):
+        for item in items:
+            convert(item)
+    return (time.process_time() - started) / (CONVERT_ROUNDS * len(items)) * 1e6
+
+
+def main() -> None:
+    merge, _, dynamodb, _ = load_cold_path(aws_latency_ms=AWS_LATENCY_MS, unprocessed_ratio=UNPROCESSED_RATIO)
+    logging.getLogger().setLevel(logging.CRITICAL)
+    merge.DYNAMODB_BACKOFF_SECONDS = 0.005
+    items = make_items(NUM_ITEMS)
+
+    # cùng giá trị Decimal với cách chuyển cũ
+    assert all(merge.to_dynamodb(item) == legacy_convert(item) for item in items), "Decimal conversion differs from legacy"
+
+    print(f"items={NUM_ITEMS} aws_latency={AWS_LATENCY_MS}ms unprocessed_ratio={UNPROCESSED_RATIO}")
+    print(f"{'writer':<18}{'items/s':>10}{'requests':>10}{'cpu us/item':>13}")
+
+    # legacy: 1 put_item / item
+    table = dynamodb.table
+    table.calls.clear()
+    started = time.perf_counter()
+    for item in items:
+        table.put_item(Item=legacy_convert(item))
+    elapsed = time.perf_counter() - started
+    print(f"{'legacy put_item':<18}{NUM_ITEMS / elapsed:>10.0f}{table.calls['put_item']:>10}{cpu_us_per_item(legacy_convert, items):>13.2f}")
+
+    for label, executor in (("batch", None), ("batch+threads", merge.executor)):
+        dynamodb.calls.clear()
+        dynamodb.items.clear()
+        started = time.perf_counter()
+        failed, rejected = merge.write_transaction_results(items, executor)
+        elapsed = time.perf_counter() - started
+        assert not failed and not rejected and len(dynamodb.items) == NUM_ITEMS, "items lost after retries"
+        print(f"{label:<18}{NUM_ITEMS / elapsed:>10.0f}{dynamodb.calls['batch_write_item']:>10}{cpu_us_per_item(merge.to_dynamodb, items):>13.2f}")
+
+    # ValidationException (item hỏng) không retry: chỉ item đó bị từ chối, các item cùng chunk vẫn được ghi
+    dynamodb.calls.clear()
+    dynamodb.items.clear()
+    invalid = items[:DYNAMODB_CHUNK]
+    invalid[3] = dict(invalid[3], transactionId="")
+    failed, rejected = merge.write_transaction_results(invalid)
+    assert not failed and rejected == {""} and len(dynamodb.items) == len(invalid) - 1, (failed, rejected)
+    print(f"ValidationException: 1 item rejected, {len(dynamodb.items)} written, {dynamodb.calls['batch_write_item']} requests, no retry")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+So sánh 2 chế độ chấm điểm của Lambda_FraudScoring (SCORING_MODE):
+  endpoint : invoke_endpoint (endpoint giả chạy inference.py + ENDPOINT_LATENCY_MS độ trễ mạng / overhead)
+  embedded : chấm điểm trong Lambda (embedded_model.py) bằng cùng artifact
+1. Parity: kết quả 2 chế độ phải giống hệt nhau trên traffic PaySim.
+2. Latency theo kích thước batch + thời gian load model lần đầu (cold start).
+3. Ước tính chi phí / tháng theo giá cấu hình được (endpoint chạy 24/7 vs thêm GB-s cho Lambda).
+
+Chạy:
+  python benchmarks/bench_embedded_scoring.py
+  RECORDS_PER_DAY=5000000 LAMBDA_MEMORY_MB=2048 python benchmarks/bench_embedded_scoring.py
+"""
+import logging
+import os
+import statistics
+import sys
+import time
+import warnings
+
+from cold_path_stubs import COLD_PATH_DIR, load_cold_path
+from traffic import PaySimTraffic
+
+# --- CẤU HÌNH ---
+NUM_TXNS: int = int(os.getenv("NUM_TXNS", "2000"))
+ENDPOINT_LATENCY_MS: float = float(os.getenv("ENDPOINT_LATENCY_MS", "15"))
+ROUNDS: int = int(os.getenv("ROUNDS", "20"))
+RECORDS_PER_DAY: int = int(os.getenv("RECORDS_PER_DAY", "1000000"))
+KINESIS_BATCH: int = int(os.getenv("KINESIS_BATCH", "100"))
+ENDPOINT_PRICE_PER_HOUR: float = float(os.getenv("ENDPOINT_PRICE_PER_HOUR", "0.056"))  # ml.t2.medium
+LAMBDA_PRICE_PER_GB_SECOND: float = float(os.getenv("LAMBDA_PRICE_PER_GB_SECOND", "0.0000166667"))
+LAMBDA_MEMORY_MB: int = int(os.getenv("LAMBDA_MEMORY_MB", "1024"))  # embedded cần RAM cho xgboost
+# --- KẾT THÚC CẤU HÌNH ---
+
+
+def median_ms(fn, rounds: int = ROUNDS) -> float:
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main() -> None:
+    warnings.simplefilter("ignore")
+    # cold start của chế độ embedded: import xgboost + load artifact (trước khi endpoint giả import inference.py)
+    sys.path.insert(0, COLD_PATH_DIR)
+    import embedded_model
+    started = time.perf_counter()
+    embedded_model.load_artifacts()
+    load_ms = (time.perf_counter() - started) * 1000
+
+    merge, _, _, _ = load_cold_path(ENDPOINT_LATENCY_MS)
+    logging.getLogger().setLevel(logging.ERROR)
+    transactions = list(PaySimTraffic(seed=19).stream(NUM_TXNS))
+
+    # 1. parity
+    merge.SAGEMAKER_BATCH_SIZE = 500
+    merge.SCORING_MODE = "endpoint"
+    endpoint_results = merge.get_fraud_predictions(transactions)
+    merge.SCORING_MODE = "embedded"
+    embedded_results = merge.get_fraud_predictions(transactions)
+    # model_version của endpoint kèm ngưỡng của endpoint, embedded chỉ là hash artifact => so nhãn + probability
+    assert [(r["prediction"], r["probability"]) for r in embedded_results] == \
+        [(r["prediction"], r["probability"]) for r in endpoint_results], "embedded scoring differs from endpoint scoring"
+    frauds = sum(r["prediction"] for r in embedded_results)
+    print(f"parity: {NUM_TXNS} transactions identical (predicted fraud: {frauds})")
+    print(f"embedded cold start (import + load artifacts): {load_ms:.1f} ms\n")
+
+    # 2. latency theo batch
+    print(f"{'batch':>6}{'endpoint ms':>14}{'embedded ms':>14}")
+    embedded_batch_ms = 0.0
+    for size in (1, 10, KINESIS_BATCH, 500):
+        batch = transactions[:size]
+        merge.SCORING_MODE = "endpoint"
+        endpoint_ms = median_ms(lambda: merge.get_fraud_predictions(batch))
+        merge.SCORING_MODE = "embedded"
+        embedded_ms = median_ms(lambda: merge.get_fraud_predictions(batch))
+        if size == KINESIS_BATCH:
+            embedded_batch_ms = embedded_ms
+        print(f"{size:>6}{endpoint_ms:>14.2f}{embedded_ms:>14.2f}")
+
+    # 3. chi phí / tháng
+    batches_per_month = RECORDS_PER_DAY * 30 / KINESIS_BATCH
+    endpoint_cost = ENDPOINT_PRICE_PER_HOUR * 24 * 30
+    embedded_cost = batches_per_month * (embedded_batch_ms / 1000) * (LAMBDA_MEMORY_MB / 1024) * LAMBDA_PRICE_PER_GB_SECOND
+    print(f"\nmonthly cost @ {RECORDS_PER_DAY} records/day, batch {KINESIS_BATCH}:")
+    print(f"  endpoint, 1 instance 24/7 @ ${ENDPOINT_PRICE_PER_HOUR}/h : ${endpoint_cost:.2f}")
+    print(f"  embedded, scoring GB-s @ {LAMBDA_MEMORY_MB} MB Lambda   : ${embedded_cost:.2f}")
+
+
+if __name__ == "__main__":
+    main()
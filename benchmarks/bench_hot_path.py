@@ -0,0 +1,131 @@
+"""
+Benchmark end-to-end Luồng Nóng chạy offline: gọi lambda_handler in-process với
+Redis local (fakeredis hoặc BENCH_REDIS_URL) và Kinesis / S3 giả, replay traffic dạng PaySim.
+In throughput và p50 / p95 / p99 cho từng stage: parse, validate, rules (Redis), kinesis, s3.
+
+Chạy:
+  python benchmarks/bench_hot_path.py
+  NUM_TXNS=20000 BLACKLIST_RATIO=0.05 ZIPF_S=1.2 python benchmarks/bench_hot_path.py
+  BATCH_SIZE=100 python benchmarks/bench_hot_path.py            # đi qua batch endpoint
+  BLACKLIST_CACHE_ENABLED=true python benchmarks/bench_hot_path.py
+"""
+import contextlib
+import functools
+import io
+import json
+import os
+import statistics
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+from hot_path_stubs import load_hot_path
+from traffic import PaySimTraffic
+
+# --- CẤU HÌNH ---
+NUM_TXNS: int = int(os.getenv("NUM_TXNS", "5000"))
+BATCH_SIZE: int = int(os.getenv("BATCH_SIZE", "1"))  # 1 = mỗi request 1 giao dịch
+NUM_USERS: int = int(os.getenv("NUM_USERS", "100000"))
+ZIPF_S: float = float(os.getenv("ZIPF_S", "1.0"))
+BLACKLIST_RATIO: float = float(os.getenv("BLACKLIST_RATIO", "0.01"))
+BLACKLIST_SIZE: int = int(os.getenv("BLACKLIST_SIZE", "10000"))
+RTT_MS: float = float(os.getenv("RTT_MS", "0.5"))
+AWS_LATENCY_MS: float = float(os.getenv("AWS_LATENCY_MS", "5"))
+# --- KẾT THÚC CẤU HÌNH ---
+
+# stage -> tên hàm trong namespace lambda_function cần đo
+STAGES: Dict[str, List[str]] = {
+    "parse": ["decode_body"],
+    "validate": ["validate_transaction"],
+    "rules": ["check_rules", "check_rules_batch"],
+    "kinesis": ["publish_transaction", "buffer_transaction", "flush_transactions"],
+    "s3": ["save_to_s3", "flush_violations"],
+}
+
+
+class StageTimer:
+    def __init__(self) -> None:
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.current: Dict[str, float] = defaultdict(float)
+
+    def wrap(self, stage: str, fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.current[stage] += (time.perf_counter() - start) * 1000
+
+        return timed
+
+    def end_request(self, total_ms: float) -> None:
+        self.samples["total"].append(total_ms)
+        for stage, elapsed in self.current.items():
+            self.samples[stage].append(elapsed)
+        self.current.clear()
+
+
+def percentile(values: List[float], p: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100)[p - 1]
+
+
+def main() -> None:
+    lambda_function, redis_client, redis_stats, kinesis_stub, s3_stub = load_hot_path(RTT_MS, AWS_LATENCY_MS)
+    traffic = PaySimTraffic(NUM_USERS, ZIPF_S, BLACKLIST_RATIO, BLACKLIST_SIZE)
+
+    users, devices = traffic.blacklisted_users(), traffic.blacklisted_devices()
+    for start in range(0, BLACKLIST_SIZE, 5000):
+        redis_client.sadd("blacklist:nameOrig", *users[start:start + 5000])
+        redis_client.sadd("blacklist:nameDes", *devices[start:start + 5000])
+
+    timer = StageTimer()
+    for stage, names in STAGES.items():
+        for name in names:
+            setattr(lambda_function, name, timer.wrap(stage, getattr(lambda_function, name)))
+
+    txns = list(traffic.stream(NUM_TXNS))
+    # warm-up: health check, near-cache snapshot, kết nối Redis
+    with contextlib.redirect_stdout(io.StringIO()):
+        lambda_function.lambda_handler({"body": json.dumps(txns[0])})
+    timer.samples.clear()
+    timer.current.clear()
+    redis_stats.reset()
+    kinesis_stub.calls.clear()
+    s3_stub.calls.clear()
+
+    statuses: Dict[str, int] = defaultdict(int)
+    start_all = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for offset in range(0, NUM_TXNS, BATCH_SIZE):
+            chunk = txns[offset:offset + BATCH_SIZE]
+            event = {"body": json.dumps(chunk if BATCH_SIZE > 1 else chunk[0])}
+            start = time.perf_counter()
+            response = lambda_function.lambda_handler(event)
+            timer.end_request((time.perf_counter() - start) * 1000)
+            if BATCH_SIZE > 1 and response["statusCode"] == 200:
+                for result in json.loads(response["body"])["results"]:
+                    statuses[result["status"]] += 1
+            else:
+                statuses[response["status"]] += 1
+    elapsed = time.perf_counter() - start_all
+
+    requests = len(timer.samples["total"])
+    print(f"txns={NUM_TXNS} batch_size={BATCH_SIZE} users={NUM_USERS} zipf_s={ZIPF_S} "
+          f"blacklist_ratio={BLACKLIST_RATIO} redis_rtt={RTT_MS}ms aws_latency={AWS_LATENCY_MS}ms "
+          f"({'BENCH_REDIS_URL' if os.getenv('BENCH_REDIS_URL') else 'fakeredis'})")
+    print(f"throughput: {NUM_TXNS / elapsed:.0f} txn/s  decisions: {dict(statuses)}")
+    print(f"redis: {redis_stats.commands / NUM_TXNS:.2f} cmd/txn, {redis_stats.round_trips / NUM_TXNS:.2f} RTT/txn  "
+          f"kinesis calls: {dict(kinesis_stub.calls)}  s3 calls: {dict(s3_stub.calls)}")
+    print(f"per-request latency (ms) over {requests} requests:")
+    print(f"  {'stage':<10}{'calls':>8}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for stage in ["parse", "validate", "rules", "kinesis", "s3", "total"]:
+        values = timer.samples.get(stage, [])
+        if values:
+            print(f"  {stage:<10}{len(values):>8}{percentile(values, 50):>10.3f}{percentile(values, 95):>10.3f}{percentile(values, 99):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
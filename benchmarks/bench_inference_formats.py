@@ -0,0 +1,122 @@
+"""
+Benchmark định dạng request / response của inference.py (Content-Type / Accept):
+  application/json (array) | application/jsonlines | text/csv | application/x-npy (float64 / float32)
+Với mỗi kích thước batch: số byte request + response, thời gian client encode, input_fn decode,
+output_fn encode và client decode response (predict_fn giống nhau nên không tính).
+Parity: mọi định dạng phải cho cùng prediction / probability với JSON (npy float32 làm tròn số tiền nên chỉ báo số dòng lệch),
+kèm Lambda_FraudScoring gửi qua endpoint giả với từng SAGEMAKER_CONTENT_TYPE.
+
+Chạy:
+  python benchmarks/bench_inference_formats.py
+  BATCH_SIZES=100,5000 ROUNDS=50 python benchmarks/bench_inference_formats.py
+"""
+import io
+import json
+import logging
+import os
+import statistics
+import time
+import warnings
+
+import numpy as np
+
+from cold_path_stubs import load_cold_path
+from traffic import PaySimTraffic
+
+# --- CẤU HÌNH ---
+ROUNDS: int = int(os.getenv("ROUNDS", "20"))
+BATCH_SIZES: str = os.getenv("BATCH_SIZES", "100,1000,5000")
+# --- KẾT THÚC CẤU HÌNH ---
+
+
+def median_ms(fn, rounds: int = ROUNDS) -> float:
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main() -> None:
+    warnings.simplefilter("ignore")
+    merge, endpoint, _, _ = load_cold_path()
+    logging.getLogger().setLevel(logging.ERROR)
+    inference = endpoint.inference
+    model = inference.model_fn(None)
+    columns = inference.INPUT_COLUMNS
+
+    def npy_request(records, dtype):
+        matrix = np.array(
+            [[inference.TRANSACTION_TYPES.index(r[c]) if c == "type" else r[c] for c in columns] for r in records],
+            dtype=dtype,
+        )
+        buffer = io.BytesIO()
+        np.save(buffer, matrix, allow_pickle=False)
+        return buffer.getvalue()
+
+    def npy_response(body):
+        return [{"prediction": int(label), "probability": float(prob)} for label, prob in np.load(io.BytesIO(body)).tolist()]
+
+    # (tên, Content-Type / Accept, client encode request, client decode response)
+    formats = [
+        ("json", "application/json", lambda records: json.dumps(records).encode("utf-8"), lambda body: json.loads(body)),
+        ("jsonlines", "application/jsonlines",
+         lambda records: merge.encode_chunk(records, "application/jsonlines").encode("utf-8"),
+         lambda body: merge.decode_results(body.decode("utf-8"), "application/jsonlines")),
+        ("csv", "text/csv",
+         lambda records: merge.encode_chunk(records, "text/csv").encode("utf-8"),
+         lambda body: merge.decode_results(body.decode("utf-8"), "text/csv")),
+        ("npy float64", "application/x-npy", lambda records: npy_request(records, np.float64), npy_response),
+        ("npy float32", "application/x-npy", lambda records: npy_request(records, np.float32), npy_response),
+    ]
+
+    sizes = [int(size) for size in BATCH_SIZES.split(",")]
+    transactions = list(PaySimTraffic(seed=25).stream(max(sizes)))
+
+    print(f"{'batch':>6} {'format':<13}{'req KB':>9}{'resp KB':>9}{'encode ms':>11}{'input_fn ms':>13}{'output_fn ms':>14}{'decode ms':>11}  parity")
+    for size in sizes:
+        records = transactions[:size]
+        expected = [(p["prediction"], p["probability"]) for p in inference.predict_fn(records, model)]
+        for name, content_type, encode, decode in formats:
+            request = encode(records)
+            data = inference.input_fn(request, content_type)
+            prediction = inference.predict_fn(data, model)
+            response = inference.output_fn(prediction, content_type)
+            response = response.encode("utf-8") if isinstance(response, str) else response
+            actual = [(p["prediction"], p["probability"]) for p in decode(response)]
+            mismatches = sum(a != e for a, e in zip(actual, expected))
+            assert len(actual) == size
+            if name != "npy float32":
+                assert mismatches == 0, f"{name}: {mismatches} dòng khác JSON"
+
+            encode_ms = median_ms(lambda: encode(records))
+            input_ms = median_ms(lambda: inference.input_fn(request, content_type))
+            output_ms = median_ms(lambda: inference.output_fn(prediction, content_type))
+            decode_ms = median_ms(lambda: decode(response))
+            parity = "OK" if not mismatches else f"{mismatches} lệch"
+            print(f"{size:>6} {name:<13}{len(request) / 1024:>9.1f}{len(response) / 1024:>9.1f}"
+                  f"{encode_ms:>11.2f}{input_ms:>13.2f}{output_ms:>14.2f}{decode_ms:>11.2f}  {parity}")
+
+    # Lambda_FraudScoring qua endpoint giả với từng SAGEMAKER_CONTENT_TYPE
+    merge.SAGEMAKER_BATCH_SIZE = 500
+    results = {}
+    for content_type in ("application/json", "application/jsonlines", "text/csv"):
+        merge.SAGEMAKER_CONTENT_TYPE = content_type
+        results[content_type] = merge.get_fraud_predictions(transactions[:1000])
+        assert "error_message" not in results[content_type][0], results[content_type][0]
+    assert all(r == results["application/json"] for r in results.values()), "SAGEMAKER_CONTENT_TYPE đổi kết quả chấm điểm"
+    print(f"\nLambda_FraudScoring parity OK: {', '.join(results)}")
+
+    # step là field tuỳ chọn của Luồng Nóng: thiếu step / ô trống ở cột đầu không được làm hỏng cả chunk CSV
+    missing_step = [{k: v for k, v in txn.items() if k != "step"} for txn in transactions[:100]]
+    for content_type in ("application/json", "text/csv"):
+        merge.SAGEMAKER_CONTENT_TYPE = content_type
+        results[content_type] = merge.get_fraud_predictions(missing_step)
+        assert "error_message" not in results[content_type][0], results[content_type][0]
+    assert results["text/csv"] == results["application/json"], "thiếu step: CSV khác JSON"
+    print("thiếu step: CSV == JSON OK")
+
+
+if __name__ == "__main__":
+    main()
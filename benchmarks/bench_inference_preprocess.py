@@ -0,0 +1,107 @@
+"""
+Benchmark preprocess của inference.py (endpoint SageMaker) và embedded_model.py (SCORING_MODE=embedded):
+  pandas : DataFrame + Categorical + get_dummies + reorder cột + scaler.transform (cách cũ, preprocess)
+  numpy  : map dict thẳng vào mảng NumPy dựng sẵn theo feature_columns + scale tại chỗ (preprocess_records)
+1. Parity: preprocess_records của cả inference.py và embedded_model.py phải giống hệt preprocess (pandas) của inference.py
+   (1 giao dịch, batch, 'type' lạ, giá trị None), cả xác suất của model.
+2. Latency preprocess theo kích thước batch + end-to-end input_fn / predict_fn / output_fn cho 1 giao dịch.
+
+Chạy:
+  python benchmarks/bench_inference_preprocess.py
+  ROUNDS=500 python benchmarks/bench_inference_preprocess.py
+"""
+import json
+import os
+import statistics
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from cold_path_stubs import COLD_PATH_DIR, load_inference
+from traffic import PaySimTraffic
+
+# --- CẤU HÌNH ---
+ROUNDS: int = int(os.getenv("ROUNDS", "200"))
+BATCH_SIZES: str = os.getenv("BATCH_SIZES", "1,10,100,500")
+# --- KẾT THÚC CẤU HÌNH ---
+
+
+def median_us(fn, rounds: int = ROUNDS) -> float:
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1e6)
+    return statistics.median(samples)
+
+
+def assert_parity(inference, module, transactions) -> None:
+    # embedded_model không có bản pandas: so cả 2 module với inference.preprocess (cách cũ của endpoint)
+    expected = inference.preprocess(pd.DataFrame(transactions))
+    actual = module.preprocess_records(transactions)
+    assert actual.shape == expected.shape, f"shape {actual.shape} != {expected.shape}"
+    assert np.array_equal(actual, expected, equal_nan=True), f"{module.__name__}.preprocess_records khác preprocess (pandas)"
+
+
+def main() -> None:
+    warnings.simplefilter("ignore")
+    inference = load_inference()
+    sys.path.insert(0, COLD_PATH_DIR)
+    import embedded_model
+    embedded_model.load_artifacts()
+
+    transactions = list(PaySimTraffic(seed=23).stream(max(int(size) for size in BATCH_SIZES.split(","))))
+    edge_cases = [
+        dict(transactions[0], type="REFUND"),       # type không có lúc train => mọi cột type_* = 0
+        dict(transactions[1], oldbalanceDest=None),  # None => NaN (XGBoost coi là missing)
+        dict(transactions[2], type="CASH_IN"),       # category bị drop_first
+    ]
+
+    # 1. parity: từng giao dịch, cả batch, edge case
+    for module in (inference, embedded_model):
+        for txn in transactions[:50] + edge_cases:
+            assert_parity(inference, module, [txn])
+        assert_parity(inference, module, transactions)
+        assert_parity(inference, module, transactions + edge_cases)
+    model = inference.model_fn(None)
+    expected_prob = model.predict_proba(inference.preprocess(pd.DataFrame(transactions)))[:, 1]
+    assert [p["probability"] for p in inference.predict_fn(transactions, model)] == expected_prob.tolist()
+    assert [p["probability"] for p in embedded_model.predict_batch(transactions)] == expected_prob.tolist()
+    single = inference.predict_fn(transactions[0], model)
+    assert single == inference.predict_fn([transactions[0]], model)[0], "1 giao dịch và batch 1 phần tử phải giống nhau"
+    print(f"parity OK: {len(transactions)} giao dịch + {len(edge_cases)} edge case, inference.py + embedded_model.py")
+
+    # 2. latency preprocess theo kích thước batch
+    print(f"{'batch':>6}{'pandas µs':>12}{'numpy µs':>11}{'speedup':>9}")
+    for size in (int(size) for size in BATCH_SIZES.split(",")):
+        batch = transactions[:size]
+        pandas_us = median_us(lambda: inference.preprocess(pd.DataFrame(batch)))
+        numpy_us = median_us(lambda: inference.preprocess_records(batch))
+        print(f"{size:>6}{pandas_us:>12.1f}{numpy_us:>11.1f}{pandas_us / numpy_us:>8.1f}x")
+
+    # end-to-end 1 request 1 giao dịch (đường phổ biến nhất của endpoint)
+    body = json.dumps(transactions[0])
+
+    def legacy_request():
+        X = inference.preprocess(pd.DataFrame([json.loads(body)]))
+        y_pred = model.predict(X)
+        y_prob = model.predict_proba(X)[:, 1]
+        return inference.output_fn(
+            {"prediction": int(y_pred[0]), "probability": float(y_prob[0]), "model_version": inference.MODEL_VERSION},
+            "application/json",
+        )
+
+    def request():
+        return inference.output_fn(inference.predict_fn(inference.input_fn(body, "application/json"), model), "application/json")
+
+    assert legacy_request() == request()
+    legacy_us = median_us(legacy_request)
+    request_us = median_us(request)
+    print(f"1 request / 1 giao dịch: pandas {legacy_us:.1f} µs -> numpy {request_us:.1f} µs ({legacy_us / request_us:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark predict_fn của inference.py (và embedded_model.predict_batch):
+  2 pass : model.predict(X) + model.predict_proba(X) (cách cũ, booster chạy 2 lần, nhãn cố định ở 0.5)
+  1 pass : model.predict_proba(X), nhãn = probability > FRAUD_THRESHOLD / FRAUD_THRESHOLDS_BY_TYPE
+1. Parity: ngưỡng mặc định 0.5 cho đúng nhãn + probability của model.predict / predict_proba, kèm model_version.
+2. Latency predict theo kích thước batch (chỉ phần model, preprocess giống nhau).
+3. Số giao dịch bị gắn nhãn gian lận theo ngưỡng (toàn cục và theo type), không cần deploy lại model.
+
+Chạy:
+  python benchmarks/bench_inference_threshold.py
+  ROUNDS=200 BATCH_SIZES=1,100,1000 python benchmarks/bench_inference_threshold.py
+"""
+import os
+import statistics
+import sys
+import time
+import warnings
+from collections import Counter
+
+from cold_path_stubs import COLD_PATH_DIR, load_inference
+from traffic import PaySimTraffic
+
+# --- CẤU HÌNH ---
+ROUNDS: int = int(os.getenv("ROUNDS", "100"))
+BATCH_SIZES: str = os.getenv("BATCH_SIZES", "1,10,100,1000")
+NUM_TXNS: int = int(os.getenv("NUM_TXNS", "5000"))
+# --- KẾT THÚC CẤU HÌNH ---
+
+
+def median_us(fn, rounds: int = ROUNDS) -> float:
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1e6)
+    return statistics.median(samples)
+
+
+def main() -> None:
+    warnings.simplefilter("ignore")
+    inference = load_inference()
+    sys.path.insert(0, COLD_PATH_DIR)
+    import embedded_model
+
+    model = inference.model_fn(None)
+    transactions = list(PaySimTraffic(seed=24).stream(NUM_TXNS))
+    # vài giao dịch số dư bị rút sạch => probability cao, có nhãn 1 để so sánh
+    for i in range(0, NUM_TXNS, 50):
+        txn = transactions[i]
+        transactions[i] = dict(txn, type="TRANSFER", oldbalanceOrg=txn["amount"], newbalanceOrig=0.0)
+
+    # 1. parity với model.predict (ngưỡng 0.5)
+    X = inference.preprocess_records(transactions)
+    expected = [
+        {"prediction": int(label), "probability": float(prob), "model_version": inference.MODEL_VERSION}
+        for label, prob in zip(model.predict(X), model.predict_proba(X)[:, 1])
+    ]
+    assert inference.FRAUD_THRESHOLD == 0.5 and not inference.FRAUD_THRESHOLDS_BY_TYPE
+    assert inference.predict_fn(transactions, model) == expected, "nhãn 1 pass khác model.predict"
+    embedded = embedded_model.predict_batch(transactions)
+    assert [(r["prediction"], r["probability"]) for r in embedded] == [(r["prediction"], r["probability"]) for r in expected]
+    assert embedded[0]["model_version"] == inference.artifact_version(inference.MODEL_DIR), "endpoint và embedded cùng artifact phải cùng hash artifact"
+    flagged = sum(r["prediction"] for r in expected)
+    print(f"parity OK: {NUM_TXNS} giao dịch, {flagged} nhãn gian lận, model_version={inference.MODEL_VERSION}")
+
+    # 2. latency phần model theo kích thước batch
+    print(f"{'batch':>6}{'2 pass µs':>12}{'1 pass µs':>12}{'speedup':>9}")
+    for size in (int(size) for size in BATCH_SIZES.split(",")):
+        X_batch = X[:size]
+        batch = transactions[:size]
+
+        def two_pass():
+            return model.predict(X_batch), model.predict_proba(X_batch)[:, 1]
+
+        def one_pass():
+            y_prob = model.predict_proba(X_batch)[:, 1]
+            return y_prob > inference.fraud_thresholds(batch), y_prob
+
+        two_us = median_us(two_pass)
+        one_us = median_us(one_pass)
+        print(f"{size:>6}{two_us:>12.1f}{one_us:>12.1f}{two_us / one_us:>8.1f}x")
+
+    # 3. số nhãn gian lận theo cấu hình ngưỡng
+    configs = [
+        ("FRAUD_THRESHOLD=0.5", 0.5, {}),
+        ("FRAUD_THRESHOLD=0.3", 0.3, {}),
+        ("FRAUD_THRESHOLD=0.8", 0.8, {}),
+        ("0.8, TRANSFER/CASH_OUT=0.3", 0.8, {"TRANSFER": 0.3, "CASH_OUT": 0.3}),
+    ]
+    print(f"\n{'thresholds':<30}{'flagged':>8}  by type")
+    try:
+        for label, threshold, by_type in configs:
+            inference.FRAUD_THRESHOLD, inference.FRAUD_THRESHOLDS_BY_TYPE = threshold, by_type
+            predictions = inference.predict_fn(transactions, model)
+            assert [p["probability"] for p in predictions] == [p["probability"] for p in expected]
+            by_type_counts = Counter(t["type"] for t, p in zip(transactions, predictions) if p["prediction"])
+            print(f"{label:<30}{sum(p['prediction'] for p in predictions):>8}  {dict(by_type_counts)}")
+    finally:
+        inference.FRAUD_THRESHOLD, inference.FRAUD_THRESHOLDS_BY_TYPE = 0.5, {}
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Benchmark instrumentation.py trên Luồng Nóng: lambda_handler in-process (Redis local, Kinesis / S3 giả).
+
+0. Trước khi đo: 4 bản copy instrumentation.py trong src/lambda_* phải giống hệt nhau (assert).
+1. Đọc lại các dòng EMF mà handler in ra để xem ngân sách ~200 ms của mỗi request đi đâu:
+   p50 / p95 / p99 theo stage (parse, validate, rules, redis_*, kinesis_put, s3_put, total).
+2. Overhead của instrumentation: cùng traffic chạy xen kẽ METRICS_ENABLED bật / tắt, so sánh latency / request,
+   và chi phí thuần (µs) của 1 request gồm 5 stage + 1 dòng EMF (không lẫn nhiễu của Redis / AWS giả).
+
+Chạy:
+  python benchmarks/bench_instrumentation.py
+  RTT_MS=1 AWS_LATENCY_MS=10 NUM_TXNS=5000 python benchmarks/bench_instrumentation.py
+"""
+import contextlib
+import io
+import json
+import os
+import statistics
+import time
+import timeit
+from collections import defaultdict
+from typing import Dict, List
+
+os.environ["METRICS_ENABLED"] = "true"
+
+from hot_path_stubs import load_hot_path  # noqa: E402
+from local_redis import ROOT_DIR  # noqa: E402
+from traffic import PaySimTraffic  # noqa: E402
+
+# --- CẤU HÌNH ---
+NUM_TXNS: int = int(os.getenv("NUM_TXNS", "3000"))
+ROUNDS: int = int(os.getenv("ROUNDS", "2"))
+BLACKLIST_RATIO: float = float(os.getenv("BLACKLIST_RATIO", "0.05"))
+RTT_MS: float = float(os.getenv("RTT_MS", "0.5"))
+AWS_LATENCY_MS: float = float(os.getenv("AWS_LATENCY_MS", "5"))
+# --- KẾT THÚC CẤU HÌNH ---
+
+
+def percentile(values: List[float], p: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100)[p - 1]
+
+
+def replay(lambda_function, events) -> List[float]:
+    latencies = []
+    for event in events:
+        started = time.perf_counter()
+        lambda_function.lambda_handler(event)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def check_copies() -> None:
+    # instrumentation.py được copy vào từng Lambda (xem docstring của module), bản gốc ở Luồng Nóng
+    source_dir = os.path.join(ROOT_DIR, "src", "lambda_process_transaction")
+    with open(os.path.join(source_dir, "instrumentation.py"), "rb") as f:
+        source = f.read()
+    lambda_dirs = sorted(d for d in os.listdir(os.path.join(ROOT_DIR, "src")) if d.startswith("lambda_"))
+    for lambda_dir in lambda_dirs:
+        with open(os.path.join(ROOT_DIR, "src", lambda_dir, "instrumentation.py"), "rb") as f:
+            assert f.read() == source, f"src/{lambda_dir}/instrumentation.py differs from {source_dir}/instrumentation.py"
+    print(f"instrumentation.py: {len(lambda_dirs)} copies identical\n")
+
+
+def main() -> None:
+    check_copies()
+    lambda_function, redis_client, _, _, _ = load_hot_path(RTT_MS, AWS_LATENCY_MS)
+    import instrumentation
+
+    traffic = PaySimTraffic(blacklist_ratio=BLACKLIST_RATIO, seed=22)
+    redis_client.sadd("blacklist:nameOrig", *traffic.blacklisted_users())
+    redis_client.sadd("blacklist:nameDes", *traffic.blacklisted_devices())
+    events = [{"body": json.dumps(txn)} for txn in traffic.stream(NUM_TXNS)]
+
+    # 1. stage breakdown từ dòng EMF
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        replay(lambda_function, events)
+    stages: Dict[str, List[float]] = defaultdict(list)
+    lines = 0
+    for line in output.getvalue().splitlines():
+        if not line.startswith('{"_aws"'):
+            continue
+        record = json.loads(line)
+        if "Service" not in record:
+            continue
+        lines += 1
+        for metric in record["_aws"]["CloudWatchMetrics"][0]["Metrics"]:
+            stages[metric["Name"]].append(record[metric["Name"]])
+    assert lines == NUM_TXNS, f"expected 1 EMF line per request, got {lines}"
+
+    print(f"txns={NUM_TXNS} blacklist_ratio={BLACKLIST_RATIO} redis_rtt={RTT_MS}ms aws_latency={AWS_LATENCY_MS}ms")
+    print(f"stage breakdown from {lines} EMF lines (ms, p50 over requests that hit the stage):")
+    print(f"  {'stage':<24}{'requests':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'share of total':>16}")
+    total = sum(stages["total"])
+    for name, values in sorted(stages.items(), key=lambda item: item[0] == "total"):
+        print(f"  {name:<24}{len(values):>9}{percentile(values, 50):>9.3f}{percentile(values, 95):>9.3f}"
+              f"{percentile(values, 99):>9.3f}{sum(values) / total:>16.1%}")
+
+    # 2. overhead: bật / tắt xen kẽ trên cùng traffic
+    samples: Dict[bool, List[float]] = {True: [], False: []}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(ROUNDS):
+            for enabled in (False, True):
+                instrumentation.METRICS_ENABLED = enabled
+                instrumentation.stage_timer.enabled = enabled
+                samples[enabled].extend(replay(lambda_function, events))
+    off, on = statistics.median(samples[False]), statistics.median(samples[True])
+    print(f"\nper-request latency p50: metrics off {off:.3f} ms, on {on:.3f} ms (overhead {(on - off) * 1000:+.1f} µs)")
+
+    timer = instrumentation.StageTimer("bench")
+
+    def skeleton() -> None:
+        timer.start()
+        for name in ("parse", "validate", "rules", "redis_rules", "kinesis_put"):
+            with timer.stage(name):
+                pass
+        timer.emit({"degraded": False})
+
+    costs: Dict[bool, float] = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for enabled in (True, False):
+            instrumentation.METRICS_ENABLED = enabled
+            timer.enabled = enabled
+            costs[enabled] = timeit.timeit(skeleton, number=20000) / 20000 * 1e6
+    print(f"instrumentation cost (5 stages + emit): metrics on {costs[True]:.1f} µs/request, off {costs[False]:.1f} µs/request")
+
+
+if __name__ == "__main__":
+    main()
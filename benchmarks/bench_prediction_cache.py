@@ -0,0 +1,132 @@
+"""
+Benchmark prediction cache của Lambda_FraudScoring (PREDICTION_CACHE_*).
+
+Traffic PaySim có REPEAT_RATIO giao dịch lặp lại (retry / replay / thanh toán định kỳ giống hệt nhau),
+chọn ngẫu nhiên từ REPEAT_POOL giao dịch gần nhất. So sánh khi không có cache, cache trong container
+và cache 2 tầng (container mới, chỉ còn tầng Redis ấm):
+records/s, số dòng gửi lên endpoint, hit ratio. Kết quả có cache phải giống hệt không cache.
+Cuối cùng đổi MODEL_VERSION để kiểm tra cache bị vô hiệu hoá, và đổi FRAUD_THRESHOLD của Lambda (không cần chấm lại).
+
+Chạy:
+  python benchmarks/bench_prediction_cache.py
+  REPEAT_RATIO=0.5 ENDPOINT_LATENCY_MS=30 python benchmarks/bench_prediction_cache.py
+"""
+import logging
+import os
+import random
+import time
+
+from cold_path_stubs import kinesis_event, load_cold_path
+from local_redis import make_redis
+from traffic import PaySimTraffic
+
+# --- CẤU HÌNH ---
+NUM_BATCHES: int = int(os.getenv("NUM_BATCHES", "10"))
+KINESIS_BATCH: int = int(os.getenv("KINESIS_BATCH", "100"))
+ENDPOINT_LATENCY_MS: float = float(os.getenv("ENDPOINT_LATENCY_MS", "15"))
+REPEAT_RATIO: float = float(os.getenv("REPEAT_RATIO", "0.3"))
+REPEAT_POOL: int = int(os.getenv("REPEAT_POOL", "500"))
+# --- KẾT THÚC CẤU HÌNH ---
+
+
+def repeated_traffic(total: int, seed: int = 20):
+    rng = random.Random(seed)
+    stream = PaySimTraffic(seed=seed).stream(total)
+    recent = []
+    for _ in range(total):
+        if recent and rng.random() < REPEAT_RATIO:
+            yield dict(rng.choice(recent))
+        else:
+            txn = next(stream)
+            recent = (recent + [txn])[-REPEAT_POOL:]
+            yield txn
+
+
+def run(label: str, merge, endpoint, table, events, cache) -> list:
+    merge.prediction_cache = cache
+    endpoint.rows = 0
+    endpoint.calls.clear()
+    table.items.clear()
+    started = time.perf_counter()
+    for event in events:
+        merge.lambda_handler(event, None)
+    elapsed = time.perf_counter() - started
+    total = NUM_BATCHES * KINESIS_BATCH
+    ratio = f"{cache.counters()['hit_ratio']:.1%}" if cache is not None else "-"
+    print(f"{label:<40}{total / elapsed:>10.0f}{endpoint.calls['invoke_endpoint']:>9}{endpoint.rows:>14}{ratio:>11}")
+    return [(item["transactionId"], item["ai_prediction_label"], item["ai_probability"]) for item in table.items]
+
+
+def main() -> None:
+    merge, endpoint, table, _ = load_cold_path(ENDPOINT_LATENCY_MS)
+    logging.getLogger().setLevel(logging.ERROR)
+    merge.SCORING_CONCURRENCY = 1
+    merge.executor = None
+
+    transactions = list(repeated_traffic(NUM_BATCHES * KINESIS_BATCH))
+    events = [kinesis_event(transactions[i * KINESIS_BATCH:(i + 1) * KINESIS_BATCH], i * KINESIS_BATCH) for i in range(NUM_BATCHES)]
+    redis_client, _ = make_redis()
+
+    print(f"batches={NUM_BATCHES}x{KINESIS_BATCH} repeat_ratio={REPEAT_RATIO} endpoint_latency={ENDPOINT_LATENCY_MS}ms")
+    print(f"{'SAGEMAKER_BATCH_SIZE / cache':<40}{'records/s':>10}{'invokes':>9}{'rows scored':>14}{'hit ratio':>11}")
+    for batch_size in (1, KINESIS_BATCH):
+        merge.SAGEMAKER_BATCH_SIZE = batch_size
+        redis_client.flushdb()
+        baseline = run(f"{batch_size:<4} none", merge, endpoint, table, events, None)
+        local = run(f"{batch_size:<4} in-container LRU", merge, endpoint, table, events, merge.PredictionCache())
+        run(f"{batch_size:<4} in-container + Redis (cold)", merge, endpoint, table, events, merge.PredictionCache(redis_client=redis_client))
+        # container mới: cache local rỗng, tầng Redis đã ấm
+        shared = run(f"{batch_size:<4} in-container + Redis (new container)", merge, endpoint, table, events, merge.PredictionCache(redis_client=redis_client))
+        assert local == baseline and shared == baseline, "cached predictions differ from uncached predictions"
+
+    # deploy model mới => version đổi, không được đọc lại kết quả của model cũ (kể cả trên Redis)
+    cache = merge.PredictionCache(redis_client=redis_client)
+    merge.prediction_cache = cache
+    merge.get_cached_predictions(transactions[:KINESIS_BATCH])
+    before = cache.counters()
+    endpoint.rows = 0
+    merge.MODEL_VERSION = "model-v2"
+    merge.get_cached_predictions(transactions[:KINESIS_BATCH])
+    after = cache.counters()
+    unique = len({merge.prediction_cache_key(t, "model-v2") for t in transactions[:KINESIS_BATCH]})
+    assert after["invalidations"] == 1 and after["redis_hits"] == before["redis_hits"] and endpoint.rows == unique, after
+    print(f"\nMODEL_VERSION change: {unique} unique transactions re-scored, counters {after}")
+
+    # deploy artifact mới sau cùng endpoint, không đổi MODEL_VERSION: nhận ra qua model_version trong kết quả,
+    # không trả kết quả cũ (kể cả phần giao dịch trúng cache trong batch phát hiện ra version mới)
+    inference = endpoint.inference
+    served_before, inference.MODEL_VERSION = inference.MODEL_VERSION, "artifact-v3"
+    try:
+        mixed = transactions[:KINESIS_BATCH // 2] + transactions[KINESIS_BATCH:KINESIS_BATCH + KINESIS_BATCH // 2]
+        results = merge.get_cached_predictions(mixed)
+        assert {r["model_version"] for r in results} == {"artifact-v3"}, "stale predictions served after artifact change"
+        assert cache.counters()["invalidations"] == 2, cache.counters()
+        # container mới: đọc served version từ Redis, trúng cache toàn bộ với kết quả của model mới
+        endpoint.rows = 0
+        merge.prediction_cache = merge.PredictionCache(redis_client=redis_client)
+        results = merge.get_cached_predictions(mixed)
+        assert {r["model_version"] for r in results} == {"artifact-v3"} and endpoint.rows == 0
+        print(f"artifact change behind same endpoint: detected from model_version, counters {cache.counters()}")
+    finally:
+        inference.MODEL_VERSION = served_before
+
+    # đổi ngưỡng của Lambda (FRAUD_THRESHOLD): nhãn tính lại từ probability trong cache, không chấm lại, không vô hiệu cache
+    merge.MODEL_VERSION = ""
+    cache = merge.PredictionCache()
+    merge.prediction_cache = cache
+    batch = transactions[:KINESIS_BATCH]
+    endpoint.rows = 0
+    merge.apply_thresholds(batch, merge.get_cached_predictions(batch))
+    scored_rows = endpoint.rows
+    try:
+        merge.FRAUD_THRESHOLD = 0.0
+        labels = merge.apply_thresholds(batch, merge.get_cached_predictions(batch))
+        assert all(r["prediction"] == int(r["probability"] > 0.0) for r in labels) and any(r["prediction"] for r in labels)
+        assert endpoint.rows == scored_rows and cache.counters()["invalidations"] == 0, cache.counters()
+        print(f"Lambda FRAUD_THRESHOLD change: labels re-applied from cached probabilities, {endpoint.rows} rows scored once")
+    finally:
+        merge.FRAUD_THRESHOLD = 0.5
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+So sánh số round trip và độ trễ của check_rules giữa 2 chế độ:
+  - legacy  : mỗi lệnh (SISMEMBER x2, lệnh velocity) 1 RTT
+  - pipeline: tất cả trong 1 RTT
+
+Chạy:
+  python benchmarks/bench_rules_rtt.py
+  RTT_MS=1.0 NUM_TXNS=2000 python benchmarks/bench_rules_rtt.py
+"""
+import os
+import random
+import statistics
+import time
+
+from local_redis import add_hot_path_to_sys_path, make_redis
+
+add_hot_path_to_sys_path()
+from rules_engine import check_rules  # noqa: E402
+
+# --- CẤU HÌNH ---
+NUM_TXNS: int = int(os.getenv("NUM_TXNS", "1000"))
+NUM_USERS: int = int(os.getenv("NUM_USERS", "200"))
+RTT_MS: float = float(os.getenv("RTT_MS", "0.5"))  # giả lập độ trễ mạng tới ElastiCache (TLS, cùng AZ)
+# --- KẾT THÚC CẤU HÌNH ---
+
+BASE_TIME: float = 1_700_000_000.0
+
+
+def make_transactions(n: int):
+    rnd = random.Random(42)
+    txns = []
+    for _ in range(n):
+        txns.append({
+            "step": 1,
+            "type": rnd.choice(["PAYMENT", "TRANSFER", "CASH_OUT"]),
+            "amount": round(rnd.uniform(1.0, 50000.0), 2),
+            "nameOrig": f"C{rnd.randrange(NUM_USERS):09d}",
+            "nameDest": f"M{rnd.randrange(NUM_USERS):09d}",
+            "oldbalanceOrg": 100000.0,
+            "newbalanceOrig": 50000.0,
+            "oldbalanceDest": 0.0,
+            "newbalanceDest": 50000.0,
+        })
+    return txns
+
+
+def run(mode: str, txns):
+    redis_client, stats = make_redis(rtt_ms=RTT_MS)
+    redis_client.sadd("blacklist:nameOrig", "C000000001")
+    redis_client.sadd("blacklist:nameDes", "M000000002")
+    stats.reset()
+
+    results = []
+    latencies = []
+    for i, txn in enumerate(txns):
+        start = time.perf_counter()
+        # cố định đồng hồ để 2 lần chạy rơi vào cùng bucket velocity => so sánh được kết quả
+        results.append(check_rules(redis_client, txn, now=BASE_TIME + i * 0.01, mode=mode))
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "results": results,
+        "rtt_per_txn": stats.round_trips / len(txns),
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": statistics.quantiles(latencies, n=100)[98],
+    }
+
+
+def main() -> None:
+    txns = make_transactions(NUM_TXNS)
+    legacy = run("legacy", txns)
+    pipeline = run("pipeline", txns)
+
+    # 2 chế độ phải cho ra cùng kết quả rule
+    assert legacy["results"] == pipeline["results"], "pipeline mode khác kết quả legacy mode"
+
+    print(f"txns={NUM_TXNS} users={NUM_USERS} simulated_rtt={RTT_MS}ms")
+    print(f"{'mode':<10}{'RTT/txn':>10}{'p50 (ms)':>12}{'p99 (ms)':>12}")
+    for name, stats in (("legacy", legacy), ("pipeline", pipeline)):
+        print(f"{name:<10}{stats['rtt_per_txn']:>10.2f}{stats['p50_ms']:>12.3f}{stats['p99_ms']:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Micro-benchmark parse + validate cho 1 giao dịch:
+  - legacy   : json.loads + chỉ kiểm tra có đủ key (validate_transaction bản cũ)
+  - stdlib   : json.loads + schema đã biên dịch (kiểu, ép kiểu số, độ dài, field lạ)
+  - orjson   : orjson.loads + schema đã biên dịch (nếu có cài orjson)
+
+Chạy:
+  python benchmarks/bench_validation.py
+  NUM_TXNS=200000 python benchmarks/bench_validation.py
+"""
+import json
+import os
+import time
+
+from local_redis import add_hot_path_to_sys_path
+from traffic import PaySimTraffic
+
+add_hot_path_to_sys_path()
+from transaction_schema import transaction_schema  # noqa: E402
+
+# --- CẤU HÌNH ---
+NUM_TXNS: int = int(os.getenv("NUM_TXNS", "50000"))
+# --- KẾT THÚC CẤU HÌNH ---
+
+LEGACY_REQUIRED = ["type", "nameOrig", "nameDest", "oldbalanceOrg", "newbalanceOrig", "amount", "oldbalanceDest", "newbalanceDest"]
+
+
+def legacy(body: str):
+    txn = json.loads(body)
+    for key in LEGACY_REQUIRED:
+        if key not in txn:
+            raise KeyError(f"Missing field: {key}")
+    if not isinstance(txn["amount"], (int, float)):
+        raise TypeError("Amount must be numeric")
+    return txn
+
+
+def compiled_with(loads):
+    validate = transaction_schema.validate
+
+    def run(body: str):
+        return validate(loads(body))
+
+    return run
+
+
+def measure(fn, bodies) -> float:
+    start = time.perf_counter()
+    for body in bodies:
+        fn(body)
+    return (time.perf_counter() - start) / len(bodies) * 1e6
+
+
+def main() -> None:
+    bodies = [json.dumps(txn) for txn in PaySimTraffic(seed=1).stream(NUM_TXNS)]
+    variants = [("legacy", legacy), ("stdlib", compiled_with(json.loads))]
+    try:
+        import orjson
+        variants.append(("orjson", compiled_with(orjson.loads)))
+    except ImportError:
+        print("orjson chưa được cài => bỏ qua backend orjson")
+
+    print(f"txns={NUM_TXNS}")
+    print(f"{'variant':<10}{'us/txn':>10}")
+    for name, fn in variants:
+        measure(fn, bodies[:1000])  # warm-up
+        print(f"{name:<10}{measure(fn, bodies):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Benchmark velocity limiter (sliding window nhiều cửa sổ):
+  1. Burst ở ranh giới cửa sổ: fixed window 60s cũ vs sliding window.
+  2. Spend aggregate: giao dịch bị Declined (blacklist) không được cộng vào tổng tiền / hạn mức max_amount.
+  3. Throughput check_rules khi nhiều luồng cùng đập vào 1 hot key so với key phân tán,
+     với 1 rule (mặc định) và 3 rule (giây / phút / giờ).
+
+Chạy:
+  python benchmarks/bench_velocity.py
+  BENCH_REDIS_URL=redis://localhost:6379/0 THREADS=32 python benchmarks/bench_velocity.py
+"""
+import os
+import threading
+import time
+
+from local_redis import add_hot_path_to_sys_path, make_redis
+
+add_hot_path_to_sys_path()
+from rules_engine import check_rules, is_declined, record_approved_spend  # noqa: E402
+from rule_definitions import CompiledRules, default_rule_definitions  # noqa: E402
+
+# --- CẤU HÌNH ---
+THREADS: int = int(os.getenv("THREADS", "8"))
+TXNS_PER_THREAD: int = int(os.getenv("TXNS_PER_THREAD", "500"))
+# --- KẾT THÚC CẤU HÌNH ---
+
+MULTI_WINDOW_RULES = [
+    {"name": "UserOver3PerSecond", "fields": ["nameOrig"], "window": 1, "limit": 3},
+    {"name": "SpawmOver5PerMinute", "fields": ["type", "nameOrig", "nameDest"], "window": 60, "limit": 5},
+    {"name": "DeviceOver100PerHour", "fields": ["nameDest"], "window": 3600, "limit": 100},
+]
+
+
+def make_txn(user: str, device: str):
+    return {
+        "type": "TRANSFER",
+        "amount": 100.0,
+        "nameOrig": user,
+        "nameDest": device,
+        "oldbalanceOrg": 100.0,
+        "newbalanceOrig": 0.0,
+        "oldbalanceDest": 0.0,
+        "newbalanceDest": 100.0,
+    }
+
+
+def fixed_window_allows(redis_client, key: str) -> bool:
+    # logic counter cũ: INCR, EXPIRE 60 khi count == 1, chặn khi > 5
+    count = redis_client.incr(key)
+    if count == 1:
+        redis_client.expire(key, 60)
+    return count <= 5
+
+
+def boundary_burst() -> None:
+    redis_client, _ = make_redis()
+    rules = CompiledRules(default_rule_definitions())
+    txn = make_txn("CBURST", "MBURST")
+    window_start = 1_700_000_040.0  # chia hết cho 60
+
+    # fixed window: 5 giao dịch cuối cửa sổ + 5 giao dịch đầu cửa sổ kế tiếp
+    fixed_allowed = 0
+    for t in [window_start - 0.5] * 5 + [window_start + 0.5] * 5:
+        bucket = int(t // 60)
+        fixed_allowed += fixed_window_allows(redis_client, f"fixed:{bucket}")
+
+    sliding_allowed = 0
+    for t in [window_start - 0.5] * 5 + [window_start + 0.5] * 5:
+        result = check_rules(redis_client, txn, rules=rules, now=t)
+        sliding_allowed += not result["SpawmOver5PerMinute"]
+
+    print("1) Burst quanh ranh giới cửa sổ 60s (limit 5):")
+    print(f"   fixed window  : {fixed_allowed}/10 giao dịch lọt trong ~1 giây")
+    print(f"   sliding window: {sliding_allowed}/10 giao dịch lọt trong ~1 giây")
+
+
+def throughput(rules: CompiledRules, hot: bool) -> float:
+    redis_client, stats = make_redis()
+    errors = []
+
+    def worker(thread_id: int) -> None:
+        try:
+            for i in range(TXNS_PER_THREAD):
+                if hot:
+                    txn = make_txn("CHOT", "MHOT")
+                else:
+                    txn = make_txn(f"C{thread_id:03d}{i:06d}", f"M{thread_id:03d}{i:06d}")
+                check_rules(redis_client, txn, rules=rules)
+        except Exception as e:  # pragma: no cover - in ra để biết benchmark hỏng
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(THREADS)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    if errors:
+        raise errors[0]
+
+    total = THREADS * TXNS_PER_THREAD
+    print(f"   {'hot key' if hot else 'spread keys':<12} velocity_rules={len(rules.limiter.rules)}"
+          f"  {total / elapsed:>10.0f} txn/s  cmd/txn={stats.commands / total:.1f}  RTT/txn={stats.round_trips / total:.1f}")
+    return total / elapsed
+
+
+def declined_spend() -> None:
+    redis_client, _ = make_redis()
+    rules = CompiledRules(default_rule_definitions(
+        [], [{"name": "UserSpendOver1000PerHour", "fields": ["nameOrig"], "window": 3600, "max_amount": 1000}]))
+    redis_client.sadd("blacklist:nameDes", "MBLOCKED")
+    now = 1_700_000_000.0
+
+    # 5 lần chuyển 400 tới đích bị chặn: Declined, không được ăn vào hạn mức 1000 của user
+    for i in range(5):
+        features = []
+        result = check_rules(redis_client, dict(make_txn("CSPEND", "MBLOCKED"), amount=400.0), rules=rules, now=now + i, features=features)
+        assert result["blackDevice"] and is_declined(result, rules)
+    assert features[0]["UserSpendOver1000PerHour_count"] == 5, features
+
+    approved = []
+    for i in range(3):
+        txn = dict(make_txn("CSPEND", "MOK"), amount=400.0)
+        features = []
+        result = check_rules(redis_client, txn, rules=rules, now=now + 10 + i, features=features)
+        if not is_declined(result, rules):
+            approved.append(features[0]["UserSpendOver1000PerHour_sum"])
+            record_approved_spend(redis_client, [txn], rules, now=now + 10 + i)
+
+    print("2) Spend aggregate (max_amount 1000/h) sau 5 lần chuyển 400 bị chặn:")
+    print(f"   giao dịch hợp lệ được Approved: {len(approved)}/3, tổng tiền gửi Kinesis: {approved}")
+    assert len(approved) == 2 and round(approved[-1]) == 800, "declined transactions counted towards spend"
+
+
+def main() -> None:
+    boundary_burst()
+    declined_spend()
+    print(f"3) Throughput check_rules, threads={THREADS}, txns/thread={TXNS_PER_THREAD}"
+          f" ({'BENCH_REDIS_URL' if os.getenv('BENCH_REDIS_URL') else 'fakeredis'})")
+    for config in (None, MULTI_WINDOW_RULES):
+        rules = CompiledRules(default_rule_definitions(config))
+        for hot in (True, False):
+            throughput(rules, hot)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Nạp Lambda_FraudScoring (src/lambda_fraud_scoring/merge.py) in-process cho benchmark:
+SageMaker endpoint giả chạy thật inference.py (model trong sagemaker-deployment/modell) cộng độ trễ mạng cấu hình được,
+DynamoDB / Lambda là client giả có độ trễ cấu hình được.
+"""
+import base64
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+import warnings
+from collections import Counter
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+from local_redis import ROOT_DIR
+
+COLD_PATH_DIR: str = os.path.join(ROOT_DIR, "src", "lambda_fraud_scoring")
+SAGEMAKER_DIR: str = os.path.join(ROOT_DIR, "sagemaker-deployment")
+
+os.environ.setdefault("AWS_REGION", "us-east-1")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+# không in dòng EMF ra stdout khi benchmark (bench_instrumentation.py tự bật)
+os.environ.setdefault("METRICS_ENABLED", "false")
+os.environ.setdefault("DYNAMODB_TABLE_NAME", "fraud-results")
+os.environ.setdefault("SAGEMAKER_ENDPOINT_NAME", "fraud-detection-endpoint-1")
+os.environ.setdefault("ALERT_LAMBDA_NAME", "Lambda_Alert")
+os.environ.setdefault("SM_MODEL_DIR", os.path.join(SAGEMAKER_DIR, "modell"))
+os.environ.setdefault("EMBEDDED_MODEL_DIR", os.path.join(SAGEMAKER_DIR, "modell"))
+# các benchmark khác chạy lại cùng event nhiều lần => tắt prediction cache (bench_prediction_cache.py tự bật)
+os.environ.setdefault("PREDICTION_CACHE_ENABLED", "false")
+
+
+def load_inference():
+    if SAGEMAKER_DIR not in sys.path:
+        sys.path.insert(0, SAGEMAKER_DIR)
+    with warnings.catch_warnings():
+        # scaler.pkl được pickle bằng scikit-learn cũ hơn bản cài ở local
+        warnings.simplefilter("ignore")
+        import inference
+    return inference
+
+
+class StubEndpoint:
+    """
+    sagemaker-runtime giả: invoke_endpoint = độ trễ mạng cố định + chạy input_fn / predict_fn / output_fn thật.
+    """
+
+    def __init__(self, latency_ms: float = 0.0) -> None:
+        self.latency_seconds: float = latency_ms / 1000.0
+        self.inference = load_inference()
+        self.calls: Counter = Counter()
+        self.rows: int = 0
+        # số lần gọi tiếp theo bị throttle (ThrottlingException, HTTP 400 nhưng retry được)
+        self.throttle: int = 0
+
+    def invoke_endpoint(self, EndpointName: str, ContentType: str, Body: Any, **kwargs: Any) -> Dict[str, Any]:
+        from botocore.exceptions import ClientError
+
+        self.calls["invoke_endpoint"] += 1
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        if self.throttle:
+            self.throttle -= 1
+            raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"},
+                               "ResponseMetadata": {"HTTPStatusCode": 400}}, "InvokeEndpoint")
+        inference = self.inference
+        accept = kwargs.get("Accept", "application/json")
+        try:
+            data = inference.input_fn(Body, ContentType)
+            self.rows += 1 if isinstance(data, dict) else len(data)
+            prediction = inference.predict_fn(data, inference.model_fn(None))
+            body = inference.output_fn(prediction, accept)
+        except Exception as e:
+            # lỗi trong container model => SageMaker trả ModelError (HTTP 424)
+            raise ClientError({"Error": {"Code": "ModelError", "Message": f"Received client error (400) from model: {e!r}"},
+                               "ResponseMetadata": {"HTTPStatusCode": 424}}, "InvokeEndpoint")
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        return {"Body": io.BytesIO(body), "ContentType": accept}
+
+
+class StubAwsClient:
+    # client AWS giả (Lambda, DynamoDB Table...): mọi method trả về {} sau latency_ms
+    def __init__(self, service: str, latency_ms: float = 0.0) -> None:
+        self.service: str = service
+        self.latency_seconds: float = latency_ms / 1000.0
+        self.calls: Counter = Counter()
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            self.calls[name] += 1
+            if self.latency_seconds:
+                time.sleep(self.latency_seconds)
+            return {}
+
+        return call
+
+
+class StubDynamoResource:
+    """
+    DynamoDB service resource giả: Table() trả về table_stub, meta.client là chính nó (merge.py ghi qua client),
+    batch_write_item có độ trễ và trả lại ngẫu nhiên unprocessed_ratio số item trong UnprocessedItems (giả lập throttle).
+    items lưu item đã ghi theo thứ tự.
+    """
+
+    def __init__(self, table: StubAwsClient, latency_ms: float = 0.0, unprocessed_ratio: float = 0.0, seed: int = 0) -> None:
+        self.table = table
+        self.latency_seconds: float = latency_ms / 1000.0
+        self.unprocessed_ratio: float = unprocessed_ratio
+        self.rng = random.Random(seed)
+        self.calls: Counter = Counter()
+        self.items: List[Dict[str, Any]] = []
+        self.lock = threading.Lock()
+        self.meta = SimpleNamespace(client=self)
+
+    def Table(self, name: str) -> StubAwsClient:
+        return self.table
+
+    def batch_write_item(self, RequestItems: Dict[str, List[Dict[str, Any]]], **kwargs: Any) -> Dict[str, Any]:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        unprocessed: Dict[str, List[Dict[str, Any]]] = {}
+        with self.lock:
+            self.calls["batch_write_item"] += 1
+            for table_name, requests in RequestItems.items():
+                if len(requests) > 25:
+                    raise ValueError("Too many items requested for the BatchWriteItem call")
+                # key rỗng => DynamoDB từ chối cả request (ValidationException, không retry được)
+                if any(request["PutRequest"]["Item"].get("transactionId") == "" for request in requests):
+                    from botocore.exceptions import ClientError
+                    raise ClientError({"Error": {"Code": "ValidationException", "Message": "One or more parameter values are not valid"},
+                                       "ResponseMetadata": {"HTTPStatusCode": 400}}, "BatchWriteItem")
+                for request in requests:
+                    if self.rng.random() < self.unprocessed_ratio:
+                        unprocessed.setdefault(table_name, []).append(request)
+                    else:
+                        self.items.append(request["PutRequest"]["Item"])
+        return {"UnprocessedItems": unprocessed}
+
+
+def load_cold_path(endpoint_latency_ms: float = 0.0, aws_latency_ms: float = 0.0, unprocessed_ratio: float = 0.0):
+    """
+    Trả về (merge module, endpoint_stub, dynamodb_stub, lambda_stub). dynamodb_stub.table là Table giả (put_item).
+    """
+    import boto3
+
+    endpoint = StubEndpoint(endpoint_latency_ms)
+    dynamodb = StubDynamoResource(StubAwsClient("dynamodb", aws_latency_ms), aws_latency_ms, unprocessed_ratio)
+    lambda_client = StubAwsClient("lambda", aws_latency_ms)
+    clients = {"sagemaker-runtime": endpoint, "lambda": lambda_client}
+
+    original_client, original_resource = boto3.client, boto3.resource
+    boto3.client = lambda service, *args, **kwargs: clients[service]
+    boto3.resource = lambda service, *args, **kwargs: dynamodb
+    try:
+        if COLD_PATH_DIR not in sys.path:
+            sys.path.insert(0, COLD_PATH_DIR)
+        import merge
+    finally:
+        boto3.client, boto3.resource = original_client, original_resource
+
+    merge.sagemaker_runtime = endpoint
+    merge.lambda_client = lambda_client
+    merge.dynamodb = dynamodb
+    return merge, endpoint, dynamodb, lambda_client
+
+
+def kinesis_event(transactions: List[Dict[str, Any]], first_sequence: int = 0) -> Dict[str, Any]:
+    # event Kinesis -> Lambda giống AWS gửi (data base64, sequenceNumber tăng dần)
+    return {
+        "Records": [
+            {
+                "eventSource": "aws:kinesis",
+                "eventID": f"shardId-000000000000:{first_sequence + i}",
+                "kinesis": {
+                    "partitionKey": str(txn.get("nameOrig")),
+                    "sequenceNumber": str(first_sequence + i),
+                    "data": base64.b64encode(json.dumps(txn).encode("utf-8")).decode("ascii"),
+                },
+            }
+            for i, txn in enumerate(transactions)
+        ]
+    }
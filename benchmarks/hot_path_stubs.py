@@ -0,0 +1,73 @@
+"""
+Nạp Lambda_ProcessTransaction in-process cho benchmark:
+redis_client trỏ tới Redis local (xem local_redis.py), Kinesis / S3 là client giả có độ trễ cấu hình được.
+"""
+import os
+import time
+from collections import Counter
+from typing import Any, Dict
+
+from local_redis import add_hot_path_to_sys_path, make_redis
+
+# boto3 cần region khi tạo client (không gọi mạng)
+os.environ.setdefault("AWS_REGION", "us-east-1")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+# không in dòng EMF ra stdout khi benchmark (bench_instrumentation.py tự bật)
+os.environ.setdefault("METRICS_ENABLED", "false")
+
+
+class StubAwsClient:
+    """
+    Client AWS giả: mọi method đều trả về response hợp lệ tối thiểu sau latency_ms.
+    calls đếm số lần gọi theo tên API.
+    """
+
+    def __init__(self, service: str, latency_ms: float = 0.0) -> None:
+        self.service: str = service
+        self.latency_seconds: float = latency_ms / 1000.0
+        self.calls: Counter = Counter()
+
+    def _respond(self, name: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        if name == "describe_stream_summary":
+            return {"StreamDescriptionSummary": {"StreamStatus": "ACTIVE"}}
+        if name == "put_records":
+            return {"FailedRecordCount": 0, "Records": [{"SequenceNumber": "0", "ShardId": "shardId-0"} for _ in kwargs["Records"]]}
+        if name == "put_record":
+            return {"SequenceNumber": "0", "ShardId": "shardId-0"}
+        return {}
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def call(**kwargs):
+            self.calls[name] += 1
+            if self.latency_seconds:
+                time.sleep(self.latency_seconds)
+            return self._respond(name, kwargs)
+
+        return call
+
+
+def load_hot_path(redis_rtt_ms: float = 0.0, aws_latency_ms: float = 0.0):
+    """
+    Trả về (lambda_function module, redis_client, redis_stats, kinesis_stub, s3_stub).
+    """
+    add_hot_path_to_sys_path()
+    import kinesis_publisher
+    import lambda_function
+    import save_s3
+
+    redis_client, redis_stats = make_redis(rtt_ms=redis_rtt_ms)
+    kinesis_stub = StubAwsClient("kinesis", aws_latency_ms)
+    s3_stub = StubAwsClient("s3", aws_latency_ms)
+
+    lambda_function.redis_client = redis_client
+    kinesis_publisher.kinesis_client = kinesis_stub
+    save_s3.s3_client = s3_stub
+    if lambda_function.blacklist_cache is not None:
+        lambda_function.blacklist_cache.redis_client = redis_client
+    if lambda_function.rule_set.redis_client is not None:
+        lambda_function.rule_set.redis_client = redis_client
+
+    return lambda_function, redis_client, redis_stats, kinesis_stub, s3_stub
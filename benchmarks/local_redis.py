@@ -0,0 +1,79 @@
+"""
+Redis dùng cho benchmark offline (không cần deploy lên AWS).
+
+- Nếu có biến môi trường BENCH_REDIS_URL (vd: redis://localhost:6379/0) thì dùng Redis thật.
+- Nếu không thì dùng fakeredis (in-process).
+
+Mỗi lần client ghi lệnh xuống socket được tính là 1 round trip (RTT),
+có thể giả lập độ trễ mạng tới ElastiCache bằng tham số rtt_ms.
+Số lệnh gửi lên Redis (tải phía server) được đếm riêng.
+"""
+import os
+import sys
+import time
+from typing import Optional
+
+import redis
+
+ROOT_DIR: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HOT_PATH_DIR: str = os.path.join(ROOT_DIR, "src", "lambda_process_transaction")
+
+BENCH_REDIS_URL: Optional[str] = os.getenv("BENCH_REDIS_URL")
+
+
+def add_hot_path_to_sys_path() -> None:
+    # Code Lambda import phẳng (vd: `from rules_engine import ...`) nên phải thêm thư mục Lambda vào sys.path
+    if HOT_PATH_DIR not in sys.path:
+        sys.path.insert(0, HOT_PATH_DIR)
+
+
+class RoundTripStats:
+    def __init__(self) -> None:
+        self.round_trips: int = 0
+        self.commands: int = 0
+
+    def reset(self) -> None:
+        self.round_trips = 0
+        self.commands = 0
+
+
+def _counting_connection_class(base_cls: type, stats: RoundTripStats, rtt_seconds: float) -> type:
+    class CountingConnection(base_cls):  # type: ignore[misc, valid-type]
+        def send_packed_command(self, command, check_health=True):
+            # pipeline gom mọi lệnh vào 1 lần gửi => 1 RTT
+            stats.round_trips += 1
+            if rtt_seconds:
+                time.sleep(rtt_seconds)
+            return super().send_packed_command(command, check_health)
+
+        def send_command(self, *args, **kwargs):
+            stats.commands += 1
+            return super().send_command(*args, **kwargs)
+
+        def pack_commands(self, commands):
+            # pipeline đóng gói nhiều lệnh 1 lần => đếm được tải lệnh lên Redis
+            commands = list(commands)
+            stats.commands += len(commands)
+            return super().pack_commands(commands)
+
+    return CountingConnection
+
+
+def make_redis(rtt_ms: float = 0.0, flush: bool = True):
+    """
+    Trả về (redis_client, stats). stats.round_trips / stats.commands đếm số RTT / số lệnh kể từ lần reset gần nhất.
+    """
+    if BENCH_REDIS_URL:
+        client = redis.Redis.from_url(BENCH_REDIS_URL, decode_responses=True)
+    else:
+        import fakeredis
+        client = fakeredis.FakeRedis(decode_responses=True)
+
+    stats = RoundTripStats()
+    pool = client.connection_pool
+    pool.connection_class = _counting_connection_class(pool.connection_class, stats, rtt_ms / 1000.0)
+
+    if flush:
+        client.flushdb()
+    stats.reset()
+    return client, stats
@@ -0,0 +1,89 @@
+"""
+Sinh traffic giả lập theo phân phối của dataset PaySim (type, amount, balance),
+có thể cấu hình tỉ lệ giao dịch dính blacklist và độ lệch (skew) của key người dùng.
+"""
+import bisect
+import itertools
+import random
+from typing import Any, Dict, Iterator, List
+
+# Tỉ lệ type trong PaySim
+PAYSIM_TYPES: List[str] = ["CASH_OUT", "PAYMENT", "CASH_IN", "TRANSFER", "DEBIT"]
+PAYSIM_TYPE_WEIGHTS: List[float] = [0.352, 0.338, 0.220, 0.084, 0.006]
+
+
+class PaySimTraffic:
+    """
+    num_users        : số nameOrig khác nhau
+    zipf_s           : độ lệch key (0 = đều; ~1.0 = vài user rất "nóng")
+    blacklist_ratio  : tỉ lệ giao dịch có nameOrig hoặc nameDest nằm trong blacklist
+    blacklist_size   : số phần tử trong mỗi set blacklist
+    """
+
+    def __init__(
+        self,
+        num_users: int = 100_000,
+        zipf_s: float = 1.0,
+        blacklist_ratio: float = 0.01,
+        blacklist_size: int = 10_000,
+        seed: int = 42,
+    ) -> None:
+        self.rnd = random.Random(seed)
+        self.num_users = num_users
+        self.blacklist_ratio = blacklist_ratio
+        self.blacklist_size = blacklist_size
+        weights = [1.0 / ((rank + 1) ** zipf_s) for rank in range(num_users)]
+        self.cumulative = list(itertools.accumulate(weights))
+        self.step = 1
+
+    def blacklisted_users(self) -> List[str]:
+        return [f"CB{i:08d}" for i in range(self.blacklist_size)]
+
+    def blacklisted_devices(self) -> List[str]:
+        return [f"MB{i:08d}" for i in range(self.blacklist_size)]
+
+    def _user(self) -> str:
+        rank = bisect.bisect_left(self.cumulative, self.rnd.random() * self.cumulative[-1])
+        return f"C{rank:09d}"
+
+    def transaction(self) -> Dict[str, Any]:
+        rnd = self.rnd
+        txn_type = rnd.choices(PAYSIM_TYPES, PAYSIM_TYPE_WEIGHTS)[0]
+        amount = round(min(rnd.lognormvariate(11.0, 1.6), 9.2e7), 2)
+
+        name_orig = self._user()
+        # PAYMENT / DEBIT trả cho merchant (M...), còn lại chuyển cho khách hàng (C...)
+        prefix = "M" if txn_type in ("PAYMENT", "DEBIT") else "C"
+        name_dest = f"{prefix}{rnd.randrange(self.num_users * 10):09d}"
+
+        # dính blacklist: chia đều giữa nameOrig và nameDest
+        if rnd.random() < self.blacklist_ratio:
+            if rnd.random() < 0.5:
+                name_orig = f"CB{rnd.randrange(self.blacklist_size):08d}"
+            else:
+                name_dest = f"MB{rnd.randrange(self.blacklist_size):08d}"
+
+        old_org = round(max(rnd.lognormvariate(10.5, 2.0), 0.0), 2)
+        new_org = round(max(old_org - amount, 0.0), 2)
+        old_dest = round(max(rnd.lognormvariate(12.0, 2.0), 0.0), 2) if prefix == "C" else 0.0
+        new_dest = round(old_dest + amount, 2) if prefix == "C" else 0.0
+
+        # step trong PaySim = số giờ kể từ lúc bắt đầu mô phỏng
+        if rnd.random() < 0.001:
+            self.step += 1
+
+        return {
+            "step": self.step,
+            "type": txn_type,
+            "amount": amount,
+            "nameOrig": name_orig,
+            "oldbalanceOrg": old_org,
+            "newbalanceOrig": new_org,
+            "nameDest": name_dest,
+            "oldbalanceDest": old_dest,
+            "newbalanceDest": new_dest,
+        }
+
+    def stream(self, n: int) -> Iterator[Dict[str, Any]]:
+        for _ in range(n):
+            yield self.transaction()
@@ -1,9 +1,30 @@
 #!/usr/bin/env python3
+from pathlib import Path
+
 import aws_cdk as cdk
 from stacks.vpc_stack import VpcStack
 from stacks.hot_path_stack import HotStack
 from stacks.cold_path_stack import FraudDetectionStack
 
+# Module dùng chung được copy vào thư mục của từng Lambda (mỗi Lambda là 1 asset zip riêng).
+# Bản gốc nằm ở src/lambda_process_transaction, synth dừng lại nếu có bản copy bị lệch.
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+SHARED_MODULES = {
+    "instrumentation.py": ["lambda_process_transaction", "lambda_fraud_scoring", "lambda_alert", "lambda_sync_to_dashboard"],
+}
+
+
+def check_shared_modules():
+    for module, lambda_dirs in SHARED_MODULES.items():
+        source = SRC_DIR / lambda_dirs[0] / module
+        drifted = [d for d in lambda_dirs[1:] if (SRC_DIR / d / module).read_bytes() != source.read_bytes()]
+        if drifted:
+            raise SystemExit(f"{module} differs from {source} in: {', '.join(drifted)} "
+                             f"(copy the source file over them before synth/deploy)")
+
+
+check_shared_modules()
+
 app = cdk.App()
 
 # 1️⃣ Deploy VPC trước
@@ -114,6 +114,9 @@ class FraudDetectionStack(Stack):
                 "SNS_TOPIC_ARN": topic.topic_arn,
                 "SAGEMAKER_ENDPOINT": "fraud-detection-endpoint-1",
                 "ALERT_LAMBDA_NAME": "Lambda_Alert",
+                # ngưỡng gắn nhãn gian lận (đổi ở đây, không cần deploy lại endpoint)
+                "FRAUD_THRESHOLD": "0.5",
+                "FRAUD_THRESHOLDS_BY_TYPE": "{}",
                 "REGION": self.region
             }
         )
@@ -7,11 +7,21 @@ role = sagemaker.get_execution_role()  # thay role ARN
 
 model_s3_path = 's3://fraud-model-buckets/modell.tar.gz'
 
+# Ngưỡng gắn nhãn gian lận của inference.py (probability > ngưỡng => prediction = 1), cho client gọi thẳng endpoint
+# ví dụ ngưỡng riêng theo type: '{"TRANSFER": 0.3, "CASH_OUT": 0.4}'
+# Lambda_FraudScoring tự áp ngưỡng của nó (FRAUD_THRESHOLD* của Lambda) lên probability => đổi ngưỡng cho Luồng Lạnh
+# chỉ cần đổi cấu hình Lambda, không deploy lại endpoint
+inference_env = {
+    'FRAUD_THRESHOLD': '0.5',
+    'FRAUD_THRESHOLDS_BY_TYPE': '{}',
+}
+
 xgb_model = XGBoostModel(
     model_data=model_s3_path,         # tar.gz chứa inference.py + các .pkl
     role=role,
     entry_point='inference.py',       # file xử lý input/output
     framework_version='1.7-1',        # phiên bản XGBoost container
+    env=inference_env,
     sagemaker_session=sagemaker_session
 )
 
@@ -1,25 +1,124 @@
 import os
+import io
+import csv
 import json
-import pandas as pd
+import hashlib
+import numpy as np
 import joblib
 import xgboost as xgb
 
-# Load artifacts
-MODEL_PATH = "/opt/ml/model/xgb_fraud_model.json"
-SCALER_PATH = "/opt/ml/model/scaler.pkl"
-FEATURE_COLUMNS_PATH = "/opt/ml/model/feature_columns.pkl"
+# Load artifacts (SM_MODEL_DIR do container SageMaker set, mặc định /opt/ml/model)
+MODEL_DIR = os.environ.get("SM_MODEL_DIR", "/opt/ml/model")
+MODEL_PATH = os.path.join(MODEL_DIR, "xgb_fraud_model.json")
+SCALER_PATH = os.path.join(MODEL_DIR, "scaler.pkl")
+FEATURE_COLUMNS_PATH = os.path.join(MODEL_DIR, "feature_columns.pkl")
+
+# Toàn bộ giá trị 'type' của PaySim, đúng thứ tự lúc train (get_dummies drop_first bỏ CASH_IN)
+TRANSACTION_TYPES = ['CASH_IN', 'CASH_OUT', 'DEBIT', 'PAYMENT', 'TRANSFER']
+
+# Field của giao dịch mà model dùng, cũng là thứ tự cột của input CSV không header và ma trận application/x-npy
+# (ma trận: cột 'type' là vị trí trong TRANSACTION_TYPES, ví dụ TRANSFER = 4)
+INPUT_COLUMNS = ['step', 'type', 'amount', 'oldbalanceOrg', 'newbalanceOrig', 'oldbalanceDest', 'newbalanceDest']
+
+# Content type hỗ trợ cho cả request (Content-Type) lẫn response (Accept)
+JSON_CONTENT_TYPE = 'application/json'
+JSON_LINES_CONTENT_TYPES = ('application/jsonlines', 'application/x-jsonlines')
+CSV_CONTENT_TYPE = 'text/csv'
+NPY_CONTENT_TYPE = 'application/x-npy'
+
+# Ngưỡng gắn nhãn gian lận: probability > ngưỡng => prediction = 1 (0.5 = giống model.predict của XGBoost)
+# Đổi ngưỡng chỉ cần cập nhật biến môi trường của endpoint, không phải train / đóng gói lại model
+FRAUD_THRESHOLD = float(os.environ.get('FRAUD_THRESHOLD', '0.5'))
+# Ngưỡng riêng theo 'type', JSON dạng {"TRANSFER": 0.3, "CASH_OUT": 0.4}; type không có trong đây dùng FRAUD_THRESHOLD
+FRAUD_THRESHOLDS_BY_TYPE = json.loads(os.environ.get('FRAUD_THRESHOLDS_BY_TYPE', '') or '{}')
 
 # Load model XGBoost mới (JSON)
 model = xgb.XGBClassifier()
 model.load_model(MODEL_PATH)
 
+# Version trả về cùng mỗi kết quả: MODEL_VERSION nếu được set, mặc định là hash nội dung 3 artifact + ngưỡng đang cấu hình
+# (prediction trả về đã áp ngưỡng => đổi FRAUD_THRESHOLD* cũng đổi version, cache phía client không giữ nhãn cũ).
+# artifact_version(model_dir) không kèm ngưỡng giống embedded_model.model_version của Lambda_FraudScoring
+def artifact_version(model_dir, thresholds=None):
+    digest = hashlib.blake2b(digest_size=8)
+    for path in (MODEL_PATH, SCALER_PATH, FEATURE_COLUMNS_PATH):
+        with open(os.path.join(model_dir, os.path.basename(path)), 'rb') as f:
+            digest.update(f.read())
+    if thresholds is not None:
+        digest.update(json.dumps(thresholds, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+MODEL_VERSION = os.environ.get('MODEL_VERSION') or artifact_version(MODEL_DIR, [FRAUD_THRESHOLD, FRAUD_THRESHOLDS_BY_TYPE])
+
 # Load scaler và feature columns
 scaler = joblib.load(SCALER_PATH)
 feature_columns = joblib.load(FEATURE_COLUMNS_PATH)
 
-# Preprocess JSON input
+# Tính 1 lần khi load: vị trí của từng cột trong feature_columns
+# cột số lấy thẳng từ giao dịch, cột type_<X> là one-hot của 'type' (CASH_IN bị drop_first => không có cột)
+NUMERIC_COLUMNS = [(index, column) for index, column in enumerate(feature_columns) if not column.startswith('type_')]
+TYPE_COLUMN_INDEX = {
+    column[len('type_'):]: index
+    for index, column in enumerate(feature_columns)
+    if column.startswith('type_') and column[len('type_'):] in TRANSACTION_TYPES
+}
+# StandardScaler: (x - mean) / scale, giống scaler.transform
+SCALER_MEAN = scaler.mean_ if scaler.with_mean else 0.0
+SCALER_SCALE = scaler.scale_ if scaler.with_std else 1.0
+
+def preprocess_records(records):
+    """
+    Map list giao dịch (dict) thẳng vào mảng NumPy (n, len(feature_columns)) rồi scale tại chỗ,
+    không qua pandas. 1 giao dịch hay cả batch đều đi cùng 1 đường.
+    Field thiếu => 0 (như preprocess với 1 dòng), giá trị None => NaN, 'type' lạ => mọi cột type_* = 0.
+    """
+    X = np.zeros((len(records), len(feature_columns)), dtype=np.float64)
+    for index, column in NUMERIC_COLUMNS:
+        X[:, index] = [record.get(column, 0) for record in records]
+    for row, record in enumerate(records):
+        type_index = TYPE_COLUMN_INDEX.get(record['type'])
+        if type_index is not None:
+            X[row, type_index] = 1.0
+    X -= SCALER_MEAN
+    X /= SCALER_SCALE
+    return X
+
+def preprocess_matrix(matrix):
+    """
+    Giống preprocess_records nhưng input là ma trận số (n, len(INPUT_COLUMNS)) của application/x-npy:
+    chép cột + one-hot 'type' hoàn toàn bằng NumPy. Mã type ngoài TRANSACTION_TYPES => mọi cột type_* = 0.
+    """
+    X = np.zeros((matrix.shape[0], len(feature_columns)), dtype=np.float64)
+    for index, column in NUMERIC_COLUMNS:
+        X[:, index] = matrix[:, INPUT_COLUMNS.index(column)]
+    type_codes = matrix[:, INPUT_COLUMNS.index('type')]
+    for type_name, index in TYPE_COLUMN_INDEX.items():
+        X[:, index] = type_codes == TRANSACTION_TYPES.index(type_name)
+    X -= SCALER_MEAN
+    X /= SCALER_SCALE
+    return X
+
+def fraud_thresholds(records):
+    # 1 ngưỡng cho cả batch nếu không cấu hình theo type, ngược lại mảng ngưỡng theo từng dòng
+    if not FRAUD_THRESHOLDS_BY_TYPE:
+        return FRAUD_THRESHOLD
+    if isinstance(records, np.ndarray):
+        thresholds = np.full(records.shape[0], FRAUD_THRESHOLD)
+        type_codes = records[:, INPUT_COLUMNS.index('type')]
+        for type_name, threshold in FRAUD_THRESHOLDS_BY_TYPE.items():
+            if type_name in TRANSACTION_TYPES:
+                thresholds[type_codes == TRANSACTION_TYPES.index(type_name)] = threshold
+        return thresholds
+    return np.array([FRAUD_THRESHOLDS_BY_TYPE.get(record.get('type'), FRAUD_THRESHOLD) for record in records])
+
+# Preprocess bằng pandas (cách cũ, giữ lại để kiểm tra parity với preprocess_records)
 def preprocess(df):
-    # One-hot encode 'type'
+    import pandas as pd
+
+    # One-hot encode 'type' theo danh sách category cố định
+    # => mỗi dòng được encode giống nhau dù batch gồm loại giao dịch nào (và giống lúc train)
+    df = df.copy()
+    df['type'] = pd.Categorical(df['type'], categories=TRANSACTION_TYPES)
     df = pd.get_dummies(df, columns=['type'], drop_first=True)
     
     # Thêm các cột còn thiếu
@@ -39,17 +138,102 @@ def model_fn(model_dir):
     # Return model đã load sẵn
     return model
 
-def input_fn(request_body, content_type='application/json'):
-    if content_type == 'application/json':
-        input_json = json.loads(request_body)
-        return pd.DataFrame([input_json])
-    raise ValueError(f"Unsupported content type: {content_type}")
+def media_type(content_type):
+    # "text/csv; charset=utf-8" => "text/csv"
+    return (content_type or JSON_CONTENT_TYPE).split(';')[0].strip().lower()
+
+def csv_has_header(content_type):
+    # Header phải được khai báo rõ bằng tham số của text/csv (RFC 4180): "text/csv; header=present"
+    params = [param.strip().lower() for param in (content_type or '').split(';')[1:]]
+    return 'header=present' in params
+
+def parse_csv(text, header=False):
+    """
+    CSV -> list giao dịch. header=True: dòng đầu là tên cột (cột thừa như nameOrig được giữ nguyên),
+    ngược lại các cột theo thứ tự INPUT_COLUMNS. Ô trống => bỏ field (preprocess_records coi là 0, giống field thiếu trong JSON).
+    """
+    rows = [row for row in csv.reader(io.StringIO(text)) if row]
+    columns = INPUT_COLUMNS
+    if header and rows:
+        columns, rows = rows[0], rows[1:]
+    return [
+        {
+            column: value if column == 'type' or column not in INPUT_COLUMNS else float(value)
+            for column, value in zip(columns, row)
+            if value != ''
+        }
+        for row in rows
+    ]
+
+def input_fn(request_body, content_type=JSON_CONTENT_TYPE):
+    """
+    application/json              : JSON object => 1 giao dịch, JSON array => batch (kết quả trả về theo đúng thứ tự)
+    application/jsonlines         : mỗi dòng 1 JSON object => batch
+    text/csv                      : mỗi dòng 1 giao dịch, không header (cột theo INPUT_COLUMNS)
+                                    hoặc "text/csv; header=present" (dòng đầu là tên cột) => batch
+    application/x-npy             : ma trận float (n, len(INPUT_COLUMNS)) lưu bằng numpy.save => batch,
+                                    gọn nhất cho job offline gửi hàng nghìn dòng (float64 để kết quả giống hệt JSON)
+    """
+    csv_header = csv_has_header(content_type)
+    content_type = media_type(content_type)
+    if content_type == NPY_CONTENT_TYPE:
+        matrix = np.load(io.BytesIO(request_body), allow_pickle=False)
+        if matrix.ndim != 2 or matrix.shape[1] != len(INPUT_COLUMNS):
+            raise ValueError(f"Expected matrix of shape (n, {len(INPUT_COLUMNS)}), got {matrix.shape}")
+        if not matrix.shape[0]:
+            raise ValueError("Empty batch")
+        return matrix
+
+    text = request_body.decode('utf-8') if isinstance(request_body, (bytes, bytearray)) else request_body
+    if content_type == JSON_CONTENT_TYPE:
+        input_json = json.loads(text)
+    elif content_type in JSON_LINES_CONTENT_TYPES:
+        input_json = [json.loads(line) for line in text.splitlines() if line.strip()]
+    elif content_type == CSV_CONTENT_TYPE:
+        input_json = parse_csv(text, header=csv_header)
+    else:
+        raise ValueError(f"Unsupported content type: {content_type}")
+    if isinstance(input_json, list) and not input_json:
+        raise ValueError("Empty batch")
+    return input_json
 
 def predict_fn(input_object, model):
-    X = preprocess(input_object)
-    y_pred = model.predict(X)
+    if isinstance(input_object, np.ndarray):
+        batch, records = True, input_object
+        X = preprocess_matrix(records)
+    else:
+        batch = isinstance(input_object, list)
+        records = input_object if batch else [input_object]
+        X = preprocess_records(records)
+    # Chạy booster 1 lần: nhãn lấy từ probability so với ngưỡng (model.predict chạy lại booster với ngưỡng cố định 0.5)
     y_prob = model.predict_proba(X)[:, 1]
-    return {"prediction": int(y_pred[0]), "probability": float(y_prob[0])}
+    y_pred = y_prob > fraud_thresholds(records)
+    predictions = [
+        {"prediction": int(label), "probability": float(prob), "model_version": MODEL_VERSION}
+        for label, prob in zip(y_pred, y_prob)
+    ]
+    if batch:
+        return predictions
+    return predictions[0]
 
-def output_fn(prediction, content_type='application/json'):
-    return json.dumps(prediction)
+def output_fn(prediction, content_type=JSON_CONTENT_TYPE):
+    """
+    Định dạng kết quả theo Accept (thứ tự giống input):
+    application/json      : object (1 giao dịch) hoặc array
+    application/jsonlines : mỗi dòng 1 object
+    text/csv              : mỗi dòng "prediction,probability,model_version", không header
+    application/x-npy     : ma trận float64 (n, 2) [prediction, probability] (không có model_version)
+    """
+    content_type = media_type(content_type)
+    if content_type in (JSON_CONTENT_TYPE, '*/*'):
+        return json.dumps(prediction)
+    predictions = prediction if isinstance(prediction, list) else [prediction]
+    if content_type in JSON_LINES_CONTENT_TYPES:
+        return ''.join(json.dumps(p) + '\n' for p in predictions)
+    if content_type == CSV_CONTENT_TYPE:
+        return ''.join(f"{p['prediction']},{p['probability']!r},{p['model_version']}\n" for p in predictions)
+    if content_type == NPY_CONTENT_TYPE:
+        buffer = io.BytesIO()
+        np.save(buffer, np.array([[p['prediction'], p['probability']] for p in predictions], dtype=np.float64), allow_pickle=False)
+        return buffer.getvalue()
+    raise ValueError(f"Unsupported accept type: {content_type}")
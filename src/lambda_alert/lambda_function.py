@@ -1,10 +1,10 @@
 from datetime import datetime, timezone
 import time
-from typing import Any, Dict
-from sns_publisher import publish_alert   # chuẩn bị sẵn, dù phần 1 chưa gửi thật
+from typing import Any, Dict, List
+from sns_publisher import publish_alert, publish_alerts   # chuẩn bị sẵn, dù phần 1 chưa gửi thật
+from instrumentation import stage_timer
 
-def lambda_handler(event: dict, context: Any = None) -> dict:
-    # Event đến trực tiếp từ Lambda_FraudScoring
+def format_alert(event: dict) -> str:
     types: str = event.get("type", "unknown")
     device: str = event.get("nameDest", "unknown")
     user: str = event.get("nameOrig", "unknown")
@@ -14,9 +14,33 @@ def lambda_handler(event: dict, context: Any = None) -> dict:
     violated_rules: list = [k for k, v in violations.items() if v]
     violated_text: str = ", ".join(violated_rules) if violated_rules else "None"
 
-    # Format nội dung cảnh báo (SNS chỉ chấp nhận là string)
+    # Cảnh báo của khách hàng bị giữ lại trong ALERT_COALESCE_WINDOW_SECONDS kể từ cảnh báo trước (Lambda_FraudScoring gộp lại)
+    suppressed_note: str = (
+        f"Suppressed since previous alert: {event['suppressed_count']} alert(s), "
+        f"amount {event.get('suppressed_amount', 'unknown')} (window {event.get('coalesce_window_seconds', 'unknown')}s)\n"
+        if event.get("suppressed_count") else ""
+    )
 
-    alert_message: str = (
+    # Cảnh báo tổng hợp (Lambda_FraudScoring gộp nhiều giao dịch của cùng 1 khách hàng)
+    count: int = event.get("count", 1)
+    if count > 1:
+        return (
+            f"FRAUD ALERT ({count} transactions)\n"
+            f"-------------------------------------\n"
+            f"Types: {', '.join(event.get('types', [types]))}\n"
+            f"User: {user}\n"
+            f"Last Device =: {device}\n"
+            f"Total Amount =: {event.get('total_amount', 'unknown')}\n"
+            f"Max Probability =: {event.get('ai_probability', 'unknown')}\n"
+            f"Steps =: {event.get('first_step', 'unknown')} - {event.get('step', 'unknown')}\n"
+            f"Violated Rules: {violated_text}\n"
+            f"{suppressed_note}"
+            f"-------------------------------------\n"
+            f"These transactions were flagged by the automated fraud detection system."
+        )
+
+    # Format nội dung cảnh báo (SNS chỉ chấp nhận là string)
+    return (
         f"FRAUD ALERT\n"
         f"-------------------------------------\n"
         f"Type: {types}\n"
@@ -24,11 +48,52 @@ def lambda_handler(event: dict, context: Any = None) -> dict:
         f"Device =: {device}\n"
         f"Amount =: {amount}\n"
         f"Violated Rules: {violated_text}\n"
+        f"{suppressed_note}"
         f"-------------------------------------\n"
         f"This transaction was flagged by the automated fraud detection system."
     )
 
+def handle_alerts(alerts: List[dict]) -> dict:
+    # Nhiều cảnh báo trong 1 lần invoke => PublishBatch (10 cảnh báo / request SNS)
+    with stage_timer.stage("format"):
+        messages = [format_alert(alert) for alert in alerts]
+    failed = publish_alerts(messages)
+
+    if failed:
+        print(f"[SNS Publisher] SNS publish failed for {failed}/{len(alerts)} alerts")
+        return {
+            "statusCode": 500,
+            "body": {
+                "error": "Failed to send SNS alerts",
+                "sent": len(alerts) - failed,
+                "failed": failed
+            }
+        }
+
+    print(f"[SNS Publisher] SNS publish succeeded for {len(alerts)} alerts")
+    return {
+        "statusCode": 200,
+        "body": {
+            "message": "SNS alerts sent successfully",
+            "sent": len(alerts)
+        }
+    }
+
+def lambda_handler(event: dict, context: Any = None) -> dict:
+    # Event đến trực tiếp từ Lambda_FraudScoring: {"alerts": [...]} (cả batch) hoặc 1 cảnh báo
     print("Lambda start")
+    stage_timer.start()
+    try:
+        return handle_event(event)
+    finally:
+        stage_timer.emit()
+
+def handle_event(event: dict) -> dict:
+    if isinstance(event.get("alerts"), list):
+        return handle_alerts(event["alerts"])
+
+    with stage_timer.stage("format"):
+        alert_message: str = format_alert(event)
 
     # Publish notify to SNS
     success = publish_alert(alert_message)
@@ -1,9 +1,14 @@
 import os
+from typing import List
 import boto3
+from instrumentation import stage_timer
 
 AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
 sns_client = boto3.client("sns", region_name=AWS_REGION)
 
+# PublishBatch nhận tối đa 10 message / request
+SNS_BATCH_SIZE = 10
+
 def publish_alert(message: str):
     """
     Gửi cảnh báo đến SNS topic thực tế.
@@ -15,14 +20,47 @@ def publish_alert(message: str):
         return False
 
     try:
-        sns_client.publish(
-            TopicArn=topic_arn,
-            Subject="FRAUD ALERT",
-            Message=message
-        )
+        with stage_timer.stage("sns_publish"):
+            sns_client.publish(
+                TopicArn=topic_arn,
+                Subject="FRAUD ALERT",
+                Message=message
+            )
         print(f"[SNS Publisher] Alert sent to SNS topic: {topic_arn}")
         return True
     except Exception as e:
         print(f"[SNS Publisher] Failed to send SNS alert: {e}")
         return False
 
+def publish_alerts(messages: List[str]) -> int:
+    """
+    Gửi nhiều cảnh báo bằng PublishBatch (10 message / request) thay vì 1 publish / cảnh báo.
+    Trả về số cảnh báo gửi không thành công.
+    """
+    topic_arn = os.getenv("ALERT_TOPIC_ARN")
+
+    if not topic_arn:
+        print("[SNS Publisher] ALERT_TOPIC_ARN is not configured")
+        return len(messages)
+
+    failed = 0
+    for start in range(0, len(messages), SNS_BATCH_SIZE):
+        chunk = messages[start:start + SNS_BATCH_SIZE]
+        try:
+            with stage_timer.stage("sns_publish"):
+                response = sns_client.publish_batch(
+                    TopicArn=topic_arn,
+                    PublishBatchRequestEntries=[
+                        {"Id": str(i), "Subject": "FRAUD ALERT", "Message": message}
+                        for i, message in enumerate(chunk)
+                    ]
+                )
+            for entry in response.get("Failed", []):
+                print(f"[SNS Publisher] Failed to send SNS alert {entry.get('Id')}: {entry.get('Code')} {entry.get('Message')}")
+            failed += len(response.get("Failed", []))
+        except Exception as e:
+            print(f"[SNS Publisher] Failed to send SNS alert batch ({len(chunk)} alerts): {e}")
+            failed += len(chunk)
+
+    print(f"[SNS Publisher] {len(messages) - failed}/{len(messages)} alerts sent to SNS topic: {topic_arn}")
+    return failed
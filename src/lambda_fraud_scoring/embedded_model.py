@@ -0,0 +1,112 @@
+import os
+import hashlib
+import json
+import logging
+import time
+
+logger = logging.getLogger()
+
+# Thư mục chứa đúng 3 artifact của endpoint (xgb_fraud_model.json, scaler.pkl, feature_columns.pkl),
+# đóng gói cùng Lambda (thư mục model/) hoặc qua Lambda layer / container image.
+EMBEDDED_MODEL_DIR = os.environ.get('EMBEDDED_MODEL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model'))
+
+# Toàn bộ giá trị 'type' của PaySim, đúng thứ tự lúc train (get_dummies drop_first bỏ CASH_IN)
+TRANSACTION_TYPES = ['CASH_IN', 'CASH_OUT', 'DEBIT', 'PAYMENT', 'TRANSFER']
+
+ARTIFACT_FILES = ('xgb_fraud_model.json', 'scaler.pkl', 'feature_columns.pkl')
+
+# Ngưỡng gắn nhãn gian lận, cùng biến môi trường với inference.py (probability > ngưỡng => prediction = 1)
+# (cùng biến môi trường với merge.apply_thresholds của Lambda nên cho cùng nhãn)
+FRAUD_THRESHOLD = float(os.environ.get('FRAUD_THRESHOLD', '0.5'))
+FRAUD_THRESHOLDS_BY_TYPE = json.loads(os.environ.get('FRAUD_THRESHOLDS_BY_TYPE', '') or '{}')
+
+# Artifact được load 1 lần / container (lần chấm điểm đầu tiên)
+model = None
+scaler = None
+feature_columns = None
+# Hash nội dung 3 artifact: đổi model / scaler => version đổi (dùng làm key cho prediction cache, không kèm ngưỡng)
+model_version = None
+# Vị trí cột + tham số scaler, tính 1 lần khi load (xem preprocess_records)
+numeric_columns = None
+type_column_index = None
+scaler_mean = None
+scaler_scale = None
+
+def artifact_version(model_dir):
+    digest = hashlib.blake2b(digest_size=8)
+    for name in ARTIFACT_FILES:
+        with open(os.path.join(model_dir, name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def load_artifacts(model_dir=None):
+    """
+    Load model XGBoost + scaler + feature columns. xgboost / joblib chỉ được import ở đây
+    nên chế độ endpoint (mặc định) không tốn thời gian import các thư viện này.
+    """
+    global model, scaler, feature_columns, model_version
+    global numeric_columns, type_column_index, scaler_mean, scaler_scale
+    if model is not None:
+        return
+
+    import joblib
+    import xgboost as xgb
+
+    model_dir = model_dir or EMBEDDED_MODEL_DIR
+    start = time.perf_counter()
+    xgb_model = xgb.XGBClassifier()
+    xgb_model.load_model(os.path.join(model_dir, 'xgb_fraud_model.json'))
+    scaler = joblib.load(os.path.join(model_dir, 'scaler.pkl'))
+    feature_columns = joblib.load(os.path.join(model_dir, 'feature_columns.pkl'))
+    model_version = artifact_version(model_dir)
+    numeric_columns = [(index, column) for index, column in enumerate(feature_columns) if not column.startswith('type_')]
+    type_column_index = {
+        column[len('type_'):]: index
+        for index, column in enumerate(feature_columns)
+        if column.startswith('type_') and column[len('type_'):] in TRANSACTION_TYPES
+    }
+    scaler_mean = scaler.mean_ if scaler.with_mean else 0.0
+    scaler_scale = scaler.scale_ if scaler.with_std else 1.0
+    model = xgb_model
+    logger.info(f"Đã load model embedded (version {model_version}) từ {model_dir} trong {(time.perf_counter() - start) * 1000:.1f} ms")
+
+# Preprocess giống hệt sagemaker-deployment/inference.py (preprocess_records)
+# (parity với preprocess pandas của inference.py: benchmarks/bench_inference_preprocess.py)
+def preprocess_records(records):
+    """
+    Map list giao dịch thẳng vào mảng NumPy (n, len(feature_columns)) rồi scale tại chỗ, không qua pandas.
+    Field thiếu => 0, giá trị None => NaN, 'type' lạ => mọi cột type_* = 0.
+    """
+    import numpy as np
+
+    X = np.zeros((len(records), len(feature_columns)), dtype=np.float64)
+    for index, column in numeric_columns:
+        X[:, index] = [record.get(column, 0) for record in records]
+    for row, record in enumerate(records):
+        type_index = type_column_index.get(record['type'])
+        if type_index is not None:
+            X[row, type_index] = 1.0
+    X -= scaler_mean
+    X /= scaler_scale
+    return X
+
+def fraud_thresholds(records):
+    # Giống inference.py: 1 ngưỡng cho cả batch, hoặc mảng ngưỡng theo 'type' của từng dòng
+    if not FRAUD_THRESHOLDS_BY_TYPE:
+        return FRAUD_THRESHOLD
+    import numpy as np
+    return np.array([FRAUD_THRESHOLDS_BY_TYPE.get(record.get('type'), FRAUD_THRESHOLD) for record in records])
+
+def predict_batch(transactions):
+    """
+    Chấm điểm cả batch trong Lambda, trả về list {"prediction", "probability", "model_version"} theo đúng thứ tự
+    (cùng định dạng với output của endpoint).
+    """
+    load_artifacts()
+    X = preprocess_records(transactions)
+    y_prob = model.predict_proba(X)[:, 1]
+    y_pred = y_prob > fraud_thresholds(transactions)
+    return [
+        {"prediction": int(label), "probability": float(prob), "model_version": model_version}
+        for label, prob in zip(y_pred, y_prob)
+    ]
@@ -0,0 +1,141 @@
+"""
+Đo thời gian theo stage và gửi metric dạng CloudWatch Embedded Metric Format (EMF).
+
+File này được copy nguyên vẹn vào thư mục của cả 4 Lambda (mỗi Lambda deploy thành 1 zip riêng).
+Bản gốc: src/lambda_process_transaction/instrumentation.py; cdk synth (deploy_cdk/app.py, SHARED_MODULES)
+và benchmarks/bench_instrumentation.py báo lỗi khi các bản copy khác nhau.
+
+    from instrumentation import stage_timer
+
+    stage_timer.start()                      # đầu mỗi invocation
+    with stage_timer.stage("redis_rules"):   # mỗi lời gọi ra ngoài / bước xử lý
+        ...
+    stage_timer.emit()                       # cuối invocation: 1 dòng EMF cho mọi stage
+
+EMF là 1 dòng JSON in ra stdout: CloudWatch Logs tự tách thành metric, không cần gọi PutMetricData.
+METRICS_ENABLED=false => stage() / emit() không làm gì (không đo, không in).
+"""
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any, ContextManager, Dict, List, Optional
+
+# Biến môi trường
+METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_NAMESPACE: str = os.getenv("METRICS_NAMESPACE", "PayShield")
+METRICS_SERVICE: str = os.getenv("METRICS_SERVICE", os.getenv("AWS_LAMBDA_FUNCTION_NAME", "local"))
+
+
+def emit_metrics(
+    metrics: Dict[str, float],
+    unit: str = "Milliseconds",
+    dimensions: Optional[Dict[str, str]] = None,
+    namespace: str = METRICS_NAMESPACE,
+    properties: Optional[Dict[str, Any]] = None,
+) -> None:
+    """
+    In 1 dòng EMF: mỗi key trong metrics là 1 metric CloudWatch (cùng unit, cùng bộ dimension).
+    properties được lưu trong log (tìm được bằng Logs Insights) nhưng không thành metric.
+    """
+    if not METRICS_ENABLED or not metrics:
+        return
+    dimensions = dimensions if dimensions is not None else {"Service": METRICS_SERVICE}
+    print(json.dumps({
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": namespace,
+                "Dimensions": [list(dimensions)],
+                "Metrics": [{"Name": name, "Unit": unit} for name in metrics],
+            }],
+        },
+        **(properties or {}),
+        **dimensions,
+        **metrics,
+    }, default=str))
+
+
+class _Stage:
+    # context manager dạng class: rẻ hơn @contextmanager (không tạo generator mỗi lần đo)
+    __slots__ = ("timer", "name", "started")
+
+    def __init__(self, timer: "StageTimer", name: str) -> None:
+        self.timer = timer
+        self.name = name
+        self.started: float = 0.0
+
+    def __enter__(self) -> None:
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.timer.add(self.name, (time.perf_counter() - self.started) * 1000)
+
+
+_DISABLED_STAGE: ContextManager[None] = nullcontext()
+
+
+class StageTimer:
+    """
+    Cộng dồn thời gian (ms) và số lần gọi theo tên stage trong 1 invocation, an toàn khi nhiều luồng cùng ghi
+    (stage chạy song song thì thời gian là tổng của các luồng).
+    """
+
+    def __init__(self, service: str = METRICS_SERVICE, namespace: str = METRICS_NAMESPACE, enabled: bool = METRICS_ENABLED) -> None:
+        self.service: str = service
+        self.namespace: str = namespace
+        self.enabled: bool = enabled
+        self.totals: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.order: List[str] = []
+        self.lock = threading.Lock()
+        self.started_at: float = time.perf_counter()
+
+    def start(self) -> None:
+        if not self.enabled:
+            return
+        with self.lock:
+            self.totals, self.counts, self.order = {}, {}, []
+        self.started_at = time.perf_counter()
+
+    def add(self, name: str, elapsed_ms: float) -> None:
+        with self.lock:
+            if name not in self.totals:
+                self.totals[name] = 0.0
+                self.counts[name] = 0
+                self.order.append(name)
+            self.totals[name] += elapsed_ms
+            self.counts[name] += 1
+
+    def stage(self, name: str) -> ContextManager[None]:
+        if not self.enabled:
+            return _DISABLED_STAGE
+        return _Stage(self, name)
+
+    def summary(self) -> Dict[str, float]:
+        with self.lock:
+            return {name: round(self.totals[name], 3) for name in self.order}
+
+    def emit(self, properties: Optional[Dict[str, Any]] = None) -> Dict[str, float]:
+        """
+        In 1 dòng EMF gồm thời gian từng stage + total (từ lúc start()), số lần gọi mỗi stage nằm trong properties.
+        Trả về summary để caller log lại nếu cần.
+        """
+        if not self.enabled:
+            return {}
+        metrics = self.summary()
+        metrics["total"] = round((time.perf_counter() - self.started_at) * 1000, 3)
+        with self.lock:
+            calls = dict(self.counts)
+        emit_metrics(
+            metrics,
+            dimensions={"Service": self.service},
+            namespace=self.namespace,
+            properties={"stage_calls": calls, **(properties or {})},
+        )
+        return metrics
+
+
+# 1 timer / container, start() lại ở đầu mỗi invocation
+stage_timer: StageTimer = StageTimer()
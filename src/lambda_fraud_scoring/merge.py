@@ -3,9 +3,18 @@ import base64
 import logging
 import os
 import boto3
+from botocore.exceptions import BotoCoreError, ClientError
 from datetime import datetime
 from decimal import Decimal
 import uuid
+import hashlib
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from instrumentation import stage_timer
 
 # Cấu hình logging
 logger = logging.getLogger()
@@ -13,80 +22,482 @@ logger.setLevel(logging.INFO)
 
 # --- Bắt đầu phần code của dynamo_writer.py ---
 
-# Hàm trợ giúp để chuyển đổi float sang Decimal
-class DecimalEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, float):
-            # Chuyển đổi float sang string rồi sang Decimal
-            return Decimal(str(obj))
-        return super(DecimalEncoder, self).default(obj)
-
 try:
-    dynamodb = boto3.resource('dynamodb')
+    # boto3 resource không thread-safe => các thread ghi chunk dùng chung client của resource (client thread-safe,
+    # vẫn nhận Decimal / kiểu Python nhờ serializer của resource)
+    dynamodb = boto3.resource('dynamodb').meta.client
     DYNAMODB_TABLE_NAME = os.environ['DYNAMODB_TABLE_NAME']
-    table = dynamodb.Table(DYNAMODB_TABLE_NAME)
 except KeyError:
     logger.error("!!! Lỗi: Biến môi trường 'DYNAMODB_TABLE_NAME' chưa được set.")
     raise
 
-def write_transaction_result(item_to_save):
+def to_dynamodb(value):
     """
-    Ghi 1 item vào DynamoDB, xử lý float -> Decimal.
+    Chuyển float -> Decimal (đệ quy trong dict / list) trực tiếp, không cần dumps / loads JSON cả item.
+    Decimal(str(float)) cho cùng giá trị với json.loads(..., parse_float=Decimal) trước đây.
     """
-    try:
-        # Sử dụng json.loads với DecimalEncoder để chuyển đổi toàn bộ dict
-        item_decimal = json.loads(json.dumps(item_to_save), parse_float=Decimal)
-        
-        # Giả định 'nameOrig' là Partition Key và 'step' là Sort Key
-        table.put_item(Item=item_decimal)
-        logger.info(f"Đã ghi vào DynamoDB (PK): {item_decimal.get('transactionId')}")
-    
-    except Exception as e:
-        logger.error(f"Lỗi khi ghi vào DynamoDB cho item (PK: {item_to_save.get('transactionId')}): {e}")
-        # Không raise, để các record khác trong batch tiếp tục được xử lý
+    if isinstance(value, float):
+        return Decimal(str(value))
+    if isinstance(value, dict):
+        return {key: to_dynamodb(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [to_dynamodb(item) for item in value]
+    return value
+
+# BatchWriteItem nhận tối đa 25 item / request
+DYNAMODB_BATCH_SIZE = 25
+DYNAMODB_MAX_RETRIES = int(os.environ.get('DYNAMODB_MAX_RETRIES', '5'))
+DYNAMODB_BACKOFF_SECONDS = float(os.environ.get('DYNAMODB_BACKOFF_SECONDS', '0.05'))
+
+def _write_chunk(requests):
+    """
+    Ghi 1 chunk (<= 25 PutRequest) bằng BatchWriteItem; UnprocessedItems (bị throttle) và lỗi tạm thời
+    được retry với exponential backoff + jitter. Lỗi không retry được (ValidationException...) thì chia đôi chunk
+    để chỉ item hỏng bị từ chối.
+    Trả về (PutRequest chưa ghi được do lỗi tạm thời, PutRequest bị DynamoDB từ chối).
+    """
+    pending = requests
+    for attempt in range(DYNAMODB_MAX_RETRIES + 1):
+        if attempt:
+            time.sleep(DYNAMODB_BACKOFF_SECONDS * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+        try:
+            with stage_timer.stage('dynamodb_batch_write'):
+                response = dynamodb.batch_write_item(RequestItems={DYNAMODB_TABLE_NAME: pending})
+            pending = response.get('UnprocessedItems', {}).get(DYNAMODB_TABLE_NAME, [])
+        except Exception as e:
+            if not is_retryable_error(e):
+                logger.error(f"BatchWriteItem bị từ chối ({len(pending)} item, không retry): {e}")
+                if len(pending) == 1:
+                    return [], pending
+                middle = len(pending) // 2
+                left, right = _write_chunk(pending[:middle]), _write_chunk(pending[middle:])
+                return left[0] + right[0], left[1] + right[1]
+            logger.error(f"Lỗi BatchWriteItem ({len(pending)} item, lần thử {attempt + 1}): {e}")
+        if not pending:
+            return [], []
+    return pending, []
+
+def write_transaction_results(items, executor=None):
+    """
+    Ghi cả batch vào DynamoDB bằng BatchWriteItem (25 item / request, các chunk có thể chạy song song).
+    Trả về (set transactionId không ghi được sau khi đã retry hết số lần, set transactionId bị DynamoDB từ chối).
+    """
+    requests = [{'PutRequest': {'Item': to_dynamodb(item)}} for item in items]
+    chunks = [requests[start:start + DYNAMODB_BATCH_SIZE] for start in range(0, len(requests), DYNAMODB_BATCH_SIZE)]
+    if executor is not None and len(chunks) > 1:
+        outcomes = list(executor.map(_write_chunk, chunks))
+    else:
+        outcomes = list(map(_write_chunk, chunks))
+
+    failed = {request['PutRequest']['Item']['transactionId'] for leftover, _ in outcomes for request in leftover}
+    rejected = {request['PutRequest']['Item']['transactionId'] for _, invalid in outcomes for request in invalid}
+    if failed:
+        logger.error(f"Không ghi được {len(failed)}/{len(items)} item vào DynamoDB sau {DYNAMODB_MAX_RETRIES} lần retry")
+    if rejected:
+        logger.error(f"DynamoDB từ chối {len(rejected)}/{len(items)} item (không retry)")
+    if not failed and not rejected:
+        logger.info(f"Đã ghi {len(items)} item vào DynamoDB")
+    return failed, rejected
 
 # --- Kết thúc phần code của dynamo_writer.py ---
 
 
 # --- Bắt đầu phần code của sagemaker_client.py ---
 
+# "endpoint": gọi SageMaker Endpoint (mặc định)
+# "embedded": chấm điểm ngay trong Lambda bằng cùng artifact của endpoint (xem embedded_model.py)
+SCORING_MODE = os.environ.get('SCORING_MODE', 'endpoint')
+
 try:
     sagemaker_runtime = boto3.client('sagemaker-runtime')
-    SAGEMAKER_ENDPOINT_NAME = os.environ['SAGEMAKER_ENDPOINT_NAME']
+    SAGEMAKER_ENDPOINT_NAME = os.environ['SAGEMAKER_ENDPOINT_NAME'] if SCORING_MODE == 'endpoint' else os.environ.get('SAGEMAKER_ENDPOINT_NAME')
 except KeyError:
     logger.error("!!! Lỗi: Biến môi trường 'SAGEMAKER_ENDPOINT_NAME' chưa được set.")
     raise
 
-def get_fraud_prediction(transaction_data):
+# Ngưỡng gắn nhãn gian lận (probability > ngưỡng => ai_prediction_label = 1), áp lên probability mà endpoint / embedded trả về
+# => đổi ngưỡng chỉ cần đổi cấu hình Lambda (không deploy lại endpoint), prediction cache vẫn dùng được
+# Ngưỡng riêng theo 'type', JSON dạng {"TRANSFER": 0.3, "CASH_OUT": 0.4}; type không có trong đây dùng FRAUD_THRESHOLD
+FRAUD_THRESHOLD = float(os.environ.get('FRAUD_THRESHOLD', '0.5'))
+FRAUD_THRESHOLDS_BY_TYPE = json.loads(os.environ.get('FRAUD_THRESHOLDS_BY_TYPE', '') or '{}')
+
+def apply_thresholds(transactions, results):
     """
-    Gửi dữ liệu giao dịch (JSON thô) đến SageMaker Endpoint.
+    Gắn lại nhãn theo ngưỡng của Lambda (nhãn của endpoint / cache bị bỏ qua). Kết quả lỗi giữ nguyên.
     """
-    payload = json.dumps(transaction_data)
+    labeled = []
+    for transaction_data, result in zip(transactions, results):
+        if 'error_message' in result:
+            labeled.append(result)
+            continue
+        threshold = FRAUD_THRESHOLDS_BY_TYPE.get(transaction_data.get('type'), FRAUD_THRESHOLD)
+        labeled.append(dict(result, prediction=int(result['probability'] > threshold)))
+    return labeled
 
-    try:
-        response = sagemaker_runtime.invoke_endpoint(
-            EndpointName=SAGEMAKER_ENDPOINT_NAME,
-            ContentType='application/json',
-            Body=payload
+# Số giao dịch tối đa trong 1 lần invoke_endpoint (payload của SageMaker bị giới hạn 6 MB)
+SAGEMAKER_BATCH_SIZE = int(os.environ.get('SAGEMAKER_BATCH_SIZE', '100'))
+# Định dạng gửi batch lên endpoint (inference.py hỗ trợ cả 3, response dùng cùng định dạng):
+# "application/json" (mặc định) | "application/jsonlines" | "text/csv" (chỉ gửi MODEL_FIELDS => payload nhỏ nhất)
+SAGEMAKER_CONTENT_TYPE = os.environ.get('SAGEMAKER_CONTENT_TYPE', 'application/json')
+
+def encode_chunk(chunk, content_type):
+    if content_type == 'application/jsonlines':
+        return ''.join(json.dumps(transaction_data) + '\n' for transaction_data in chunk)
+    if content_type == 'text/csv':
+        # CSV không header (Lambda không bao giờ gửi header), cột theo MODEL_FIELDS (cùng thứ tự INPUT_COLUMNS của inference.py),
+        # thiếu / None => ô trống, inference.py coi như field thiếu (0) giống JSON
+        return ''.join(
+            ','.join('' if transaction_data.get(field) is None else str(transaction_data[field]) for field in MODEL_FIELDS) + '\n'
+            for transaction_data in chunk
         )
-        
-        # Đọc kết quả
-        result_body = response['Body'].read().decode('utf-8')
-        result_dict = json.loads(result_body)
-        
-        # Kết quả trả về (do inference.py định nghĩa): 
-        # Ví dụ: {"pred_label": 1, "probability": 0.95}
-        logger.info(f"SageMaker result: {result_dict}")
-        return result_dict
+    return json.dumps(chunk)
+
+def decode_results(body, content_type):
+    if content_type == 'application/jsonlines':
+        return [json.loads(line) for line in body.splitlines() if line.strip()]
+    if content_type == 'text/csv':
+        results = []
+        for line in body.splitlines():
+            if line:
+                label, probability, model_version = line.split(',', 2)
+                results.append({"prediction": int(label), "probability": float(probability), "model_version": model_version})
+        return results
+    return json.loads(body)
+
+# Lỗi endpoint có thể thành công khi retry (throttle, 5xx, model đang khởi động); timeout / mất kết nối (BotoCoreError) cũng retry.
+# Còn lại (ModelError 424, ValidationError 4xx, kết quả sai định dạng...) là lỗi do dữ liệu => không retry
+RETRYABLE_ERROR_CODES = {
+    'ThrottlingException', 'Throttling', 'TooManyRequestsException', 'ServiceUnavailable',
+    'InternalFailure', 'InternalDependencyException', 'ModelNotReadyException',
+    # DynamoDB (BatchWriteItem)
+    'ProvisionedThroughputExceededException', 'RequestLimitExceeded', 'InternalServerError',
+}
+
+def is_retryable_error(e):
+    if isinstance(e, ClientError):
+        code = e.response.get('Error', {}).get('Code', '')
+        status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+        return code in RETRYABLE_ERROR_CODES or status == 429 or status >= 500
+    return isinstance(e, BotoCoreError)
+
+def error_results(transactions, e, retryable):
+    # Kết quả mặc định khi chấm điểm lỗi: retryable => record được báo trong batchItemFailures,
+    # ngược lại ghi item -1 (ai_error) để 1 giao dịch hỏng không chặn shard mãi
+    return [{"pred_label": -1, "probability": -1.0, "error_message": str(e), "retryable": retryable} for _ in transactions]
+
+def _predict_chunk(chunk):
+    try:
+        with stage_timer.stage('endpoint_call'):
+            response = sagemaker_runtime.invoke_endpoint(
+                EndpointName=SAGEMAKER_ENDPOINT_NAME,
+                ContentType=SAGEMAKER_CONTENT_TYPE,
+                Accept=SAGEMAKER_CONTENT_TYPE,
+                Body=encode_chunk(chunk, SAGEMAKER_CONTENT_TYPE)
+            )
+        chunk_results = decode_results(response['Body'].read().decode('utf-8'), SAGEMAKER_CONTENT_TYPE)
+        if not isinstance(chunk_results, list) or len(chunk_results) != len(chunk):
+            raise ValueError(f"Endpoint trả về {len(chunk_results) if isinstance(chunk_results, list) else 'non-list'} kết quả cho {len(chunk)} giao dịch")
+        logger.info(f"SageMaker batch result: {len(chunk_results)} giao dịch")
+        return chunk_results
+
+    except Exception as e:
+        retryable = is_retryable_error(e)
+        logger.error(f"Lỗi khi gọi SageMaker cho batch {len(chunk)} giao dịch (retryable={retryable}): {e}")
+        if not retryable and len(chunk) > 1:
+            # lỗi do dữ liệu: chia đôi chunk để chỉ giao dịch hỏng nhận kết quả -1, phần còn lại vẫn được chấm điểm
+            middle = len(chunk) // 2
+            return _predict_chunk(chunk[:middle]) + _predict_chunk(chunk[middle:])
+        return error_results(chunk, e, retryable)
+
+def _predict_embedded(transactions):
+    import embedded_model
+    try:
+        embedded_model.load_artifacts()
+    except Exception as e:
+        # không load được artifact: không phải lỗi của giao dịch => retry
+        logger.error(f"Lỗi khi load model embedded: {e}")
+        return error_results(transactions, e, True)
+
+    try:
+        with stage_timer.stage('embedded_predict'):
+            return embedded_model.predict_batch(transactions)
 
     except Exception as e:
-        logger.error(f"Lỗi khi gọi SageMaker cho nameOrig {transaction_data.get('nameOrig')}: {e}")
-        # Trả về kết quả mặc định nếu lỗi
-        return {"pred_label": -1, "probability": -1.0, "error_message": str(e)}
+        logger.error(f"Lỗi khi chấm điểm embedded cho batch {len(transactions)} giao dịch: {e}")
+        if len(transactions) > 1:
+            middle = len(transactions) // 2
+            return _predict_embedded(transactions[:middle]) + _predict_embedded(transactions[middle:])
+        return error_results(transactions, e, False)
+
+def get_fraud_predictions(transactions, executor=None):
+    """
+    Chấm điểm nhiều giao dịch: gửi batch (JSON array / JSON Lines / CSV theo SAGEMAKER_CONTENT_TYPE) theo từng chunk SAGEMAKER_BATCH_SIZE giao dịch
+    (inference.py trả về list kết quả theo đúng thứ tự), thay vì 1 invoke_endpoint / giao dịch.
+    Có executor thì các chunk được gọi song song.
+    SCORING_MODE=embedded: chấm cả batch trong Lambda, không gọi endpoint.
+    """
+    if SCORING_MODE == 'embedded':
+        return _predict_embedded(transactions) if transactions else []
+
+    chunks = [transactions[start:start + SAGEMAKER_BATCH_SIZE] for start in range(0, len(transactions), SAGEMAKER_BATCH_SIZE)]
+    if executor is not None and len(chunks) > 1:
+        chunk_results = executor.map(_predict_chunk, chunks)
+    else:
+        chunk_results = map(_predict_chunk, chunks)
+    return [result for chunk in chunk_results for result in chunk]
 
 # --- Kết thúc phần code của sagemaker_client.py ---
 
 
+# --- Bắt đầu phần code của prediction_cache.py ---
+
+# Cache kết quả chấm điểm: giao dịch lặp lại (retry, replay, thanh toán định kỳ giống hệt nhau) không phải chấm lại
+PREDICTION_CACHE_ENABLED = os.environ.get('PREDICTION_CACHE_ENABLED', 'true').lower() == 'true'
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', '10000'))
+PREDICTION_CACHE_TTL_SECONDS = int(os.environ.get('PREDICTION_CACHE_TTL_SECONDS', '3600'))
+# Tầng Redis dùng chung giữa các container (tuỳ chọn, để trống = chỉ cache trong container)
+PREDICTION_CACHE_REDIS_HOST = os.environ.get('PREDICTION_CACHE_REDIS_HOST', '')
+PREDICTION_CACHE_REDIS_PORT = int(os.environ.get('PREDICTION_CACHE_REDIS_PORT', '6379'))
+# Version cấu hình của model sau endpoint (mặc định: tên endpoint). Model mới deploy lên cùng endpoint được nhận ra
+# tự động qua model_version mà inference.py trả về cùng kết quả. Endpoint không trả model_version thì chỉ cache khi MODEL_VERSION được set.
+# Chế độ embedded dùng hash của artifact (embedded_model.model_version).
+# Nhãn luôn được tính lại từ probability theo FRAUD_THRESHOLD* của Lambda (apply_thresholds) => đổi ngưỡng không cần đổi version
+MODEL_VERSION = os.environ.get('MODEL_VERSION', '')
+
+# Các field inference.py thực sự dùng để tính feature (nameOrig / nameDest / isFlaggedFraud không ảnh hưởng kết quả)
+MODEL_FIELDS = ('step', 'type', 'amount', 'oldbalanceOrg', 'newbalanceOrig', 'oldbalanceDest', 'newbalanceDest')
+PREDICTION_CACHE_KEY_PREFIX = 'prediction'
+
+def current_model_version():
+    if SCORING_MODE == 'embedded':
+        import embedded_model
+        embedded_model.load_artifacts()
+        return embedded_model.model_version
+    return MODEL_VERSION or SAGEMAKER_ENDPOINT_NAME
+
+def prediction_cache_key(transaction_data, model_version):
+    fields = json.dumps([transaction_data.get(field) for field in MODEL_FIELDS], default=str)
+    digest = hashlib.blake2b(f"{model_version}|{fields}".encode('utf-8'), digest_size=16).hexdigest()
+    return f"{PREDICTION_CACHE_KEY_PREFIX}:{digest}"
+
+class PredictionCache:
+    """
+    LRU + TTL trong container (OrderedDict), thêm tầng Redis (tuỳ chọn) dùng chung giữa các container.
+    Key gồm cả model version cấu hình => đổi MODEL_VERSION thì key cũ không còn được đọc tới.
+    served_version: model_version mà endpoint / model trả về gần nhất (lưu cả trên Redis cho container mới):
+    kết quả cache khác served_version bị bỏ qua, endpoint trả version mới => xoá cache trong container.
+    Cache trong container bị xoá ngay khi thấy version đổi, key cũ trên Redis tự hết hạn theo TTL.
+    Chỉ cache kết quả chấm điểm thành công.
+    """
+    def __init__(self, max_size=PREDICTION_CACHE_SIZE, ttl_seconds=PREDICTION_CACHE_TTL_SECONDS, redis_client=None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.redis_client = redis_client
+        self.entries = OrderedDict() # key -> (hết hạn lúc, kết quả)
+        self.lock = threading.Lock()
+        self.model_version = None
+        self.served_version = None
+        # counters (cộng dồn trong container)
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def check_version(self, model_version):
+        with self.lock:
+            if model_version != self.model_version:
+                if self.model_version is not None:
+                    logger.info(f"Model version đổi {self.model_version} -> {model_version}, xoá prediction cache")
+                    self.invalidations += 1
+                self.entries.clear()
+                self.model_version = model_version
+
+    def load_served_version(self, served_key):
+        # container mới: đọc model_version mà các container khác đã thấy (1 lần / container)
+        if self.served_version is not None or self.redis_client is None:
+            return
+        try:
+            with stage_timer.stage('prediction_cache_redis'):
+                served_version = self.redis_client.get(served_key)
+        except Exception as e:
+            logger.error(f"Lỗi khi đọc served model version từ Redis: {e}")
+            return
+        with self.lock:
+            if self.served_version is None:
+                self.served_version = served_version
+
+    def observe_version(self, served_version, served_key):
+        """
+        Ghi nhận model_version trả về cùng kết quả chấm điểm. Trả về True nếu version đổi (cache trong container bị xoá).
+        """
+        with self.lock:
+            if served_version == self.served_version:
+                return False
+            if self.served_version is not None:
+                logger.info(f"Endpoint trả model version mới {self.served_version} -> {served_version}, xoá prediction cache")
+                self.invalidations += 1
+            self.entries.clear()
+            self.served_version = served_version
+        if self.redis_client is not None:
+            try:
+                self.redis_client.set(served_key, served_version, ex=self.ttl_seconds)
+            except Exception as e:
+                logger.error(f"Lỗi khi ghi served model version lên Redis: {e}")
+        return True
+
+    def is_fresh(self, result):
+        # chưa biết version endpoint đang phục vụ (chưa chấm điểm lần nào) => tạm tin kết quả cache
+        return self.served_version is None or result.get('model_version') == self.served_version
+
+    def get_many(self, keys):
+        """
+        Trả về {key: (kết quả, 'local' | 'redis')} cho các key có trong cache.
+        """
+        found = {}
+        now = time.monotonic()
+        with self.lock:
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry is None:
+                    continue
+                if entry[0] <= now:
+                    del self.entries[key]
+                    continue
+                self.entries.move_to_end(key)
+                found[key] = (entry[1], 'local')
+
+        missing = [key for key in keys if key not in found]
+        if self.redis_client is not None and missing:
+            try:
+                with stage_timer.stage('prediction_cache_redis'):
+                    values = self.redis_client.mget(missing)
+                remote = {key: json.loads(value) for key, value in zip(missing, values) if value is not None}
+            except Exception as e:
+                logger.error(f"Lỗi khi đọc prediction cache từ Redis, bỏ qua tầng Redis: {e}")
+                remote = {}
+            self._put_local(remote)
+            found.update((key, (result, 'redis')) for key, result in remote.items())
+        return found
+
+    def _put_local(self, results):
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self.lock:
+            for key, result in results.items():
+                self.entries[key] = (expires_at, result)
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def put_many(self, results):
+        if not results:
+            return
+        self._put_local(results)
+        if self.redis_client is not None:
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                for key, result in results.items():
+                    pipe.set(key, json.dumps(result), ex=self.ttl_seconds)
+                with stage_timer.stage('prediction_cache_redis'):
+                    pipe.execute()
+            except Exception as e:
+                logger.error(f"Lỗi khi ghi prediction cache lên Redis: {e}")
+
+    def record(self, local_hits, redis_hits, misses):
+        with self.lock:
+            self.local_hits += local_hits
+            self.redis_hits += redis_hits
+            self.misses += misses
+
+    def counters(self):
+        lookups = self.local_hits + self.redis_hits + self.misses
+        return {
+            'local_hits': self.local_hits,
+            'redis_hits': self.redis_hits,
+            'misses': self.misses,
+            'hit_ratio': round((self.local_hits + self.redis_hits) / lookups, 4) if lookups else 0.0,
+            'size': len(self.entries),
+            'invalidations': self.invalidations,
+        }
+
+def create_prediction_cache():
+    if not PREDICTION_CACHE_ENABLED:
+        return None
+    redis_client = None
+    if PREDICTION_CACHE_REDIS_HOST:
+        # chỉ cần gói redis khi bật tầng Redis
+        import redis
+        redis_client = redis.Redis(
+            host=PREDICTION_CACHE_REDIS_HOST,
+            port=PREDICTION_CACHE_REDIS_PORT,
+            decode_responses=True,
+            ssl=True,
+            socket_timeout=0.2,
+            socket_connect_timeout=0.5,
+        )
+    return PredictionCache(redis_client=redis_client)
+
+# Tạo 1 lần / container, dùng lại giữa các lần invoke
+prediction_cache = create_prediction_cache()
+
+def get_cached_predictions(transactions, executor=None):
+    """
+    Như get_fraud_predictions nhưng đọc cache trước: chỉ giao dịch chưa có trong cache mới được chấm điểm,
+    giao dịch giống hệt nhau trong cùng batch chỉ chấm 1 lần. Trả về kết quả theo đúng thứ tự.
+    """
+    if prediction_cache is None or not transactions:
+        return get_fraud_predictions(transactions, executor)
+    try:
+        model_version = current_model_version()
+        prediction_cache.check_version(model_version)
+        keys = [prediction_cache_key(transaction_data, model_version) for transaction_data in transactions]
+    except Exception as e:
+        logger.error(f"Không dùng được prediction cache cho batch này: {e}")
+        return get_fraud_predictions(transactions, executor)
+
+    served_key = f"{PREDICTION_CACHE_KEY_PREFIX}:served_version:{hashlib.blake2b(model_version.encode('utf-8'), digest_size=8).hexdigest()}"
+    prediction_cache.load_served_version(served_key)
+
+    # giao dịch đầu tiên của mỗi key
+    first = {}
+    for key, transaction_data in zip(keys, transactions):
+        first.setdefault(key, transaction_data)
+
+    def score(score_keys):
+        return dict(zip(score_keys, get_fraud_predictions([first[key] for key in score_keys], executor))) if score_keys else {}
+
+    cached = {key: hit for key, hit in prediction_cache.get_many(list(first)).items() if prediction_cache.is_fresh(hit[0])}
+    scored = score([key for key in first if key not in cached])
+
+    # model_version trả về cùng kết quả mới: đổi => model mới đã được deploy, kết quả cache của batch này cũng phải chấm lại
+    served_versions = {result.get('model_version') for result in scored.values() if 'error_message' not in result}
+    if len(served_versions) == 1 and None not in served_versions:
+        if prediction_cache.observe_version(served_versions.pop(), served_key):
+            stale = [key for key, hit in cached.items() if not prediction_cache.is_fresh(hit[0])]
+            for key in stale:
+                del cached[key]
+            scored.update(score(stale))
+    elif len(served_versions) > 1:
+        # đang rolling deploy (2 version cùng phục vụ): không cache gì cho tới khi chỉ còn 1 version
+        logger.info(f"Endpoint trả nhiều model version {served_versions}, không cache batch này")
+
+    def cacheable(result):
+        if 'error_message' in result:
+            return False
+        if result.get('model_version') is None:
+            # endpoint không trả version: chỉ cache khi MODEL_VERSION được set (đổi thủ công khi deploy)
+            return bool(MODEL_VERSION)
+        return len(served_versions) <= 1 and result['model_version'] == prediction_cache.served_version
+
+    prediction_cache.put_many({key: result for key, result in scored.items() if cacheable(result)})
+
+    redis_hits = sum(1 for key in keys if cached.get(key, (None, None))[1] == 'redis')
+    prediction_cache.record(len(keys) - len(scored) - redis_hits, redis_hits, len(scored))
+    results = {**{key: hit[0] for key, hit in cached.items()}, **scored}
+    return [results[key] for key in keys]
+
+# --- Kết thúc phần code của prediction_cache.py ---
+
+
 # --- Bắt đầu phần code của alert_invoker.py ---
 
 try:
@@ -96,96 +507,434 @@ except KeyError:
     logger.error("!!! Lỗi: Biến môi trường 'ALERT_LAMBDA_NAME' chưa được set.")
     raise
 
-def trigger_alert(alert_payload):
+# Số cảnh báo tối đa trong 1 lần invoke Lambda_Alert (payload invoke bất đồng bộ bị giới hạn 256 KB)
+ALERT_BATCH_SIZE = int(os.environ.get('ALERT_BATCH_SIZE', '100'))
+# Cửa sổ gộp cảnh báo theo nameOrig (giây): khách hàng đã được cảnh báo trong cửa sổ thì cảnh báo mới bị giữ lại
+# (không gửi SNS), số cảnh báo bị giữ lại được gắn vào cảnh báo kế tiếp sau khi hết cửa sổ => tối đa 1 cảnh báo / cửa sổ.
+# 0 = gửi mọi cảnh báo (giao dịch của cùng khách hàng trong 1 batch Kinesis luôn được gộp thành 1 cảnh báo)
+ALERT_COALESCE_WINDOW_SECONDS = float(os.environ.get('ALERT_COALESCE_WINDOW_SECONDS', '60'))
+# Thời gian giữ số cảnh báo bị giữ lại chờ cảnh báo kế tiếp (giây)
+ALERT_SUPPRESSED_TTL_SECONDS = int(os.environ.get('ALERT_SUPPRESSED_TTL_SECONDS', '86400'))
+# Redis lưu mốc "đã cảnh báo" + số cảnh báo bị giữ lại, dùng chung giữa các container (mặc định dùng chung Redis
+# của prediction cache, để trống = lưu trong container)
+ALERT_REDIS_HOST = os.environ.get('ALERT_REDIS_HOST', PREDICTION_CACHE_REDIS_HOST)
+ALERT_REDIS_PORT = int(os.environ.get('ALERT_REDIS_PORT', str(PREDICTION_CACHE_REDIS_PORT)))
+ALERT_SENT_KEY_PREFIX = 'alert:sent'
+ALERT_SUPPRESSED_KEY_PREFIX = 'alert:suppressed'
+
+def trigger_alerts(alerts):
     """
-    Kích hoạt Lambda_Alert (bất đồng bộ).
+    Kích hoạt Lambda_Alert (bất đồng bộ) 1 lần cho cả list cảnh báo: payload {"alerts": [...]}.
     """
     try:
-        lambda_client.invoke(
-            FunctionName=ALERT_LAMBDA_NAME,
-            InvocationType='Event', # Bất đồng bộ (fire-and-forget)
-            Payload=json.dumps(alert_payload)
-        )
-        logger.info(f"Đã kích hoạt Lambda_Alert cho: {alert_payload.get('nameOrig')}")
+        with stage_timer.stage('alert_invoke'):
+            lambda_client.invoke(
+                FunctionName=ALERT_LAMBDA_NAME,
+                InvocationType='Event', # Bất đồng bộ (fire-and-forget)
+                Payload=json.dumps({'alerts': alerts})
+            )
+        logger.info(f"Đã kích hoạt Lambda_Alert cho {len(alerts)} cảnh báo")
     
     except Exception as e:
-        logger.error(f"Lỗi khi kích hoạt Lambda_Alert: {e}")
+        logger.error(f"Lỗi khi kích hoạt Lambda_Alert ({len(alerts)} cảnh báo): {e}")
+        # ném lại để record được báo trong batchItemFailures và retry
+        raise
+
+def summarize_alerts(customer_id, alerts):
+    """
+    Gộp các cảnh báo của 1 khách hàng thành 1 cảnh báo tổng hợp.
+    Giữ nguyên các field của cảnh báo đơn lẻ (theo giao dịch mới nhất) để Lambda_Alert cũ vẫn đọc được.
+    """
+    if len(alerts) == 1:
+        return dict(alerts[0], count=1, transactionIds=[alerts[0]['transactionId']])
+    probability = max(alert['ai_probability'] for alert in alerts)
+    summary = dict(alerts[-1])
+    summary.update({
+        'count': len(alerts),
+        'transactionIds': [alert['transactionId'] for alert in alerts],
+        'total_amount': sum(float(alert.get('amount') or 0) for alert in alerts),
+        'types': sorted({str(alert.get('type')) for alert in alerts}),
+        'first_step': alerts[0].get('step'),
+        'ai_probability': probability,
+        'message': f"Nghi ngờ gian lận {len(alerts)} giao dịch (Prob cao nhất: {probability*100:.2f}%) cho KH {customer_id}."
+    })
+    return summary
+
+class AlertCoalescer:
+    """
+    Gộp cảnh báo theo nameOrig:
+      - mọi giao dịch gian lận của 1 khách hàng trong cùng batch => 1 cảnh báo tổng hợp
+      - khách hàng đã được cảnh báo trong window_seconds gần đây => không gửi, chỉ cộng vào số cảnh báo bị giữ lại;
+        cảnh báo đầu tiên sau khi hết cửa sổ mang theo suppressed_count / suppressed_amount rồi đặt lại về 0
+    Cảnh báo được gửi luôn được gửi ngay trong lần invoke này (không giữ sang lần invoke sau: Lambda không gắn shard
+    với container, container có thể bị thu hồi).
+    Mốc "đã cảnh báo" (SET NX EX) và số bị giữ lại (hash) nằm trên Redis nếu có (dùng chung giữa các container),
+    ngược lại trong container.
+    """
+    def __init__(self, window_seconds=ALERT_COALESCE_WINDOW_SECONDS, redis_client=None):
+        self.window_seconds = window_seconds
+        self.redis_client = redis_client
+        self.last_sent = {} # nameOrig -> thời điểm cảnh báo gần nhất (monotonic), khi không có Redis
+        self.suppressed = {} # nameOrig -> [số cảnh báo, tổng tiền] bị giữ lại, khi không có Redis
+        self.lock = threading.Lock()
+        # counters (cộng dồn trong container)
+        self.flagged = 0
+        self.sent = 0
+        self.suppressed_alerts = 0
+
+    def sent_key(self, customer_id):
+        return f"{ALERT_SENT_KEY_PREFIX}:{customer_id}"
+
+    def suppressed_key(self, customer_id):
+        return f"{ALERT_SUPPRESSED_KEY_PREFIX}:{customer_id}"
+
+    def claim(self, customer_ids, now):
+        """
+        Đặt mốc "đã cảnh báo" cho các khách hàng, trả về set khách hàng vừa được đặt mốc (SET NX thành công) => được gửi.
+        Khách hàng còn lại đang trong cửa sổ của cảnh báo trước => bị giữ lại.
+        Redis lỗi => dùng mốc trong container.
+        """
+        if self.window_seconds <= 0 or not customer_ids:
+            return set(customer_ids)
+        if self.redis_client is not None:
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                for customer_id in customer_ids:
+                    pipe.set(self.sent_key(customer_id), 1, nx=True, ex=max(1, int(math.ceil(self.window_seconds))))
+                return {customer_id for customer_id, created in zip(customer_ids, pipe.execute()) if created}
+            except Exception as e:
+                logger.warning(f"Lỗi Redis khi đánh dấu cảnh báo, dùng mốc trong container: {e}")
+        with self.lock:
+            created = {c for c in customer_ids if now - self.last_sent.get(c, float('-inf')) >= self.window_seconds}
+            for customer_id in created:
+                self.last_sent[customer_id] = now
+            # bỏ khách hàng đã hết cửa sổ để bộ nhớ không tăng mãi
+            if len(self.last_sent) > 10000:
+                self.last_sent = {c: t for c, t in self.last_sent.items() if now - t < self.window_seconds}
+        return created
+
+    def suppress(self, totals):
+        """
+        totals: {nameOrig: (số cảnh báo, tổng tiền)} của khách hàng đang trong cửa sổ => cộng vào số cảnh báo bị giữ lại.
+        Redis lỗi => cộng trong container (chỉ container này gắn được vào cảnh báo kế tiếp).
+        """
+        if not totals:
+            return
+        if self.redis_client is not None:
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                for customer_id, (count, amount) in totals.items():
+                    key = self.suppressed_key(customer_id)
+                    pipe.hincrby(key, 'count', count)
+                    pipe.hincrbyfloat(key, 'amount', amount)
+                    pipe.expire(key, ALERT_SUPPRESSED_TTL_SECONDS)
+                pipe.execute()
+                return
+            except Exception as e:
+                logger.warning(f"Lỗi Redis khi ghi số cảnh báo bị giữ lại, giữ trong container: {e}")
+        with self.lock:
+            for customer_id, (count, amount) in totals.items():
+                entry = self.suppressed.setdefault(customer_id, [0, 0.0])
+                entry[0] += count
+                entry[1] += amount
+
+    def take_suppressed(self, customer_ids):
+        # lấy (và xoá) số cảnh báo bị giữ lại của các khách hàng sắp được cảnh báo: {nameOrig: (số cảnh báo, tổng tiền)}
+        taken = {}
+        if not customer_ids:
+            return taken
+        if self.redis_client is not None:
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                for customer_id in customer_ids:
+                    pipe.hgetall(self.suppressed_key(customer_id))
+                    pipe.delete(self.suppressed_key(customer_id))
+                replies = pipe.execute()
+                for customer_id, values in zip(customer_ids, replies[::2]):
+                    if values:
+                        taken[customer_id] = (int(values.get('count', 0)), float(values.get('amount', 0)))
+            except Exception as e:
+                logger.warning(f"Lỗi Redis khi đọc số cảnh báo bị giữ lại: {e}")
+        with self.lock:
+            for customer_id in customer_ids:
+                count, amount = self.suppressed.pop(customer_id, (0, 0.0))
+                if count:
+                    previous_count, previous_amount = taken.get(customer_id, (0, 0.0))
+                    taken[customer_id] = (previous_count + count, previous_amount + amount)
+        return taken
+
+    def release(self, summaries):
+        """
+        Gửi lỗi: xoá mốc mà batch này vừa đặt (chỉ gồm khách hàng claim() trả về, mốc có sẵn từ trước không bị xoá)
+        và trả lại số cảnh báo bị giữ lại đã gắn vào cảnh báo => lần retry được gửi lại như cũ.
+        """
+        if self.window_seconds <= 0 or not summaries:
+            return
+        customer_ids = [summary['nameOrig'] for summary in summaries]
+        restored = {
+            summary['nameOrig']: (summary['suppressed_count'], summary['suppressed_amount'])
+            for summary in summaries if summary.get('suppressed_count')
+        }
+        if self.redis_client is not None:
+            try:
+                self.redis_client.delete(*[self.sent_key(customer_id) for customer_id in customer_ids])
+                self.suppress(restored)
+                return
+            except Exception as e:
+                logger.warning(f"Lỗi Redis khi xoá mốc cảnh báo: {e}")
+        with self.lock:
+            for customer_id in customer_ids:
+                self.last_sent.pop(customer_id, None)
+        self.suppress(restored)
+
+    def collect(self, alerts, now=None):
+        """
+        alerts: list (record Kinesis, cảnh báo) theo thứ tự Kinesis.
+        Trả về list (cảnh báo tổng hợp, record Kinesis cần retry nếu gửi lỗi), mỗi khách hàng được gửi 1 phần tử.
+        Khách hàng đang trong cửa sổ không có trong list (đã được cộng vào số cảnh báo bị giữ lại).
+        """
+        now = time.monotonic() if now is None else now
+        groups = OrderedDict()
+        for record, alert in alerts:
+            groups.setdefault(alert['nameOrig'], []).append((record, alert))
+        created = self.claim(list(groups), now)
+        self.suppress({
+            customer_id: (len(entries), sum(float(alert.get('amount') or 0) for _, alert in entries))
+            for customer_id, entries in groups.items() if customer_id not in created
+        })
+        taken = self.take_suppressed([c for c in groups if c in created]) if self.window_seconds > 0 else {}
+
+        deliveries = []
+        for customer_id, entries in groups.items():
+            if customer_id not in created:
+                continue
+            summary = summarize_alerts(customer_id, [alert for _, alert in entries])
+            if customer_id in taken:
+                count, amount = taken[customer_id]
+                summary.update({'suppressed_count': count, 'suppressed_amount': round(amount, 2),
+                                'coalesce_window_seconds': self.window_seconds})
+            deliveries.append((summary, [record for record, _ in entries]))
+        with self.lock:
+            self.flagged += len(alerts)
+            self.suppressed_alerts += sum(len(entries) for c, entries in groups.items() if c not in created)
+        return deliveries
+
+    def mark_sent(self, count):
+        with self.lock:
+            self.sent += count
+
+    def counters(self):
+        return {
+            'flagged': self.flagged,
+            'sent': self.sent,
+            'suppressed': self.suppressed_alerts,
+        }
+
+def create_alert_coalescer():
+    redis_client = None
+    if ALERT_COALESCE_WINDOW_SECONDS > 0 and ALERT_REDIS_HOST:
+        import redis
+        redis_client = redis.Redis(
+            host=ALERT_REDIS_HOST,
+            port=ALERT_REDIS_PORT,
+            decode_responses=True,
+            ssl=True,
+            socket_timeout=0.2,
+            socket_connect_timeout=0.5,
+        )
+    return AlertCoalescer(redis_client=redis_client)
+
+# Tạo 1 lần / container, dùng lại giữa các lần invoke
+alert_coalescer = create_alert_coalescer()
+
+def deliver_alerts(alerts, executor=None):
+    """
+    Gộp cảnh báo của cả batch rồi gửi ALERT_BATCH_SIZE cảnh báo / lần invoke Lambda_Alert
+    (có executor thì các lần invoke chạy song song).
+    Trả về list record Kinesis cần retry (cảnh báo gửi lỗi).
+    """
+    deliveries = alert_coalescer.collect(alerts)
+    chunks = [deliveries[start:start + ALERT_BATCH_SIZE] for start in range(0, len(deliveries), ALERT_BATCH_SIZE)]
+
+    def send(chunk):
+        try:
+            trigger_alerts([summary for summary, _ in chunk])
+            return True
+        except Exception:
+            return False
+
+    if executor is not None and len(chunks) > 1:
+        chunk_results = executor.map(send, chunks)
+    else:
+        chunk_results = map(send, chunks)
+
+    retry_records = []
+    for chunk, ok in zip(chunks, chunk_results):
+        if ok:
+            alert_coalescer.mark_sent(len(chunk))
+            continue
+        alert_coalescer.release([summary for summary, _ in chunk])
+        for summary, records in chunk:
+            logger.error(f"XỬ LÝ THẤT BẠI: không gửi được cảnh báo cho {summary['nameOrig']}")
+            retry_records.extend(records)
+    return retry_records
 
 # --- Kết thúc phần code của alert_invoker.py ---
 
 
+# --- Bắt đầu phần code của pipeline.py ---
+
+# Số luồng xử lý song song (gọi endpoint, ghi DynamoDB, gọi Lambda Alert). 1 = chạy tuần tự như cũ
+SCORING_CONCURRENCY = int(os.environ.get('SCORING_CONCURRENCY', '8'))
+
+# Tạo 1 lần / container, dùng lại giữa các lần invoke
+executor = ThreadPoolExecutor(max_workers=SCORING_CONCURRENCY) if SCORING_CONCURRENCY > 1 else None
+
+# --- Kết thúc phần code của pipeline.py ---
+
+
 # --- Bắt đầu Hàm Handler chính (từ lambda_function.py) ---
 
+# Namespace cố định để sinh transactionId từ record Kinesis (uuid5)
+TRANSACTION_ID_NAMESPACE = uuid.UUID('6f1c3a52-2d0e-4c8b-9a57-0f4e8a1b7c10')
+
+def record_transaction_id(record):
+    """
+    transactionId xác định theo record Kinesis (eventID = shardId:sequenceNumber):
+    record bị Lambda gửi lại (retry) ghi đè đúng item cũ thay vì tạo item trùng.
+    """
+    kinesis = record.get('kinesis', {})
+    event_id = record.get('eventID') or f"{kinesis.get('partitionKey')}:{kinesis.get('sequenceNumber')}"
+    return str(uuid.uuid5(TRANSACTION_ID_NAMESPACE, event_id))
+
+def build_item(record, transaction_data, sagemaker_result):
+    """
+    Gộp data gốc và kết quả AI thành item DynamoDB.
+    """
+    item_to_save = transaction_data.copy()
+    # Partition Key xác định theo record Kinesis => ghi lại khi retry là idempotent
+    item_to_save['transactionId'] = record_transaction_id(record)
+    # Đọc kết quả từ SageMaker
+    item_to_save['ai_prediction_label'] = sagemaker_result.get('prediction', -1)
+    item_to_save['ai_probability'] = sagemaker_result.get('probability', -1.0)
+    if 'error_message' in sagemaker_result:
+        item_to_save['ai_error'] = sagemaker_result['error_message']
+    # Version model đã chấm điểm (inference.py / embedded_model.py trả về cùng kết quả), để đối chiếu khi đổi model / ngưỡng
+    if sagemaker_result.get('model_version'):
+        item_to_save['ai_model_version'] = sagemaker_result['model_version']
+    item_to_save['cold_path_processed_utc'] = datetime.utcnow().isoformat()
+    return item_to_save
+
+def build_alert(transaction_data, item_to_save):
+    """
+    Chuẩn bị payload cảnh báo cho 1 giao dịch gian lận (item đã được ghi vào DynamoDB).
+    """
+    customer_id = transaction_data.get('nameOrig', 'unknown_id')
+    probability = item_to_save['ai_probability']
+    logger.warning(f"PHÁT HIỆN GIAN LẬN: {customer_id} | Probability: {probability}")
+    return {
+        "transactionId": item_to_save['transactionId'],
+        "nameOrig": customer_id,
+        "nameDest": transaction_data.get('nameDest'),
+        "amount": transaction_data.get('amount'),
+        "type": transaction_data.get('type'),
+        "step": transaction_data.get('step'),
+        "ai_probability": probability,
+        "message": f"Nghi ngờ gian lận (Prob: {probability*100:.2f}%) cho KH {customer_id}."
+    }
+
 def lambda_handler(event, context):
     """
     Hàm xử lý chính, được trigger bởi Kinesis Data Stream.
     Xử lý một batch record từ Kinesis.
+    Trả về batchItemFailures (sequenceNumber của record lỗi tạm thời: SageMaker, DynamoDB, Lambda Alert)
+    để Lambda chỉ retry từ record lỗi (event source mapping cần bật ReportBatchItemFailures).
+    Record hỏng (không decode được / không phải JSON object) chỉ log rồi bỏ qua, không chặn shard.
     """
+    # đo thời gian từng stage, in 1 dòng EMF ở cuối batch
+    stage_timer.start()
     processed_records = 0
     failed_records = 0
+    retry_records = []
 
-    # 1. Lặp qua từng record trong batch Kinesis
-    for record in event.get('Records', []):
-        try:
-            # 2. Giải mã (decode) data từ Kinesis
-            payload_str = base64.b64decode(record['kinesis']['data']).decode('utf-8')
-            transaction_data = json.loads(payload_str) # Đây là JSON thô
-            
-            customer_id = transaction_data.get('nameOrig', 'unknown_id')
-            logger.info(f"Đang xử lý record cho: {customer_id}")
-
-            # 3. Gọi SageMaker để chấm điểm (dùng hàm nội bộ)
-            # Gửi thẳng JSON thô, nhận về {"pred_label": 1, "probability": 0.95}
-            sagemaker_result = get_fraud_prediction(transaction_data)
-
-            # 4. Chuẩn bị data để lưu vào DynamoDB
-            # Gộp data gốc và kết quả AI
-            item_to_save = transaction_data.copy()
-            # Tự tạo Partition Key duy nhất (UUID)
-            item_to_save['transactionId'] = str(uuid.uuid4())
-            # Đọc kết quả từ SageMaker
-            pred_label = sagemaker_result.get('prediction', -1)
-            probability = sagemaker_result.get('probability', -1.0)
-            
-            item_to_save['ai_prediction_label'] = pred_label
-            item_to_save['ai_probability'] = probability
-            item_to_save['cold_path_processed_utc'] = datetime.utcnow().isoformat()
-            
-            # 5. Ghi kết quả vào DynamoDB (dùng hàm nội bộ)
-            write_transaction_result(item_to_save)
-
-            # 6. Kiểm tra gian lận và gửi cảnh báo (nếu cần)
-            # *** ĐÃ CẬP NHẬT: Dùng 'pred_label' == 1 ***
-            if pred_label == 1:
-                logger.warning(f"PHÁT HIỆN GIAN LẬN: {customer_id} | Probability: {probability}")
-                
-                # Chuẩn bị payload cho Lambda Alert
-                alert_payload = {
-                    "nameOrig": customer_id,
-                    "nameDest": transaction_data.get('nameDest'),
-                    "amount": transaction_data.get('amount'),
-                    "type": transaction_data.get('type'),
-                    "step": transaction_data.get('step'),
-                    "ai_probability": probability,
-                    "message": f"Nghi ngờ gian lận (Prob: {probability*100:.2f}%) cho KH {customer_id}."
-                }
-                # Kích hoạt Lambda Alert (dùng hàm nội bộ)
-                trigger_alert(alert_payload)
-            
-            processed_records += 1
+    # 1. Giải mã (decode) toàn bộ record trong batch Kinesis
+    decoded = []
+    with stage_timer.stage('decode'):
+        for record in event.get('Records', []):
+            try:
+                payload_str = base64.b64decode(record['kinesis']['data']).decode('utf-8')
+                transaction_data = json.loads(payload_str) # Đây là JSON thô
+                if not isinstance(transaction_data, dict):
+                    raise ValueError(f"payload không phải JSON object ({type(transaction_data).__name__})")
+                decoded.append((record, transaction_data))
+            except Exception as e:
+                logger.error(f"XỬ LÝ THẤT BẠI (bỏ qua record hỏng): {e}")
+                logger.error(f"Record data (base64): {record.get('kinesis', {}).get('data')}")
+                failed_records += 1
 
-        except Exception as e:
-            logger.error(f"XỬ LÝ THẤT BẠI: {e}")
-            logger.error(f"Record data (base64): {record.get('kinesis', {}).get('data')}")
+    # 2. Gọi SageMaker để chấm điểm cả batch (chia chunk theo SAGEMAKER_BATCH_SIZE, các chunk gọi song song)
+    # Giao dịch đã có trong prediction cache (cùng field model + cùng model version) không gửi lên endpoint
+    # Gửi JSON array thô, nhận về list [{"prediction": 1, "probability": 0.95, "model_version": ...}, ...] theo đúng thứ tự
+    # Nhãn gắn theo ngưỡng của Lambda (apply_thresholds), không theo nhãn của endpoint
+    with stage_timer.stage('sagemaker'):
+        transactions = [transaction_data for _, transaction_data in decoded]
+        sagemaker_results = apply_thresholds(transactions, get_cached_predictions(transactions, executor))
+
+    # 3. Ghi kết quả của cả batch vào DynamoDB 1 lần (BatchWriteItem)
+    # Record chấm điểm lỗi có thể retry (throttle / 5xx / timeout) không được ghi, để Kinesis retry;
+    # lỗi do dữ liệu (ModelError / 4xx) được ghi item -1 kèm ai_error, không retry
+    scored = []
+    for (record, transaction_data), result in zip(decoded, sagemaker_results):
+        if 'error_message' in result and result.get('retryable', True):
+            retry_records.append(record)
+            continue
+        if 'error_message' in result:
+            logger.error(f"Không chấm điểm được giao dịch của {transaction_data.get('nameOrig')} (không retry): {result['error_message']}")
+        scored.append((record, transaction_data, build_item(record, transaction_data, result)))
+    with stage_timer.stage('dynamodb'):
+        failed_writes, rejected_writes = write_transaction_results([item for _, _, item in scored], executor)
+    written = []
+    for entry in scored:
+        if entry[2]['transactionId'] in failed_writes:
+            logger.error(f"XỬ LÝ THẤT BẠI: không ghi được DynamoDB cho {entry[1].get('nameOrig')}")
+            retry_records.append(entry[0])
+            continue
+        if entry[2]['transactionId'] in rejected_writes:
+            # item không hợp lệ với DynamoDB: retry cũng không ghi được => không chặn shard, cảnh báo vẫn gửi
+            logger.error(f"XỬ LÝ THẤT BẠI (không retry): DynamoDB từ chối item của {entry[1].get('nameOrig')}")
             failed_records += 1
+        written.append(entry)
+
+    # 4. Cảnh báo: gộp theo nameOrig trong batch, gửi ngay trong 1 (vài) lần invoke Lambda_Alert (tối đa 1 cảnh báo / khách hàng / ALERT_COALESCE_WINDOW_SECONDS)
+    # *** ĐÃ CẬP NHẬT: Dùng 'pred_label' == 1 ***
+    alerts = [
+        (record, build_alert(transaction_data, item_to_save))
+        for record, transaction_data, item_to_save in written
+        if item_to_save['ai_prediction_label'] == 1
+    ]
+    with stage_timer.stage('alerts'):
+        failed_alerts = deliver_alerts(alerts, executor)
+    processed_records += len(written) - len(failed_alerts) - len(rejected_writes)
+    retry_records.extend(failed_alerts)
+
+    failed_records += len(retry_records)
+    batch_item_failures = [{'itemIdentifier': record['kinesis']['sequenceNumber']} for record in retry_records]
     
     # Hoàn tất
-    summary = f"Hoàn tất xử lý batch. Thành công: {processed_records}, Thất bại: {failed_records}"
+    summary = f"Hoàn tất xử lý batch. Thành công: {processed_records}, Thất bại: {failed_records}, Retry: {len(batch_item_failures)}"
     logger.info(summary)
+    # decode / sagemaker / dynamodb / alerts: thời gian thực (wall) của từng stage
+    # endpoint_call / dynamodb_batch_write / alert_invoke...: tổng thời gian cộng dồn của các luồng
+    stage_timings = stage_timer.emit({'records': len(event.get('Records', [])), 'retried': len(batch_item_failures)})
+    logger.info(f"Stage timings (ms): {stage_timings} | concurrency: {SCORING_CONCURRENCY}")
+    if prediction_cache is not None:
+        logger.info(f"Prediction cache: {prediction_cache.counters()}")
+    logger.info(f"Alerts: {alert_coalescer.counters()}")
     
     return {
         'statusCode': 200,
-        'body': json.dumps(summary)
+        'body': json.dumps(summary),
+        'batchItemFailures': batch_item_failures
     }
 
 # --- Kết thúc Hàm Handler chính ---
\ No newline at end of file
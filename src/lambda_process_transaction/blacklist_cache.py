@@ -0,0 +1,138 @@
+import hashlib
+import math
+import os
+import time
+from typing import Dict, Iterable, Optional, Tuple
+import redis
+from instrumentation import stage_timer
+
+# Biến môi trường
+BLACKLIST_CACHE_ENABLED: bool = os.getenv("BLACKLIST_CACHE_ENABLED", "false").lower() == "true"
+BLACKLIST_CACHE_REFRESH_SECONDS: float = float(os.getenv("BLACKLIST_CACHE_REFRESH_SECONDS", "30"))
+BLACKLIST_BLOOM_ERROR_RATE: float = float(os.getenv("BLACKLIST_BLOOM_ERROR_RATE", "0.01"))
+
+# web_cache tăng key này mỗi khi sửa blacklist => container biết để build lại snapshot
+# (không đặt trong "blacklist:*" vì web_cache coi mọi key blacklist:* là set)
+BLACKLIST_VERSION_KEY: str = "meta:blacklist:version"
+BLACKLIST_KEYS: Tuple[str, ...] = ("blacklist:nameOrig", "blacklist:nameDes")
+
+
+class BloomFilter:
+    """
+    Bloom filter tối giản (bytearray + double hashing trên blake2b).
+    "not in" là chắc chắn không có; "in" là có thể có (sai số ~ error_rate).
+    """
+
+    def __init__(self, capacity: int, error_rate: float = BLACKLIST_BLOOM_ERROR_RATE) -> None:
+        capacity = max(capacity, 1)
+        self.num_bits: int = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes: int = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits: bytearray = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, item: str) -> Iterable[int]:
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        for pos in self._positions(item):
+            if not self.bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+
+class BlacklistNearCache:
+    """
+    Snapshot blacklist trong container (mỗi set 1 bloom filter), build lúc init.
+    refresh() chạy ngoài stage rules: cứ mỗi refresh_seconds đọc meta:blacklist:version + SCARD từng set (1 round trip),
+    chỉ build lại khi version / số phần tử đổi. might_contain chỉ tra snapshot, không bao giờ SSCAN trong stage rules.
+    Chỉ những giá trị "có thể có" mới cần hỏi Redis bằng SISMEMBER.
+    """
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        keys: Tuple[str, ...] = BLACKLIST_KEYS,
+        refresh_seconds: float = BLACKLIST_CACHE_REFRESH_SECONDS,
+        error_rate: float = BLACKLIST_BLOOM_ERROR_RATE,
+    ) -> None:
+        self.redis_client: redis.Redis = redis_client
+        self.keys: Tuple[str, ...] = keys
+        self.refresh_seconds: float = refresh_seconds
+        self.error_rate: float = error_rate
+        self.filters: Dict[str, BloomFilter] = {}
+        self.version: Optional[str] = None
+        self.sizes: Tuple[int, ...] = ()
+        self.next_check: float = 0.0
+        # counters
+        self.local_negatives: int = 0
+        self.possible_positives: int = 0
+        self.rebuilds: int = 0
+
+    def _build(self, key: str) -> BloomFilter:
+        members = [str(m) for m in self.redis_client.sscan_iter(key, count=1000)]
+        bloom = BloomFilter(len(members), self.error_rate)
+        for member in members:
+            bloom.add(member)
+        return bloom
+
+    def _fingerprint(self) -> Tuple[Optional[str], Tuple[int, ...]]:
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.get(BLACKLIST_VERSION_KEY)
+        for key in self.keys:
+            pipe.scard(key)
+        version, *sizes = pipe.execute()
+        return version, tuple(sizes)
+
+    def refresh(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now < self.next_check:
+            return
+        self.next_check = now + self.refresh_seconds
+
+        try:
+            with stage_timer.stage("redis_blacklist_refresh"):
+                # version do web_cache tăng; SCARD bắt được thay đổi không đi qua web_cache (chưa có version key)
+                version, sizes = self._fingerprint()
+                if force or not self.filters or version != self.version or sizes != self.sizes:
+                    self.filters = {key: self._build(key) for key in self.keys}
+                    self.version = version
+                    self.sizes = sizes
+                    self.rebuilds += 1
+                    print(f"[BLACKLIST CACHE] Rebuilt snapshot (version={version}, sizes={sizes})")
+        except redis.RedisError as e:
+            # giữ snapshot cũ; nếu chưa có snapshot thì might_contain luôn trả True => hỏi Redis, request sau thử build lại
+            print(f"[BLACKLIST CACHE] Refresh failed, keeping previous snapshot: {e}")
+            if not self.filters:
+                self.next_check = 0.0
+
+    def might_contain(self, key: str, member: str) -> bool:
+        bloom = self.filters.get(key)
+        if bloom is None or member in bloom:
+            self.possible_positives += 1
+            return True
+        self.local_negatives += 1
+        return False
+
+    def snapshot_lookup(self, key: str, member: str) -> Optional[bool]:
+        """
+        Tra snapshot hiện có mà không refresh (dùng khi Redis đang lỗi / circuit breaker mở).
+        None = chưa có snapshot cho key này.
+        """
+        bloom = self.filters.get(key)
+        if bloom is None:
+            return None
+        return member in bloom
+
+    def counters(self) -> Dict[str, int]:
+        return {
+            "local_negatives": self.local_negatives,
+            "possible_positives": self.possible_positives,
+            "rebuilds": self.rebuilds,
+        }
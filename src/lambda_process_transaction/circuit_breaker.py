@@ -0,0 +1,94 @@
+import os
+import time
+from typing import Dict
+from instrumentation import emit_metrics
+
+# Biến môi trường
+CIRCUIT_BREAKER_ENABLED: bool = os.getenv("CIRCUIT_BREAKER_ENABLED", "true").lower() == "true"
+CB_FAILURE_THRESHOLD: int = int(os.getenv("CB_FAILURE_THRESHOLD", "5"))    # số lỗi / call chậm liên tiếp để mở mạch
+CB_RESET_SECONDS: float = float(os.getenv("CB_RESET_SECONDS", "10"))       # thời gian mở trước khi thử lại (half-open)
+CB_SLOW_CALL_MS: float = float(os.getenv("CB_SLOW_CALL_MS", "100"))        # call chậm hơn ngưỡng này tính là lỗi
+
+CLOSED: str = "closed"
+OPEN: str = "open"
+HALF_OPEN: str = "half_open"
+STATE_VALUES: Dict[str, int] = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """
+    closed    : gọi Redis bình thường, đếm lỗi / call chậm liên tiếp
+    open      : không gọi Redis trong reset_seconds, caller dùng degraded mode
+    half_open : cho 1 request thử; thành công => closed, lỗi => open lại
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CB_FAILURE_THRESHOLD,
+        reset_seconds: float = CB_RESET_SECONDS,
+        slow_call_ms: float = CB_SLOW_CALL_MS,
+    ) -> None:
+        self.name: str = name
+        self.failure_threshold: int = failure_threshold
+        self.reset_seconds: float = reset_seconds
+        self.slow_call_ms: float = slow_call_ms
+        self.state: str = CLOSED
+        self.consecutive_failures: int = 0
+        self.opened_at: float = 0.0
+        # request gần nhất có phải chạy degraded mode không (để handler báo lại cho client)
+        self.last_degraded: bool = False
+        # counters
+        self.rejected_calls: int = 0
+        self.times_opened: int = 0
+
+    def allow_request(self) -> bool:
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                self.rejected_calls += 1
+                return False
+            self._transition(HALF_OPEN)
+        return True
+
+    def record_success(self, elapsed_ms: float = 0.0) -> None:
+        if elapsed_ms > self.slow_call_ms:
+            self.record_failure()
+            return
+        self.consecutive_failures = 0
+        if self.state != CLOSED:
+            self._transition(CLOSED)
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            if self.state != OPEN:
+                self.times_opened += 1
+                self._transition(OPEN)
+
+    def trip(self) -> None:
+        # mở mạch ngay (ví dụ PING health check thất bại => không cần chờ đủ failure_threshold)
+        self.consecutive_failures = max(self.consecutive_failures, self.failure_threshold)
+        self.record_failure()
+
+    def _transition(self, state: str) -> None:
+        print(f"[CIRCUIT] {self.name}: {self.state} -> {state}")
+        self.state = state
+        self.emit_metric()
+
+    def emit_metric(self) -> None:
+        # CloudWatch Embedded Metric Format: 0 = closed, 1 = half_open, 2 = open
+        emit_metrics(
+            {"CircuitBreakerState": STATE_VALUES[self.state]},
+            unit="None",
+            dimensions={"Breaker": self.name},
+            namespace="PayShield/HotPath",
+        )
+
+    def counters(self) -> Dict[str, object]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "rejected_calls": self.rejected_calls,
+            "times_opened": self.times_opened,
+        }
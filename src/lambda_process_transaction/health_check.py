@@ -0,0 +1,76 @@
+import os
+import time
+from typing import Any, Callable, Dict
+
+# Biến môi trường
+# 0 => chỉ kiểm tra 1 lần cho mỗi container (cho tới khi có lỗi), > 0 => kiểm tra lại sau N giây
+HEALTH_CHECK_TTL_SECONDS: float = float(os.getenv("HEALTH_CHECK_TTL_SECONDS", "0"))
+
+
+class DependencyHealthCheck:
+    """
+    Kiểm tra kết nối tới 1 dependency (ElastiCache, Kinesis, S3) và cache kết quả trong container.
+    Chỉ gọi lại check_fn khi: chưa từng kiểm tra, hết TTL, hoặc lần gọi trước đã bị mark_failed().
+    """
+
+    def __init__(self, name: str, check_fn: Callable[[], Any], ttl_seconds: float = HEALTH_CHECK_TTL_SECONDS) -> None:
+        self.name: str = name
+        self.check_fn: Callable[[], Any] = check_fn
+        self.ttl_seconds: float = ttl_seconds
+        self.healthy: bool = False
+        self.last_checked: float = 0.0
+        # counters
+        self.checks_issued: int = 0
+        self.checks_skipped: int = 0
+        self.failures: int = 0
+
+    def is_fresh(self) -> bool:
+        if not self.healthy:
+            return False
+        if self.ttl_seconds <= 0:
+            return True
+        return time.monotonic() - self.last_checked < self.ttl_seconds
+
+    def ensure(self) -> None:
+        """
+        Raise lại lỗi của check_fn nếu dependency không dùng được.
+        """
+        if self.is_fresh():
+            self.checks_skipped += 1
+            return
+
+        self.checks_issued += 1
+        try:
+            self.check_fn()
+        except Exception:
+            self.failures += 1
+            self.healthy = False
+            raise
+
+        self.healthy = True
+        self.last_checked = time.monotonic()
+        print(f"[HEALTH] {self.name} check passed (issued={self.checks_issued})")
+
+    def mark_failed(self) -> None:
+        # gọi khi thao tác thật bị lỗi => lần sau sẽ kiểm tra lại
+        self.healthy = False
+
+    def counters(self) -> Dict[str, int]:
+        return {
+            "checks_issued": self.checks_issued,
+            "checks_skipped": self.checks_skipped,
+            "failures": self.failures,
+        }
+
+
+_health_checks: Dict[str, DependencyHealthCheck] = {}
+
+
+def register_health_check(name: str, check_fn: Callable[[], Any], ttl_seconds: float = HEALTH_CHECK_TTL_SECONDS) -> DependencyHealthCheck:
+    health_check = DependencyHealthCheck(name, check_fn, ttl_seconds)
+    _health_checks[name] = health_check
+    return health_check
+
+
+def get_health_check_counters() -> Dict[str, Dict[str, int]]:
+    return {name: hc.counters() for name, hc in _health_checks.items()}
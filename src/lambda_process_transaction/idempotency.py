@@ -0,0 +1,154 @@
+import hashlib
+import json
+import math
+import os
+from typing import Any, Dict, Optional
+import redis
+from circuit_breaker import CircuitBreaker, OPEN
+from instrumentation import stage_timer
+
+# Biến môi trường
+IDEMPOTENCY_ENABLED: bool = os.getenv("IDEMPOTENCY_ENABLED", "true").lower() == "true"
+IDEMPOTENCY_TTL_SECONDS: int = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+# TTL của chỗ giữ "pending" khi không biết thời gian còn lại của invocation (>= timeout của Lambda):
+# invocation bị kill (timeout / OOM) trước complete() thì client retry được sau tối đa chừng này giây
+IDEMPOTENCY_PENDING_TTL_SECONDS: int = int(os.getenv("IDEMPOTENCY_PENDING_TTL_SECONDS", "60"))
+IDEMPOTENCY_HEADER: str = os.getenv("IDEMPOTENCY_HEADER", "Idempotency-Key")
+IDEMPOTENCY_FIELD: str = "idempotencyKey"  # hoặc gửi trong body: {"idempotencyKey": "...", ...}
+IDEMPOTENCY_KEY_MAX_LENGTH: int = 128
+
+IDEMPOTENCY_KEY_PREFIX: str = "idempotency"
+PENDING: str = "pending"
+
+
+def get_idempotency_key(event: Dict[str, Any], payload: Any) -> Optional[str]:
+    """
+    Lấy idempotency key từ header (không phân biệt hoa thường) hoặc field idempotencyKey trong body.
+    Field trong body bị xoá khỏi payload để không lọt vào validate / Kinesis.
+    """
+    key: Any = None
+    if isinstance(payload, dict):
+        key = payload.pop(IDEMPOTENCY_FIELD, None)
+
+    headers = event.get("headers") or {}
+    header_name = IDEMPOTENCY_HEADER.lower()
+    for name, value in headers.items():
+        if name.lower() == header_name:
+            key = value
+            break
+
+    if key is None:
+        return None
+    if not isinstance(key, str) or not 0 < len(key) <= IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise ValueError(f"Idempotency key must be a string of 1..{IDEMPOTENCY_KEY_MAX_LENGTH} characters")
+    return key
+
+
+def request_fingerprint(event: Dict[str, Any]) -> str:
+    # cùng key nhưng khác body => client dùng lại key sai cách
+    body = event.get("body")
+    if not isinstance(body, (str, bytes)):
+        body = json.dumps(event, sort_keys=True, default=str)
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Lưu quyết định theo idempotency key trong Redis:
+      - claim(): SET key pending NX GET — 1 lệnh vừa giữ chỗ vừa đọc kết quả cũ (Redis >= 7.0)
+        => request lặp lại nhận lại response đã lưu, không chạy lại rule / không publish Kinesis lần nữa
+        chỗ giữ pending chỉ sống hết invocation hiện tại (pending_ttl_seconds), không phải IDEMPOTENCY_TTL_SECONDS
+      - complete(): lưu response (SET XX, TTL IDEMPOTENCY_TTL_SECONDS); lỗi 5xx / degraded mode thì xoá key để client retry được
+    Redis lỗi hoặc circuit breaker đang mở => bỏ qua lớp idempotency, xử lý request như bình thường.
+    """
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        breaker: Optional[CircuitBreaker] = None,
+        ttl_seconds: int = IDEMPOTENCY_TTL_SECONDS,
+        pending_ttl_seconds: int = IDEMPOTENCY_PENDING_TTL_SECONDS,
+    ) -> None:
+        self.redis_client: redis.Redis = redis_client
+        self.breaker: Optional[CircuitBreaker] = breaker
+        self.ttl_seconds: int = ttl_seconds
+        self.pending_ttl_seconds: int = pending_ttl_seconds
+        # counters
+        self.replays: int = 0
+        self.conflicts: int = 0
+        self.stored: int = 0
+
+    def _key(self, idempotency_key: str) -> str:
+        return f"{IDEMPOTENCY_KEY_PREFIX}:{idempotency_key}"
+
+    def claim(self, idempotency_key: str, fingerprint: str, remaining_ms: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        None => request mới (đã giữ chỗ), caller xử lý rồi gọi complete().
+        Ngược lại trả về response cần trả cho client (response đã lưu / 409 / 422).
+        remaining_ms: thời gian còn lại của invocation (context.get_remaining_time_in_millis()) => TTL của chỗ giữ pending.
+        """
+        if self.breaker is not None and self.breaker.state == OPEN:
+            return None
+        pending_ttl: int = math.ceil(remaining_ms / 1000) + 1 if remaining_ms else self.pending_ttl_seconds
+        try:
+            with stage_timer.stage("redis_idempotency"):
+                previous = self.redis_client.set(
+                    self._key(idempotency_key),
+                    json.dumps({"fingerprint": fingerprint, "status": PENDING}),
+                    nx=True, ex=pending_ttl, get=True,
+                )
+        except redis.RedisError as e:
+            print(f"[IDEMPOTENCY] Cannot claim key, processing without idempotency: {e}")
+            if self.breaker is not None:
+                self.breaker.record_failure()
+            return None
+
+        if previous is None:
+            return None
+
+        entry: Dict[str, Any] = json.loads(previous)
+        if entry["fingerprint"] != fingerprint:
+            self.conflicts += 1
+            return _error_response(422, "Idempotency key was already used with a different request")
+        if entry["status"] == PENDING:
+            self.conflicts += 1
+            return _error_response(409, "A request with this idempotency key is still in progress")
+
+        self.replays += 1
+        print(f"[IDEMPOTENCY] Replaying stored response for key={idempotency_key}")
+        response: Dict[str, Any] = entry["response"]
+        response["headers"] = {**response.get("headers", {}), "Idempotent-Replay": "true"}
+        return response
+
+    def complete(self, idempotency_key: str, fingerprint: str, response: Dict[str, Any], cacheable: bool = True) -> None:
+        if self.breaker is not None and self.breaker.state == OPEN:
+            # giống claim(): không gọi Redis khi breaker mở, key pending tự hết hạn sau pending TTL
+            return
+        try:
+            with stage_timer.stage("redis_idempotency"):
+                if cacheable and response.get("statusCode", 500) < 500:
+                    self.redis_client.set(
+                        self._key(idempotency_key),
+                        json.dumps({"fingerprint": fingerprint, "status": "done", "response": response}, default=str),
+                        xx=True, ex=self.ttl_seconds,
+                    )
+                    self.stored += 1
+                else:
+                    self.redis_client.delete(self._key(idempotency_key))
+        except redis.RedisError as e:
+            # key pending sẽ tự hết hạn theo pending TTL (thời gian còn lại của invocation)
+            print(f"[IDEMPOTENCY] Cannot store response for key={idempotency_key}: {e}")
+
+    def counters(self) -> Dict[str, int]:
+        return {"replays": self.replays, "conflicts": self.conflicts, "stored": self.stored}
+
+
+def _error_response(status_code: int, message: str) -> Dict[str, Any]:
+    return {
+        "statusCode": status_code,
+        "status": "Declined",
+        "headers": { "Content-Type": "application/json" },
+        "body": json.dumps({"error": message})
+    }
@@ -1,17 +1,42 @@
 import os
 import json
-import boto3
-from typing import Dict, Any
-from dotenv import load_dotenv
-
-load_dotenv()
+import time
+from typing import Dict, Any, List, Optional
+from health_check import register_health_check
+from instrumentation import stage_timer
 
 # Biến môi trường
 AWS_REGION: str = os.getenv("AWS_REGION", "us-east-1")
 KINESIS_STREAM_NAME: str= os.getenv("KINESIS_STREAM_NAME", "fraud-transactions")
+# Ngưỡng flush của buffer PutRecords (giới hạn của Kinesis: 500 record / 5 MiB mỗi request)
+KINESIS_MAX_BATCH_RECORDS: int = min(int(os.getenv("KINESIS_MAX_BATCH_RECORDS", "500")), 500)
+KINESIS_MAX_BATCH_BYTES: int = min(int(os.getenv("KINESIS_MAX_BATCH_BYTES", str(5 * 1024 * 1024))), 5 * 1024 * 1024)
+KINESIS_MAX_BUFFER_SECONDS: float = float(os.getenv("KINESIS_MAX_BUFFER_SECONDS", "1.0"))
+KINESIS_MAX_RETRIES: int = int(os.getenv("KINESIS_MAX_RETRIES", "3"))
+
+# Kinesis Data Stream (tạo khi dùng lần đầu, không tạo lúc import => giảm cold start)
+kinesis_client: Optional[Any] = None
+
+def get_kinesis_client() -> Any:
+    global kinesis_client
+    if kinesis_client is None:
+        import boto3
+        kinesis_client = boto3.client("kinesis", region_name=AWS_REGION)
+    return kinesis_client
+
+def check_stream() -> None:
+    # Gọi describe để chắc chắn stream tồn tại và Lambda có quyền truy cập
+    print(f"[KINESIS] Connecting to Kinesis stream: {KINESIS_STREAM_NAME} in region {AWS_REGION}")
+    stream_info = get_kinesis_client().describe_stream_summary(StreamName=KINESIS_STREAM_NAME)
+    status = stream_info["StreamDescriptionSummary"]["StreamStatus"]
+
+    print(f"[KINESIS] Stream status: {status}")
 
-# Kinesis Data Stream
-kinesis_client = boto3.client("kinesis", region_name=AWS_REGION)
+    # UPDATING vẫn nhận put_record bình thường
+    if status not in ("ACTIVE", "UPDATING"):
+        raise RuntimeError(f"[KINESIS] Stream {KINESIS_STREAM_NAME} is not ACTIVE (current: {status})")
+
+kinesis_health = register_health_check("kinesis", check_stream)
 
 def publish_transaction(transaction: Dict[str, Any]) -> None:
     """
@@ -19,30 +44,129 @@ def publish_transaction(transaction: Dict[str, Any]) -> None:
     vừa đẩy Firehose (auto lưu raw log vào S3)
     """
 
-    print(f"[KINESIS] Connecting to Kinesis stream: {KINESIS_STREAM_NAME} in region {AWS_REGION}")
-
-    # Kiểm tra kết nối Kinesis trước khi gửi dữ liệu
     try:
-        # Gọi describe để chắc chắn stream tồn tại và Lambda có quyền truy cập
-        stream_info = kinesis_client.describe_stream_summary(StreamName=KINESIS_STREAM_NAME)
-        status = stream_info["StreamDescriptionSummary"]["StreamStatus"]
-        
-        print(f"[KINESIS] Stream status: {status}")
-
-        if not status:
-            raise RuntimeError(f"[KINESIS] Stream {KINESIS_STREAM_NAME} is not ACTIVE (current: {status})")
+        # Kiểm tra kết nối Kinesis (chỉ gọi describe lần đầu / hết TTL / sau lỗi)
+        kinesis_health.ensure()
+
         payload_bytes: bytes = json.dumps(transaction).encode("utf-8")
 
         # Push vào Kinesis Data Stream
-        kinesis_client.put_record(
-            StreamName=KINESIS_STREAM_NAME,
-            Data=payload_bytes,
-            PartitionKey=str(transaction.get("nameOrig", "unknown"))
-        )
+        with stage_timer.stage("kinesis_put"):
+            get_kinesis_client().put_record(
+                StreamName=KINESIS_STREAM_NAME,
+                Data=payload_bytes,
+                PartitionKey=str(transaction.get("nameOrig", "unknown"))
+            )
 
         print(f"[KINESIS] Put record success")
 
     except Exception as e:
+        kinesis_health.mark_failed()
         print(f"[KINESIS] Kinesis connection FAILED: {e}")
         raise e  # ném lỗi để Lambda biết không kết nối được
 
+
+class KinesisBuffer:
+    """
+    Gom record rồi gửi bằng PutRecords thay vì 1 put_record / giao dịch.
+    Tự flush khi đủ số record, đủ dung lượng, hoặc record cũ nhất đã chờ quá max_buffer_seconds;
+    caller phải gọi flush() ở cuối invocation / batch.
+    Record lỗi (throttle, lỗi nội bộ) được gửi lại riêng, có backoff, tối đa max_retries lần.
+    """
+
+    def __init__(
+        self,
+        stream_name: str = KINESIS_STREAM_NAME,
+        max_records: int = KINESIS_MAX_BATCH_RECORDS,
+        max_bytes: int = KINESIS_MAX_BATCH_BYTES,
+        max_buffer_seconds: float = KINESIS_MAX_BUFFER_SECONDS,
+        max_retries: int = KINESIS_MAX_RETRIES,
+    ) -> None:
+        self.stream_name: str = stream_name
+        self.max_records: int = max_records
+        self.max_bytes: int = max_bytes
+        self.max_buffer_seconds: float = max_buffer_seconds
+        self.max_retries: int = max_retries
+        self.records: List[Dict[str, Any]] = []
+        self.buffered_bytes: int = 0
+        self.oldest_at: float = 0.0
+        # counters
+        self.put_records_calls: int = 0
+        self.records_sent: int = 0
+        self.records_retried: int = 0
+
+    def add(self, transaction: Dict[str, Any]) -> None:
+        data: bytes = json.dumps(transaction).encode("utf-8")
+        partition_key: str = str(transaction.get("nameOrig", "unknown"))
+        record_size: int = len(data) + len(partition_key.encode("utf-8"))
+
+        if self.records and self.buffered_bytes + record_size > self.max_bytes:
+            self.flush()
+
+        if not self.records:
+            self.oldest_at = time.monotonic()
+        self.records.append({"Data": data, "PartitionKey": partition_key})
+        self.buffered_bytes += record_size
+
+        if len(self.records) >= self.max_records or time.monotonic() - self.oldest_at >= self.max_buffer_seconds:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.records:
+            return
+        records, self.records, self.buffered_bytes = self.records, [], 0
+
+        try:
+            kinesis_health.ensure()
+            self._put_with_retry(records)
+        except Exception as e:
+            kinesis_health.mark_failed()
+            print(f"[KINESIS] PutRecords FAILED: {e}")
+            raise
+
+    def discard(self) -> int:
+        # bỏ record chưa gửi (batch lỗi giữa chừng => client retry cả batch, gửi lại sẽ bị trùng)
+        dropped: int = len(self.records)
+        self.records, self.buffered_bytes = [], 0
+        return dropped
+
+    def _put_with_retry(self, records: List[Dict[str, Any]]) -> None:
+        pending: List[Dict[str, Any]] = records
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.records_retried += len(pending)
+                time.sleep(min(0.05 * (2 ** (attempt - 1)), 1.0))
+
+            with stage_timer.stage("kinesis_put"):
+                response = get_kinesis_client().put_records(StreamName=self.stream_name, Records=pending)
+            self.put_records_calls += 1
+
+            if not response.get("FailedRecordCount"):
+                self.records_sent += len(pending)
+                print(f"[KINESIS] PutRecords success: {len(records)} records")
+                return
+
+            # chỉ gửi lại những record bị lỗi (kết quả trả về theo đúng thứ tự request)
+            failed = [record for record, entry in zip(pending, response["Records"]) if "ErrorCode" in entry]
+            self.records_sent += len(pending) - len(failed)
+            pending = failed
+
+        raise RuntimeError(f"[KINESIS] {len(pending)}/{len(records)} records still failing after {self.max_retries} retries")
+
+    def counters(self) -> Dict[str, int]:
+        return {
+            "put_records_calls": self.put_records_calls,
+            "records_sent": self.records_sent,
+            "records_retried": self.records_retried,
+        }
+
+kinesis_buffer: KinesisBuffer = KinesisBuffer()
+
+def buffer_transaction(transaction: Dict[str, Any]) -> None:
+    kinesis_buffer.add(transaction)
+
+def flush_transactions() -> None:
+    kinesis_buffer.flush()
+
+def discard_transactions() -> int:
+    return kinesis_buffer.discard()
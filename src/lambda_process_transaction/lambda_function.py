@@ -1,92 +1,304 @@
 import json
-from typing import Any, Dict
-import redis
+from typing import Any, Dict, List, Optional
 import os
-from rules_engine import validate_transaction, check_rules
-from kinesis_publisher import publish_transaction
-from dotenv import load_dotenv
-from save_s3 import save_to_s3
+from local_env import load_local_env
+
+# Nạp .env (chỉ khi chạy local) trước khi các module bên dưới đọc biến môi trường
+load_local_env()
 
-load_dotenv()
+import redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+from rules_engine import validate_transaction, check_rules, check_rules_batch, is_declined, record_approved_spend
+from kinesis_publisher import publish_transaction, buffer_transaction, flush_transactions, discard_transactions
+from save_s3 import save_to_s3, flush_violations, discard_violations
+from health_check import register_health_check, get_health_check_counters
+from blacklist_cache import BlacklistNearCache, BLACKLIST_CACHE_ENABLED
+from rule_definitions import RuleSet
+from transaction_schema import decode_body
+from circuit_breaker import CircuitBreaker, CIRCUIT_BREAKER_ENABLED, OPEN
+from idempotency import IdempotencyStore, IDEMPOTENCY_ENABLED, get_idempotency_key, request_fingerprint
+from instrumentation import stage_timer
 
 # Biến môi trường
 REDIS_HOST: str = os.getenv("REDIS_HOST", "fraud-cache.xxxxxx.ng.0001.use1.cache.amazonaws.com")
 REDIS_PORT: int = int(os.getenv("REDIS_PORT", "6379"))
+MAX_BATCH_SIZE: int = int(os.getenv("MAX_BATCH_SIZE", "500"))
+# Timeout (giây) cho Redis: ElastiCache chậm thì lỗi nhanh để circuit breaker xử lý, không treo tới timeout của Lambda
+REDIS_SOCKET_TIMEOUT: float = float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.2"))
+REDIS_CONNECT_TIMEOUT: float = float(os.getenv("REDIS_CONNECT_TIMEOUT", "0.5"))
+REDIS_RETRIES: int = int(os.getenv("REDIS_RETRIES", "0"))
 
 # Elasticache
-redis_client: redis.Redis = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True, ssl=True)
+redis_client: redis.Redis = redis.Redis(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    decode_responses=True,
+    ssl=True,
+    socket_timeout=REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+    retry=Retry(NoBackoff(), REDIS_RETRIES),
+)
 
-def lambda_handler(event: dict, context: Any = None)-> Dict[str, Any]: # gọi qua api gateway thì event thường là 1 dict chứa json data
-    print("Lambda start")
+def check_redis() -> None:
     print(f"[ELASTICACHE] Connecting to Elasticache at host: {REDIS_HOST} in port {REDIS_PORT}")
-    try:
-        # Thử ping để kiểm tra kết nối thực tế
+    with stage_timer.stage("redis_ping"):
         ping_response = redis_client.ping()
-        print(f"[ELASTICACHE] Redis connection test: {'Success' if ping_response else 'Failed'}")
+    print(f"[ELASTICACHE] Redis connection test: {'Success' if ping_response else 'Failed'}")
+    if not ping_response:
+        raise redis.ConnectionError("PING returned no response")
 
-        # Parse event
-        transaction: dict = json.loads(event.get("body", event)) # lấy giá trị body, nếu không có thì trả về toàn bộ event
-        
-        # Validate cơ bản
-        validate_transaction(transaction) # kiểm tra sơ khởi định dạng và value của transaction
-        
-        # Kiểm tra blacklist / rule (ElastiCache)
-        rule_result = check_rules(redis_client, transaction) 
-
-        print(rule_result)
-
-        # Nếu bất kỳ rule nào False → lỗi
-        if any(rule_result.values()):
-            save_to_s3(transaction)
-            
-            print("[TRANSACTION] transaction failed")
-            return {
-                "statusCode": 400,
-                "status": "Declined",
-                # phần body này Api gateway bắt buộc yêu cầu là kiểu string => phải dumps để convert từ dict qua json
-                "body": json.dumps({ 
-                    "message": "Transaction failed due to rule violation",
-                    "rule_result": rule_result
-                })
-            }
-
-        # Fire-and-forget: Kinesis
-        publish_transaction(transaction)    
-        print("[TRANSACTION] transaction sucessful")
+redis_health = register_health_check("elasticache", check_redis)
+
+# Circuit breaker cho ElastiCache: mở mạch => quyết định local (degraded mode), xem rules_engine.REDIS_FAILURE_POLICY
+redis_breaker: Optional[CircuitBreaker] = CircuitBreaker("elasticache") if CIRCUIT_BREAKER_ENABLED else None
+
+def ensure_redis() -> None:
+    """
+    Ping ElastiCache theo health check. Có circuit breaker thì PING lỗi chỉ mở mạch (request chạy degraded mode),
+    mạch đang mở thì bỏ qua PING.
+    """
+    if redis_breaker is None:
+        redis_health.ensure()
+        return
+    if redis_breaker.state == OPEN:
+        return
+    try:
+        redis_health.ensure()
+    except redis.RedisError as e:
+        print(f"[ELASTICACHE] Health check failed: {e}")
+        redis_health.mark_failed()
+        redis_breaker.trip()
+
+# Idempotency key (header Idempotency-Key / field idempotencyKey) => client retry không bị tính velocity / publish 2 lần
+idempotency_store: Optional[IdempotencyStore] = IdempotencyStore(redis_client, redis_breaker) if IDEMPOTENCY_ENABLED else None
+
+def is_degraded() -> bool:
+    return redis_breaker is not None and redis_breaker.last_degraded
+
+# Near-cache blacklist trong container (tuỳ chọn, bật bằng BLACKLIST_CACHE_ENABLED=true)
+blacklist_cache: Optional[BlacklistNearCache] = BlacklistNearCache(redis_client) if BLACKLIST_CACHE_ENABLED else None
+if blacklist_cache is not None:
+    # build snapshot lúc init, không để SSCAN toàn bộ blacklist rơi vào request của khách
+    blacklist_cache.refresh(force=True)
+
+def refresh_blacklist_cache() -> None:
+    """
+    Kiểm tra version snapshot blacklist trước stage rules (ngoài thời gian đo của circuit breaker),
+    mạch đang mở thì giữ snapshot hiện có.
+    """
+    if blacklist_cache is None:
+        return
+    if redis_breaker is not None and redis_breaker.state == OPEN:
+        return
+    blacklist_cache.refresh()
+
+# Rule khai báo (file / Redis), biên dịch lại khi version đổi (HGET đi qua circuit breaker)
+rule_set: RuleSet = RuleSet(redis_client, breaker=redis_breaker)
+
+def extract_batch(payload: Any) -> Optional[List[Any]]:
+    if isinstance(payload, list):
+        return payload
+    if isinstance(payload, dict) and isinstance(payload.get("transactions"), list):
+        return payload["transactions"]
+    return None
+
+def handle_batch(transactions: List[Any]) -> Dict[str, Any]:
+    """
+    Xử lý nhiều giao dịch trong 1 lần gọi: validate từng giao dịch, đánh giá rule cho cả batch
+    trong 1 pipeline Redis, trả về kết quả Approved/Declined theo đúng thứ tự đầu vào.
+    Lỗi Redis / Kinesis / S3 vẫn làm hỏng cả batch (ném ra cho lambda_handler trả 500).
+    """
+    if not transactions:
+        raise ValueError("Batch must contain at least one transaction")
+    if len(transactions) > MAX_BATCH_SIZE:
+        raise ValueError(f"Batch too large: {len(transactions)} > {MAX_BATCH_SIZE}")
+
+    results: List[Dict[str, Any]] = [{} for _ in transactions]
+    valid_indexes: List[int] = []
+    valid_transactions: List[Dict[str, Any]] = []
+
+    # Validate + chuẩn hoá từng giao dịch, giao dịch lỗi bị Declined riêng lẻ
+    with stage_timer.stage("validate"):
+        for index, transaction in enumerate(transactions):
+            try:
+                valid_transactions.append(validate_transaction(transaction))
+                valid_indexes.append(index)
+            except (KeyError, ValueError, TypeError) as e:
+                results[index] = {"index": index, "status": "Declined", "error": str(e)}
+
+    # Kiểm tra blacklist / rule (ElastiCache) cho cả batch: 1 round trip
+    features: List[Dict[str, Any]] = []
+    rules = rule_set.current()
+    with stage_timer.stage("rules"):
+        rule_results = check_rules_batch(redis_client, valid_transactions, blacklist_cache=blacklist_cache, rules=rules, breaker=redis_breaker, features=features) if valid_transactions else []
+    degraded: bool = is_degraded()
+
+    approved_transactions: List[Dict[str, Any]] = []
+    try:
+        for index, transaction, rule_result, enrichment in zip(valid_indexes, valid_transactions, rule_results, features):
+            if is_declined(rule_result, rules):
+                # degraded => không phải vi phạm đã xác nhận, ghi vào S3_DEGRADED_PREFIX
+                save_to_s3(transaction, rule_result, degraded=degraded)
+                results[index] = {"index": index, "status": "Declined", "rule_result": rule_result}
+            else:
+                # gửi kèm spend aggregate (tổng tiền / số giao dịch gần đây) cho Luồng Lạnh
+                buffer_transaction({**transaction, **enrichment})
+                approved_transactions.append(transaction)
+                results[index] = {"index": index, "status": "Approved", "rule_result": rule_result}
+
+        # Gửi toàn bộ giao dịch Approved bằng PutRecords, giao dịch Declined vào archive S3 (flush phần còn lại trong buffer)
+        flush_transactions()
+        flush_violations()
+        # Chỉ tiền của giao dịch Approved mới được cộng vào spend aggregate (sau khi gửi xong, tránh cộng trùng khi retry)
+        record_approved_spend(redis_client, approved_transactions, rules, breaker=redis_breaker)
+    except Exception:
+        # Lỗi giữa chừng => client nhận 500 và retry cả batch: bỏ phần còn trong buffer (module-level, dùng chung giữa
+        # các invocation) để không bị request sau gửi trùng với lần retry, hoặc mất khi container bị thu hồi
+        dropped_transactions: int = discard_transactions()
+        dropped_violations: int = discard_violations()
+        print(f"[TRANSACTION] batch failed, discarded buffered records: kinesis={dropped_transactions} s3={dropped_violations}")
+        raise
+
+    approved: int = sum(1 for r in results if r["status"] == "Approved")
+    print(f"[TRANSACTION] batch processed: total={len(results)} approved={approved} declined={len(results) - approved}")
+
+    return {
+        "statusCode": 200,
+        "status": "Processed",
+        "headers": { "Content-Type": "application/json" },
+        "body": json.dumps({
+            "message": "Batch processed",
+            "approved": approved,
+            "declined": len(results) - approved,
+            "degraded": degraded,
+            "results": results
+        }, default=str)
+    }
+
+def handle_single(transaction: Any) -> Dict[str, Any]:
+    # Validate cơ bản
+    with stage_timer.stage("validate"):
+        transaction = validate_transaction(transaction) # kiểm tra định dạng / value và chuẩn hoá transaction
+    
+    # Kiểm tra blacklist / rule (ElastiCache)
+    features: List[Dict[str, Any]] = []
+    rules = rule_set.current()
+    with stage_timer.stage("rules"):
+        rule_result = check_rules(redis_client, transaction, blacklist_cache=blacklist_cache, rules=rules, breaker=redis_breaker, features=features)
+
+    print(rule_result)
+
+    # Nếu có rule vi phạm (hoặc blacklist "unknown" khi fail_closed) → lỗi
+    if is_declined(rule_result, rules):
+        save_to_s3(transaction, rule_result, degraded=is_degraded())
+        flush_violations()
         
+        print("[TRANSACTION] transaction failed")
         return {
-            "statusCode": 200,
-            "status": "Approved",
-            "headers": { "Content-Type": "application/json" },
-            "body": json.dumps({
-                "message": "Transaction processed successfully",
+            "statusCode": 400,
+            "status": "Declined",
+            # phần body này Api gateway bắt buộc yêu cầu là kiểu string => phải dumps để convert từ dict qua json
+            "body": json.dumps({ 
+                "message": "Transaction failed due to rule violation" if any(v is True for v in rule_result.values())
+                           else "Transaction declined: rules could not be evaluated (degraded mode)",
+                "degraded": is_degraded(),
                 "rule_result": rule_result
-            },default=str)
+            })
         }
 
+    # Fire-and-forget: Kinesis (kèm spend aggregate)
+    publish_transaction({**transaction, **features[0]})
+    record_approved_spend(redis_client, [transaction], rules, breaker=redis_breaker)
+    print("[TRANSACTION] transaction sucessful")
+    
+    return {
+        "statusCode": 200,
+        "status": "Approved",
+        "headers": { "Content-Type": "application/json" },
+        "body": json.dumps({
+            "message": "Transaction processed successfully",
+            "degraded": is_degraded(),
+            "rule_result": rule_result
+        },default=str)
+    }
+
+def lambda_handler(event: dict, context: Any = None)-> Dict[str, Any]: # gọi qua api gateway thì event thường là 1 dict chứa json data
+    print("Lambda start")
+    # đo thời gian từng stage (parse, validate, Redis, Kinesis, S3), in 1 dòng EMF ở cuối request
+    stage_timer.start()
+    print(f"[HEALTH] Dependency checks: {get_health_check_counters()}")
+    if redis_breaker is not None:
+        print(f"[CIRCUIT] elasticache: {redis_breaker.counters()}")
+        redis_breaker.emit_metric()
+        redis_breaker.last_degraded = False
+
+    idempotency_key: Optional[str] = None
+    fingerprint: str = ""
+
+    def respond(response: Dict[str, Any]) -> Dict[str, Any]:
+        # lưu response theo idempotency key (lỗi 5xx / quyết định degraded => xoá key để client retry)
+        if idempotency_store is not None and idempotency_key is not None:
+            idempotency_store.complete(idempotency_key, fingerprint, response, cacheable=not is_degraded())
+        return response
+
+    try:
+        # Thử ping để kiểm tra kết nối thực tế (chỉ ping lần đầu / hết TTL / sau lỗi)
+        ensure_redis()
+        refresh_blacklist_cache()
+
+        # Parse event
+        with stage_timer.stage("parse"):
+            transaction: dict = decode_body(event.get("body", event)) # lấy giá trị body, nếu không có thì trả về toàn bộ event
+
+        # Request lặp lại (cùng idempotency key) => trả lại quyết định đã lưu, không chạy rule / publish lần nữa
+        if idempotency_store is not None:
+            key = get_idempotency_key(event, transaction)
+            if key is not None:
+                fingerprint = request_fingerprint(event)
+                remaining_ms: Optional[int] = context.get_remaining_time_in_millis() if context is not None else None
+                replay = idempotency_store.claim(key, fingerprint, remaining_ms)
+                if replay is not None:
+                    return replay
+                idempotency_key = key
+
+        # Batch mode: body là JSON array hoặc {"transactions": [...]}
+        batch: Optional[List[Any]] = extract_batch(transaction)
+        if batch is not None:
+            return respond(handle_batch(batch))
+
+        return respond(handle_single(transaction))
+
     except (KeyError, ValueError, TypeError) as e:
-        return {
+        return respond({
             "statusCode": 400, 
             "status": "Declined",
             "headers": { "Content-Type": "application/json" },
             "body": json.dumps({"error": str(e)},default=str)
-        }
+        })
 
     except redis.RedisError as e:
-        return {
+        redis_health.mark_failed()
+        return respond({
             "statusCode": 500, 
             "status": "Declined",
             "headers": { "Content-Type": "application/json" },
             "body": json.dumps({"error": f"Elasticache connection failed: {e}"}, default=str)
-        }
+        })
 
     except Exception as e:
-        return {
+        # check_rules bọc lỗi Redis trong RuntimeError
+        if isinstance(e.__cause__, redis.RedisError):
+            redis_health.mark_failed()
+        return respond({
             "statusCode": 500, 
             "status": "Declined",
             "headers": { "Content-Type": "application/json" },
             "body": json.dumps({"error": str(e)},default=str)
-        }
+        })
+
+    finally:
+        stage_timer.emit({"degraded": is_degraded()})
     
 
 
@@ -0,0 +1,15 @@
+import os
+
+
+def load_local_env() -> None:
+    """
+    Nạp file .env khi chạy ở máy local.
+    Trên Lambda biến môi trường đã được cấu hình sẵn => bỏ qua, không import dotenv (giảm cold start).
+    """
+    if os.getenv("AWS_LAMBDA_FUNCTION_NAME"):
+        return
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return
+    load_dotenv()
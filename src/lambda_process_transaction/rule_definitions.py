@@ -0,0 +1,296 @@
+import json
+import operator
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import redis
+from blacklist_cache import BlacklistNearCache
+from circuit_breaker import CircuitBreaker
+from instrumentation import stage_timer
+from spend import DEFAULT_SPEND_RULES, SPEND_RULES, SpendAggregator, SpendRule
+from velocity import DEFAULT_VELOCITY_RULES, VELOCITY_RULES, RedisCommand, VelocityLimiter, VelocityRule
+
+# Biến môi trường
+# Nguồn định nghĩa rule (ưu tiên theo thứ tự):
+#   1. RULES_CONFIG_PATH: file JSON đóng gói cùng Lambda (đọc 1 lần / container)
+#   2. Redis hash "rules:config" với 2 field: version, definitions (JSON) — kiểm tra version mỗi RULES_REFRESH_SECONDS
+#   3. Rule mặc định (blackUser, blackDevice + VELOCITY_RULES + SPEND_RULES)
+RULES_CONFIG_PATH: str = os.getenv("RULES_CONFIG_PATH", "")
+RULES_REFRESH_SECONDS: float = float(os.getenv("RULES_REFRESH_SECONDS", "30"))
+RULES_CONFIG_KEY: str = "rules:config"
+
+# Ví dụ định nghĩa rule:
+# [
+#   {"name": "blackUser",   "kind": "set_member", "key": "blacklist:nameOrig", "field": "nameOrig"},
+#   {"name": "blackDevice", "kind": "set_member", "key": "blacklist:nameDes",  "field": "nameDest"},
+#   {"name": "SpawmOver5PerMinute", "kind": "velocity", "fields": ["type", "nameOrig", "nameDest"], "window": 60, "limit": 5},
+#   {"name": "UserSpendOver1MPerDay", "kind": "spend", "fields": ["nameOrig"], "window": 86400, "max_amount": 1000000},
+#   {"name": "AmountOver1M",       "kind": "threshold", "field": "amount", "op": ">", "value": 1000000},
+#   {"name": "AmountOverBalance",  "kind": "threshold", "field": "amount", "op": ">", "other_field": "oldbalanceOrg"}
+# ]
+DEFAULT_SET_MEMBER_RULES: List[Dict[str, Any]] = [
+    {"name": "blackUser", "kind": "set_member", "key": "blacklist:nameOrig", "field": "nameOrig"},
+    {"name": "blackDevice", "kind": "set_member", "key": "blacklist:nameDes", "field": "nameDest"},
+]
+
+# Kết quả của rule không đánh giá được (degraded mode: cần Redis mà không có snapshot local)
+RULE_UNKNOWN: str = "unknown"
+
+THRESHOLD_OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+
+def default_rule_definitions(
+    velocity_config: Optional[List[Dict[str, Any]]] = None,
+    spend_config: Optional[List[Dict[str, Any]]] = None,
+) -> List[Dict[str, Any]]:
+    if velocity_config is None:
+        velocity_config = json.loads(VELOCITY_RULES) if VELOCITY_RULES else DEFAULT_VELOCITY_RULES
+    if spend_config is None:
+        spend_config = json.loads(SPEND_RULES) if SPEND_RULES else DEFAULT_SPEND_RULES
+    return DEFAULT_SET_MEMBER_RULES \
+        + [dict(rule, kind="velocity") for rule in velocity_config] \
+        + [dict(rule, kind="spend") for rule in spend_config]
+
+
+class SetMemberRule:
+    def __init__(self, name: str, key: str, field: str) -> None:
+        self.name: str = name
+        self.key: str = key
+        self.field: str = field
+
+
+class ThresholdRule:
+    """
+    Rule số học chạy local (không tốn lệnh Redis): txn[field] <op> value (hoặc txn[other_field]).
+    Field không có trong giao dịch (schema cho phép thiếu, ví dụ step) => rule không khớp.
+    """
+
+    def __init__(self, name: str, field: str, op: str, value: Optional[float] = None, other_field: Optional[str] = None) -> None:
+        if op not in THRESHOLD_OPERATORS:
+            raise ValueError(f"Threshold rule {name}: unsupported op {op}")
+        if (value is None) == (other_field is None):
+            raise ValueError(f"Threshold rule {name}: exactly one of value / other_field is required")
+        self.name: str = name
+        self.field: str = field
+        self.compare: Callable[[Any, Any], bool] = THRESHOLD_OPERATORS[op]
+        self.value: Optional[float] = value
+        self.other_field: Optional[str] = other_field
+
+    def evaluate(self, txn: Dict[str, Any]) -> bool:
+        left = txn.get(self.field)
+        right = txn.get(self.other_field) if self.other_field else self.value
+        if left is None or right is None:
+            return False
+        return bool(self.compare(float(left), float(right)))
+
+
+class CompiledRules:
+    """
+    Execution plan biên dịch từ định nghĩa rule:
+      - set_member: gom theo key, mỗi set chỉ 1 lệnh SMISMEMBER cho cả batch (bỏ member trùng,
+        bỏ member mà near-cache đã chắc chắn là không có)
+      - velocity: 3 lệnh / rule / giao dịch (xem velocity.py)
+      - spend: 4 lệnh / rule / giao dịch (xem spend.py), kèm field làm giàu record (<rule>_sum, <rule>_count);
+        tiền của giao dịch Approved được cộng sau quyết định (approved_commands)
+      - threshold: tính local
+    Toàn bộ lệnh Redis của 1 batch được trả về 1 lần để caller gửi trong 1 pipeline.
+    """
+
+    def __init__(self, definitions: List[Dict[str, Any]], version: Optional[str] = None) -> None:
+        self.version: Optional[str] = version
+        self.rule_names: List[str] = []
+        self.set_rules: List[SetMemberRule] = []
+        self.thresholds: List[ThresholdRule] = []
+        velocity_rules: List[VelocityRule] = []
+        spend_rules: List[SpendRule] = []
+        names: List[str] = []
+
+        for definition in definitions:
+            params = dict(definition)
+            kind = params.pop("kind")
+            if params["name"] in names:
+                raise ValueError(f"Duplicate rule name: {params['name']}")
+            if kind == "set_member":
+                self.set_rules.append(SetMemberRule(**params))
+            elif kind == "velocity":
+                velocity_rules.append(VelocityRule(**params))
+            elif kind == "spend":
+                spend_rules.append(SpendRule(**params))
+            elif kind == "threshold":
+                self.thresholds.append(ThresholdRule(**params))
+            else:
+                raise ValueError(f"Unknown rule kind: {kind}")
+            names.append(params["name"])
+            # spend rule không có ngưỡng chỉ để làm giàu record => không nằm trong rule_result
+            if kind != "spend" or spend_rules[-1].has_limit:
+                self.rule_names.append(params["name"])
+
+        self.limiter: VelocityLimiter = VelocityLimiter(velocity_rules)
+        self.spend: SpendAggregator = SpendAggregator(spend_rules)
+
+    def evaluate_batch(
+        self,
+        txns: List[Dict[str, Any]],
+        now: float,
+        execute: Callable[[List[RedisCommand]], List[Any]],
+        blacklist_cache: Optional[BlacklistNearCache] = None,
+        features: Optional[List[Dict[str, Any]]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        features: nếu truyền list vào thì được append field làm giàu (spend aggregate) của từng giao dịch.
+        """
+        results: List[Dict[str, Any]] = [{name: False for name in self.rule_names} for _ in txns]
+
+        # set_member: key -> danh sách member duy nhất cần hỏi Redis
+        lookups: Dict[str, Dict[str, None]] = {}  # dict giữ thứ tự chèn, dùng như ordered set
+        pending: List[Tuple[int, str, str, str]] = []  # (index giao dịch, tên rule, key, member)
+        for index, txn in enumerate(txns):
+            for rule in self.set_rules:
+                member = str(txn[rule.field])
+                # near-cache trả lời chắc chắn "không có trong blacklist" => khỏi hỏi Redis
+                if blacklist_cache is not None and rule.key in blacklist_cache.keys \
+                        and not blacklist_cache.might_contain(rule.key, member):
+                    continue
+                lookups.setdefault(rule.key, {})[member] = None
+                pending.append((index, rule.name, rule.key, member))
+
+        commands: List[RedisCommand] = [("smismember", (key, list(members)), {}) for key, members in lookups.items()]
+        for txn in txns:
+            commands.extend(self.limiter.commands(txn, now))
+            commands.extend(self.spend.commands(txn, now))
+
+        replies: List[Any] = execute(commands) if commands else []
+
+        membership: Dict[Tuple[str, str], bool] = {}
+        for (key, members), reply in zip(lookups.items(), replies):
+            for member, found in zip(members, reply):
+                membership[(key, member)] = bool(found)
+        for index, name, key, member in pending:
+            results[index][name] = membership[(key, member)]
+
+        offset = len(lookups)
+        velocity_per_txn = len(self.limiter.rules) * VelocityLimiter.COMMANDS_PER_RULE
+        spend_per_txn = len(self.spend.rules) * SpendAggregator.COMMANDS_PER_RULE
+        for index, txn in enumerate(txns):
+            results[index].update(self.limiter.evaluate(replies[offset:offset + velocity_per_txn], now))
+            offset += velocity_per_txn
+            spend_result, spend_features = self.spend.evaluate(txn, replies[offset:offset + spend_per_txn], now)
+            results[index].update(spend_result)
+            offset += spend_per_txn
+            if features is not None:
+                features.append(spend_features)
+            for threshold in self.thresholds:
+                results[index][threshold.name] = threshold.evaluate(txn)
+
+        return results
+
+    def approved_commands(self, txns: List[Dict[str, Any]], now: float) -> List[RedisCommand]:
+        # lệnh ghi nhận tiền của giao dịch đã Approved (spend sum), gửi sau khi có quyết định
+        return [command for txn in txns for command in self.spend.approved_commands(txn, now)]
+
+    def evaluate_degraded(
+        self,
+        txns: List[Dict[str, Any]],
+        blacklist_cache: Optional[BlacklistNearCache] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Đánh giá khi không gọi được Redis:
+          - set_member: tra snapshot bloom của near-cache (dương tính giả => Declined, chấp nhận được khi sự cố),
+            không có snapshot => RULE_UNKNOWN
+          - velocity / spend: counter nằm trong Redis => RULE_UNKNOWN
+          - threshold: tính local như bình thường
+        Quyết định Approved / Declined: xem is_declined.
+        """
+        results: List[Dict[str, Any]] = []
+        for txn in txns:
+            result: Dict[str, Any] = {}
+            for rule in self.set_rules:
+                found = blacklist_cache.snapshot_lookup(rule.key, str(txn[rule.field])) if blacklist_cache is not None else None
+                result[rule.name] = RULE_UNKNOWN if found is None else found
+            for name in self.limiter.rule_names() + self.spend.rule_names():
+                result[name] = RULE_UNKNOWN
+            for threshold in self.thresholds:
+                result[threshold.name] = threshold.evaluate(txn)
+            results.append({name: result[name] for name in self.rule_names})
+        return results
+
+    def is_declined(self, result: Dict[str, Any], fail_closed: bool) -> bool:
+        """
+        Declined khi có rule vi phạm (True). Rule RULE_UNKNOWN chỉ chặn giao dịch khi fail_closed và là blacklist
+        (set_member không có snapshot); velocity / spend không đánh giá được thì bỏ qua => có snapshot thì
+        quyết định degraded dựa trên snapshot + threshold.
+        """
+        if any(value is True for value in result.values()):
+            return True
+        return fail_closed and any(result.get(rule.name) == RULE_UNKNOWN for rule in self.set_rules)
+
+
+DEFAULT_RULES: CompiledRules = CompiledRules(default_rule_definitions(), version="default")
+
+
+class RuleSet:
+    """
+    Giữ CompiledRules hiện tại của container, chỉ biên dịch lại khi version thay đổi.
+    Lỗi khi đọc / biên dịch định nghĩa mới => giữ plan đang chạy.
+    Có breaker: HGET đi qua circuit breaker của ElastiCache, mạch mở => giữ plan đang chạy, không chờ socket timeout.
+    """
+
+    def __init__(
+        self,
+        redis_client: Optional[redis.Redis] = None,
+        config_path: str = RULES_CONFIG_PATH,
+        refresh_seconds: float = RULES_REFRESH_SECONDS,
+        breaker: Optional[CircuitBreaker] = None,
+    ) -> None:
+        self.redis_client: Optional[redis.Redis] = redis_client
+        self.breaker: Optional[CircuitBreaker] = breaker
+        self.refresh_seconds: float = refresh_seconds
+        self.rules: CompiledRules = DEFAULT_RULES
+        self.next_check: float = 0.0
+        self.compiles: int = 0
+
+        if config_path:
+            with open(config_path, encoding="utf-8") as f:
+                self.rules = CompiledRules(json.load(f), version=f"file:{config_path}")
+            self.compiles += 1
+            self.redis_client = None  # file cố định trong package, không cần kiểm tra lại
+
+    def current(self) -> CompiledRules:
+        if self.redis_client is None:
+            return self.rules
+
+        now = time.monotonic()
+        if now < self.next_check:
+            return self.rules
+        self.next_check = now + self.refresh_seconds
+        if self.breaker is not None and not self.breaker.allow_request():
+            return self.rules
+
+        started = time.perf_counter()
+        try:
+            with stage_timer.stage("redis_rule_config"):
+                version = self.redis_client.hget(RULES_CONFIG_KEY, "version")
+                if version is None:
+                    self.rules = DEFAULT_RULES
+                elif version != self.rules.version:
+                    definitions = self.redis_client.hget(RULES_CONFIG_KEY, "definitions")
+                    self.rules = CompiledRules(json.loads(definitions), version=version)  # type: ignore[arg-type]
+                    self.compiles += 1
+                    print(f"[RULES] Compiled rule set version={version}: {self.rules.rule_names}")
+            if self.breaker is not None:
+                self.breaker.record_success((time.perf_counter() - started) * 1000)
+        except redis.RedisError as e:
+            if self.breaker is not None:
+                self.breaker.record_failure()
+            print(f"[RULES] Cannot load rule definitions, keeping version={self.rules.version}: {e}")
+        except (ValueError, TypeError, KeyError) as e:
+            print(f"[RULES] Cannot load rule definitions, keeping version={self.rules.version}: {e}")
+
+        return self.rules
@@ -1,35 +1,31 @@
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
+import os
 import redis
 import time
+from blacklist_cache import BlacklistNearCache
+from circuit_breaker import CircuitBreaker, OPEN
+from instrumentation import stage_timer
+from rule_definitions import DEFAULT_RULES, CompiledRules
+from transaction_schema import transaction_schema
+from velocity import RedisCommand
 
-def validate_transaction(txn: Dict[str, Any]) -> None:
-    required: List[str] = [
-        "type",
-        "nameOrig",
-        "nameDest",
-        "oldbalanceOrg",
-        "newbalanceOrig",
-        "amount",
-        "oldbalanceDest",
-        "newbalanceDest"
-    ]
+# Biến môi trường
+# "pipeline": gom toàn bộ rule vào 1 round trip tới Redis
+# "legacy": gọi tuần tự từng lệnh (mỗi lệnh 1 round trip) như bản cũ
+RULES_MODE: str = os.getenv("RULES_MODE", "pipeline")
+# Khi circuit breaker mở / Redis lỗi (degraded mode), rule cần Redis được báo "unknown" trong rule_result.
+# Blacklist không có snapshot local thì: "fail_closed": Declined; "fail_open": bỏ qua => Approved nếu rule local đều qua
+# (velocity / spend không đánh giá được thì luôn bỏ qua, xem CompiledRules.is_declined)
+REDIS_FAILURE_POLICY: str = os.getenv("REDIS_FAILURE_POLICY", "fail_closed")
 
-    # kiểm tra đầu vào transaction có chuẩn format required không
-    for key in required:
-        if key not in txn:
-            raise KeyError(f"Missing field: {key}")
-
-def check_rules(redis_client: redis.Redis, txn: Dict[str, Any]) -> Dict[str, Any]:
-    user: str = str(txn["nameOrig"])
-    device: str = str(txn["nameDest"])
-    type: str = str(txn["type"])
-
-    result: Dict[str, Any] = {
-        "blackUser": False,
-        "blackDevice": False,
-        "SpawmOver5PerMinute": False,
-    }
+def validate_transaction(txn: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Kiểm tra transaction theo schema PaySim (kiểu dữ liệu, ép kiểu số, độ dài chuỗi, không nhận field lạ)
+    và trả về record đã chuẩn hoá để dùng cho các bước sau.
+    """
+    return transaction_schema.validate(txn)
 
+def check_amount(txn: Dict[str, Any]) -> None:
     # tiền phải > 0
     amount: int = txn["amount"]
     if not isinstance(amount, (int, float)):
@@ -37,31 +33,112 @@ def check_rules(redis_client: redis.Redis, txn: Dict[str, Any]) -> Dict[str, Any
     if amount <= 0:
         raise ValueError("Amount must be positive")
 
-    # black user
-    try:
-        if redis_client.sismember("blacklist:nameOrig", user): # nếu có nằm trong danh sách đen thì set mode blacklist = true
-            result["blackUser"] = True
-    except redis.RedisError as e:
-        raise RuntimeError(f"Redis error when checking blackUser for user={user}: {e}") from e
+def check_rules(
+    redis_client: redis.Redis,
+    txn: Dict[str, Any],
+    mode: str = RULES_MODE,
+    blacklist_cache: Optional[BlacklistNearCache] = None,
+    rules: Optional[CompiledRules] = None,
+    now: Optional[float] = None,
+    breaker: Optional[CircuitBreaker] = None,
+    features: Optional[List[Dict[str, Any]]] = None,
+) -> Dict[str, Any]:
+    return check_rules_batch(redis_client, [txn], mode, blacklist_cache, rules, now, breaker, features)[0]
 
-    # black device
-    try:
-        if redis_client.sismember("blacklist:nameDes", device): # nếu có nằm trong danh sách đen thì set mode country_black = true
-            result["blackDevice"] = True
-    except redis.RedisError as e:
-        raise RuntimeError(f"Redis error when checking blackDevice for device={device}: {e}") from e 
+def check_rules_batch(
+    redis_client: redis.Redis,
+    txns: List[Dict[str, Any]],
+    mode: str = RULES_MODE,
+    blacklist_cache: Optional[BlacklistNearCache] = None,
+    rules: Optional[CompiledRules] = None,
+    now: Optional[float] = None,
+    breaker: Optional[CircuitBreaker] = None,
+    features: Optional[List[Dict[str, Any]]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Đánh giá rule cho cả batch theo execution plan đã biên dịch (xem rule_definitions.py):
+    lệnh Redis của mọi giao dịch được gom vào cùng 1 pipeline (1 round trip).
+    Velocity counter được INCR theo đúng thứ tự trong batch nên kết quả giống gọi check_rules lần lượt.
+    Có breaker: mạch mở hoặc Redis lỗi / timeout => đánh giá local, rule cần Redis là "unknown" (breaker.last_degraded = True)
+    thay vì ném lỗi. Quyết định Approved / Declined: is_declined.
+    features: list nhận field làm giàu của từng giao dịch (spend aggregate, rỗng khi degraded) để gửi kèm Kinesis.
+    """
+    rules = rules or DEFAULT_RULES
+    now = time.time() if now is None else now
+
+    for txn in txns:
+        check_amount(txn)
 
-    # tạo giới hạn 5 lần giao dịch trong 1 giây
+    def execute(commands: List[RedisCommand]) -> List[Any]:
+        with stage_timer.stage("redis_rules"):
+            if mode == "legacy":
+                return _execute_sequential(redis_client, commands)
+            return _execute_pipeline(redis_client, commands)
+
+    if breaker is None:
+        try:
+            return rules.evaluate_batch(txns, now, execute, blacklist_cache, features)
+        except redis.RedisError as e:
+            raise _rules_error(txns, e) from e
+
+    breaker.last_degraded = False
+    if breaker.allow_request():
+        started = time.perf_counter()
+        try:
+            results = rules.evaluate_batch(txns, now, execute, blacklist_cache, features)
+            breaker.record_success((time.perf_counter() - started) * 1000)
+            return results
+        except redis.RedisError as e:
+            breaker.record_failure()
+            print(f"[CIRCUIT] {_rules_error(txns, e)}")
+
+    breaker.last_degraded = True
+    if features is not None:
+        features.extend({} for _ in txns)
+    print(f"[CIRCUIT] Degraded mode ({REDIS_FAILURE_POLICY}) for {len(txns)} transaction(s), breaker={breaker.state}")
+    return rules.evaluate_degraded(txns, blacklist_cache)
+
+def is_declined(rule_result: Dict[str, Any], rules: Optional[CompiledRules] = None) -> bool:
+    # giao dịch bị Declined theo rule_result (kể cả rule "unknown" của degraded mode, theo REDIS_FAILURE_POLICY)
+    return (rules or DEFAULT_RULES).is_declined(rule_result, REDIS_FAILURE_POLICY != "fail_open")
+
+def record_approved_spend(
+    redis_client: redis.Redis,
+    txns: List[Dict[str, Any]],
+    rules: Optional[CompiledRules] = None,
+    now: Optional[float] = None,
+    breaker: Optional[CircuitBreaker] = None,
+) -> None:
+    """
+    Cộng tiền của các giao dịch đã Approved vào spend aggregate (sau quyết định, 1 pipeline riêng).
+    Fire-and-forget: lỗi Redis chỉ log (quyết định đã xong), mạch đang mở / request degraded thì bỏ qua.
+    """
+    rules = rules or DEFAULT_RULES
+    if not txns or not rules.spend.rules:
+        return
+    if breaker is not None and (breaker.last_degraded or breaker.state == OPEN):
+        return
+    now = time.time() if now is None else now
     try:
-        counter_key: str = f"{type}:txnCount:{user}:{device}"
-        
-        count: int = redis_client.incr(counter_key) # type: ignore 
-        
-        if count == 1: # nếu key vừa được tạo mới lần đầu sẽ set ttl là 60 giây
-            redis_client.expire(counter_key, 60) 
-        if count > 5: # nếu > 5 thì set mode limit = true
-            result["SpawmOver5PerMinute"] = True
+        with stage_timer.stage("redis_spend"):
+            _execute_pipeline(redis_client, rules.approved_commands(txns, now))
     except redis.RedisError as e:
-        raise RuntimeError(f"Redis error when incrementing txnCount for user={user}: {e}") from e
+        print(f"[SPEND] Failed to record approved spend for {len(txns)} transaction(s): {e}")
+
+def _rules_error(txns: List[Dict[str, Any]], e: redis.RedisError) -> RuntimeError:
+    users = ",".join(str(txn.get("nameOrig")) for txn in txns[:5])
+    return RuntimeError(f"Redis error when evaluating rules for user={users}: {e}")
+
+def _execute_pipeline(redis_client: redis.Redis, commands: List[RedisCommand]) -> List[Any]:
+    """
+    Gửi toàn bộ lệnh trong 1 pipeline (không MULTI) => chỉ 1 round trip.
+    Không dùng Lua script vì các key nằm ở các hash slot khác nhau (ElastiCache Serverless chạy cluster mode).
+    """
+    pipe = redis_client.pipeline(transaction=False)
+    for name, args, kwargs in commands:
+        getattr(pipe, name)(*args, **kwargs)
+    return pipe.execute()
 
-    return result
\ No newline at end of file
+def _execute_sequential(redis_client: redis.Redis, commands: List[RedisCommand]) -> List[Any]:
+    # mỗi lệnh 1 round trip (giữ lại để so sánh / fallback)
+    return [getattr(redis_client, name)(*args, **kwargs) for name, args, kwargs in commands]
@@ -1,44 +1,218 @@
 import os
+import io
+import gzip
 import json
-from typing import Any
-import boto3
-from botocore.exceptions import ClientError
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+from health_check import register_health_check
+from instrumentation import stage_timer
 
 
 # Biến môi trường
 AWS_REGION: str = os.getenv("AWS_REGION", "us-east-1")
 S3_BUCKET_NAME: str = os.getenv("S3_BUCKET_NAME", "violated-transactions-bucket")
 S3_PREFIX: str = os.getenv("S3_PREFIX", "violations/")  # tên root folder trong bucket
+# Giao dịch bị Declined trong degraded mode (Redis lỗi, rule "unknown") không phải vi phạm đã xác nhận => folder riêng
+S3_DEGRADED_PREFIX: str = os.getenv("S3_DEGRADED_PREFIX", "degraded/")
+# "object": mỗi giao dịch vi phạm 1 file JSON (như cũ)
+# "archive": gom nhiều giao dịch vào file NDJSON nén gzip, chia partition theo ngày / giờ
+S3_SINK_MODE: str = os.getenv("S3_SINK_MODE", "object")
+S3_ARCHIVE_MAX_RECORDS: int = int(os.getenv("S3_ARCHIVE_MAX_RECORDS", "1000"))
+S3_ARCHIVE_MAX_BYTES: int = int(os.getenv("S3_ARCHIVE_MAX_BYTES", str(8 * 1024 * 1024)))  # trước khi nén
+S3_ARCHIVE_MAX_BUFFER_SECONDS: float = float(os.getenv("S3_ARCHIVE_MAX_BUFFER_SECONDS", "60"))
 
-s3_client = boto3.client("s3", region_name=AWS_REGION)
+# S3 chỉ dùng khi có giao dịch bị Declined => tạo client khi dùng lần đầu
+s3_client: Optional[Any] = None
 
-def save_to_s3(transaction_data: dict) -> None:
+def get_s3_client() -> Any:
+    global s3_client
+    if s3_client is None:
+        import boto3
+        s3_client = boto3.client("s3", region_name=AWS_REGION)
+    return s3_client
+
+def check_bucket() -> None:
+    # Kiểm tra bucket tồn tại và quyền truy cập
+    get_s3_client().head_bucket(Bucket=S3_BUCKET_NAME)
+    print(f"[S3] Bucket exists and Lambda has access permission.")
+
+s3_health = register_health_check("s3", check_bucket)
+
+def save_to_s3(transaction_data: dict, rule_result: Optional[Dict[str, Any]] = None, degraded: bool = False) -> None:
+    prefix: str = S3_DEGRADED_PREFIX if degraded else S3_PREFIX
+    if S3_SINK_MODE == "archive":
+        violation_archive.add(transaction_data, rule_result, prefix)
+        return
 
     # Lấy transaction_id hoặc timestamp để đặt tên file
     user: str = transaction_data.get("nameOrig", "unknown")
     device: str = transaction_data.get("nameDest", "unknown")
-    file_name: str = f"{S3_PREFIX}{user}_{device}.json"
+    file_name: str = f"{prefix}{user}_{device}.json"
 
     print(f"[S3] Region={AWS_REGION} | Bucket={S3_BUCKET_NAME} | Key={file_name}")
 
+    # import lúc dùng: botocore chỉ được nạp khi thật sự ghi S3
+    from botocore.exceptions import ClientError
+
     try:
-         # ===== Kiểm tra bucket tồn tại và quyền truy cập =====
-        s3_client.head_bucket(Bucket=S3_BUCKET_NAME)
-        print(f"[S3] Bucket exists and Lambda has access permission.")
+        # ===== Kiểm tra bucket tồn tại và quyền truy cập (cache theo container) =====
+        s3_health.ensure()
 
         # Chuyển sang JSON string
         json_data: str = json.dumps(transaction_data, ensure_ascii=False)
 
         # Upload lên S3
-        s3_client.put_object(
-            Bucket=S3_BUCKET_NAME,
-            Key=file_name,
-            Body=json_data.encode("utf-8"),
-            ContentType="application/json"
-        )
+        with stage_timer.stage("s3_put"):
+            get_s3_client().put_object(
+                Bucket=S3_BUCKET_NAME,
+                Key=file_name,
+                Body=json_data.encode("utf-8"),
+                ContentType="application/json"
+            )
 
         print(f"[S3] Upload successful at: {S3_BUCKET_NAME}/{file_name}")
 
     except ClientError as e:
+        s3_health.mark_failed()
         raise RuntimeError(f"[S3] ERROR: Unexpected exception: {e}")
         
+
+
+def flush_violations() -> None:
+    """
+    Gọi ở cuối mỗi invocation / batch (không làm gì ở chế độ "object").
+    """
+    violation_archive.flush()
+
+def discard_violations() -> int:
+    """
+    Bỏ vi phạm còn trong buffer (batch lỗi giữa chừng => client retry cả batch, ghi lại sẽ bị trùng).
+    """
+    return violation_archive.discard()
+
+def partition_prefix(ts: datetime, prefix: str = S3_PREFIX) -> str:
+    return f"{prefix}dt={ts:%Y-%m-%d}/hour={ts:%H}/"
+
+class ViolationArchive:
+    """
+    Gom giao dịch vi phạm thành NDJSON nén gzip:
+        violations/dt=YYYY-MM-DD/hour=HH/part-<epoch_ms>-<uuid>.json.gz
+    (Declined trong degraded mode: cùng cấu trúc dưới S3_DEGRADED_PREFIX)
+    Tên file luôn duy nhất => không ghi đè vi phạm cũ của cùng cặp nameOrig/nameDest.
+    Flush khi đủ số record / dung lượng / thời gian chờ, và khi caller gọi flush().
+    """
+
+    def __init__(
+        self,
+        bucket: str = S3_BUCKET_NAME,
+        prefix: str = S3_PREFIX,
+        max_records: int = S3_ARCHIVE_MAX_RECORDS,
+        max_bytes: int = S3_ARCHIVE_MAX_BYTES,
+        max_buffer_seconds: float = S3_ARCHIVE_MAX_BUFFER_SECONDS,
+    ) -> None:
+        self.bucket: str = bucket
+        self.prefix: str = prefix
+        self.max_records: int = max_records
+        self.max_bytes: int = max_bytes
+        self.max_buffer_seconds: float = max_buffer_seconds
+        # partition prefix -> list dòng NDJSON
+        self.partitions: Dict[str, List[bytes]] = {}
+        self.buffered_records: int = 0
+        self.buffered_bytes: int = 0
+        self.oldest_at: float = 0.0
+        # counters
+        self.objects_written: int = 0
+        self.records_written: int = 0
+
+    def add(self, transaction_data: dict, rule_result: Optional[Dict[str, Any]] = None, prefix: Optional[str] = None) -> None:
+        declined_at = datetime.now(timezone.utc)
+        record = dict(transaction_data)
+        record["declined_at"] = declined_at.isoformat()
+        if rule_result is not None:
+            record["rule_result"] = rule_result
+        line: bytes = json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+
+        if not self.buffered_records:
+            self.oldest_at = time.monotonic()
+        self.partitions.setdefault(partition_prefix(declined_at, prefix or self.prefix), []).append(line)
+        self.buffered_records += 1
+        self.buffered_bytes += len(line)
+
+        if (
+            self.buffered_records >= self.max_records
+            or self.buffered_bytes >= self.max_bytes
+            or time.monotonic() - self.oldest_at >= self.max_buffer_seconds
+        ):
+            self.flush()
+
+    def discard(self) -> int:
+        dropped: int = self.buffered_records
+        self.partitions = {}
+        self.buffered_records, self.buffered_bytes = 0, 0
+        return dropped
+
+    def flush(self) -> None:
+        if not self.partitions:
+            return
+        partitions, self.partitions = self.partitions, {}
+        self.buffered_records, self.buffered_bytes = 0, 0
+
+        from botocore.exceptions import ClientError
+
+        try:
+            s3_health.ensure()
+            for partition, lines in partitions.items():
+                key: str = f"{partition}part-{int(time.time() * 1000)}-{uuid.uuid4().hex}.json.gz"
+                body: bytes = gzip.compress(b"".join(lines))
+                with stage_timer.stage("s3_put"):
+                    get_s3_client().put_object(
+                        Bucket=self.bucket,
+                        Key=key,
+                        Body=body,
+                        ContentType="application/x-ndjson",
+                        ContentEncoding="gzip"
+                    )
+                self.objects_written += 1
+                self.records_written += len(lines)
+                print(f"[S3] Archived {len(lines)} violations at: {self.bucket}/{key} ({len(body)} bytes)")
+        except ClientError as e:
+            s3_health.mark_failed()
+            raise RuntimeError(f"[S3] ERROR: Unexpected exception: {e}")
+
+violation_archive: ViolationArchive = ViolationArchive()
+
+def iter_violations(
+    start: datetime,
+    end: datetime,
+    bucket: str = S3_BUCKET_NAME,
+    prefix: str = S3_PREFIX,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Đọc lại (streaming, không tải cả file vào RAM) các giao dịch vi phạm đã archive
+    trong khoảng giờ [start, end] (UTC, làm tròn theo giờ).
+    """
+    paginator = get_s3_client().get_paginator("list_objects_v2")
+    hour = start.replace(minute=0, second=0, microsecond=0)
+    while hour <= end:
+        for page in paginator.paginate(Bucket=bucket, Prefix=partition_prefix(hour, prefix)):
+            for obj in page.get("Contents", []):
+                if not obj["Key"].endswith(".json.gz"):
+                    continue
+                body = get_s3_client().get_object(Bucket=bucket, Key=obj["Key"])["Body"]
+                with gzip.GzipFile(fileobj=body) as gz:
+                    for line in io.TextIOWrapper(gz, encoding="utf-8"):
+                        if line.strip():
+                            yield json.loads(line)
+        hour = datetime.fromtimestamp(hour.timestamp() + 3600, tz=hour.tzinfo)
+
+
+if __name__ == "__main__":
+    # Ví dụ: python save_s3.py 2025-11-15T00 2025-11-15T23 > violations.ndjson
+    import sys
+
+    start_arg = datetime.strptime(sys.argv[1], "%Y-%m-%dT%H").replace(tzinfo=timezone.utc)
+    end_arg = datetime.strptime(sys.argv[2], "%Y-%m-%dT%H").replace(tzinfo=timezone.utc) if len(sys.argv) > 2 else start_arg
+    for violation in iter_violations(start_arg, end_arg):
+        print(json.dumps(violation, ensure_ascii=False))
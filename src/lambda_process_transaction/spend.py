@@ -0,0 +1,104 @@
+import os
+from typing import Any, Dict, List, Optional, Tuple
+from velocity import RedisCommand, VelocityRule
+
+# Biến môi trường
+# SPEND_RULES là JSON list, ví dụ:
+# [
+#   {"name": "UserSpend1h",  "fields": ["nameOrig"], "window": 3600},
+#   {"name": "UserSpendOver1MPerDay", "fields": ["nameOrig"], "window": 86400, "max_amount": 1000000},
+#   {"name": "DestOver50PerHour", "fields": ["nameDest"], "window": 3600, "limit": 50}
+# ]
+# max_amount: tổng tiền tối đa trong cửa sổ (tiền đã được Approved + giao dịch đang xét),
+# limit: số lần thử tối đa trong cửa sổ (đếm cả giao dịch bị Declined).
+# Rule không có max_amount / limit chỉ dùng để làm giàu record gửi Kinesis (không bao giờ Declined).
+DEFAULT_SPEND_RULES: List[Dict[str, Any]] = [
+    {"name": "UserSpend1h", "fields": ["nameOrig"], "window": 3600},
+    {"name": "DestSpend1h", "fields": ["nameDest"], "window": 3600},
+]
+SPEND_RULES: str = os.getenv("SPEND_RULES", "")
+
+SPEND_KEY_PREFIX: str = "spend"
+
+
+class SpendRule(VelocityRule):
+    """
+    Tổng tiền + số giao dịch trượt theo cửa sổ, cùng cách chia 2 bucket như VelocityRule.
+    Mỗi bucket là 1 hash {sum, count} có TTL => bộ nhớ Redis bị chặn ở 2 key / identity / rule.
+    count: số lần thử (tăng khi đánh giá rule), sum: tổng tiền đã Approved (chỉ cộng sau khi có quyết định).
+    """
+
+    key_prefix: str = SPEND_KEY_PREFIX
+
+    def __init__(
+        self,
+        name: str,
+        fields: List[str],
+        window: float,
+        limit: Optional[int] = None,
+        max_amount: Optional[float] = None,
+    ) -> None:
+        super().__init__(name, fields, window, limit if limit is not None else 0)
+        self.count_limit: Optional[int] = limit
+        self.max_amount: Optional[float] = max_amount
+
+    @property
+    def has_limit(self) -> bool:
+        return self.count_limit is not None or self.max_amount is not None
+
+
+class SpendAggregator:
+    """
+    Gom lệnh của mọi spend rule thành list RedisCommand (đi chung pipeline với các rule khác).
+    Mỗi rule tốn 4 lệnh: HINCRBY count, EXPIRE NX, HGET sum bucket hiện tại, HMGET bucket trước.
+    Tiền chỉ được cộng vào sum khi giao dịch Approved (approved_commands, pipeline riêng sau quyết định)
+    => giao dịch bị chặn không làm tăng "tiền đã chuyển" gửi Kinesis, cũng không ăn vào hạn mức max_amount.
+    """
+
+    COMMANDS_PER_RULE: int = 4
+
+    def __init__(self, rules: List[SpendRule]) -> None:
+        self.rules: List[SpendRule] = rules
+
+    def rule_names(self) -> List[str]:
+        # chỉ rule có ngưỡng mới xuất hiện trong rule_result
+        return [rule.name for rule in self.rules if rule.has_limit]
+
+    def commands(self, txn: Dict[str, Any], now: float) -> List[RedisCommand]:
+        commands: List[RedisCommand] = []
+        for rule in self.rules:
+            current_key, previous_key = rule.keys(txn, now)
+            commands.append(("hincrby", (current_key, "count", 1), {}))
+            commands.append(("expire", (current_key, rule.ttl_seconds), {"nx": True}))
+            commands.append(("hget", (current_key, "sum"), {}))
+            commands.append(("hmget", (previous_key, ["sum", "count"]), {}))
+        return commands
+
+    def approved_commands(self, txn: Dict[str, Any], now: float) -> List[RedisCommand]:
+        # cộng tiền của giao dịch đã Approved vào bucket hiện tại (EXPIRE NX phòng khi bucket vừa sang cửa sổ mới)
+        commands: List[RedisCommand] = []
+        for rule in self.rules:
+            current_key, _ = rule.keys(txn, now)
+            commands.append(("hincrbyfloat", (current_key, "sum", float(txn["amount"])), {}))
+            commands.append(("expire", (current_key, rule.ttl_seconds), {"nx": True}))
+        return commands
+
+    def evaluate(self, txn: Dict[str, Any], replies: List[Any], now: float) -> Tuple[Dict[str, bool], Dict[str, float]]:
+        """
+        replies: kết quả Redis theo đúng thứ tự của commands().
+        Trả về (rule_result, field làm giàu record: <rule>_sum = tiền đã Approved + giao dịch này, <rule>_count = số lần thử).
+        """
+        result: Dict[str, bool] = {}
+        features: Dict[str, float] = {}
+        amount = float(txn["amount"])
+        for i, rule in enumerate(self.rules):
+            current_count, _, current_sum, (previous_sum, previous_count) = \
+                replies[i * self.COMMANDS_PER_RULE:(i + 1) * self.COMMANDS_PER_RULE]
+            total = rule.estimate(float(current_sum or 0) + amount, float(previous_sum or 0), now)
+            count = rule.estimate(int(current_count), int(previous_count or 0), now)
+            features[f"{rule.name}_sum"] = round(total, 2)
+            features[f"{rule.name}_count"] = round(count, 2)
+            if rule.has_limit:
+                result[rule.name] = (rule.max_amount is not None and total > rule.max_amount) \
+                    or (rule.count_limit is not None and count > rule.count_limit)
+        return result, features
@@ -0,0 +1,164 @@
+import json
+import math
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+# Biến môi trường
+# "auto": dùng orjson nếu có trong package, "orjson" / "stdlib": ép dùng 1 backend
+JSON_BACKEND: str = os.getenv("JSON_BACKEND", "auto")
+
+PAYSIM_TYPES: Tuple[str, ...] = ("CASH_IN", "CASH_OUT", "DEBIT", "PAYMENT", "TRANSFER")
+
+# Schema giao dịch PaySim: field -> (kiểu, bắt buộc, ràng buộc)
+TRANSACTION_SCHEMA: Dict[str, Dict[str, Any]] = {
+    "step": {"type": "int", "required": False, "min": 0},
+    "type": {"type": "enum", "required": True, "values": PAYSIM_TYPES},
+    "amount": {"type": "number", "required": True, "min": 0, "exclusive_min": True},
+    "nameOrig": {"type": "str", "required": True, "min_length": 1, "max_length": 64},
+    "oldbalanceOrg": {"type": "number", "required": True, "min": 0},
+    "newbalanceOrig": {"type": "number", "required": True, "min": 0},
+    "nameDest": {"type": "str", "required": True, "min_length": 1, "max_length": 64},
+    "oldbalanceDest": {"type": "number", "required": True, "min": 0},
+    "newbalanceDest": {"type": "number", "required": True, "min": 0},
+}
+
+Validator = Callable[[Any], Any]
+
+
+def _load_json_backend() -> Tuple[str, Callable[[Union[str, bytes]], Any]]:
+    if JSON_BACKEND in ("auto", "orjson"):
+        try:
+            import orjson
+            return "orjson", orjson.loads
+        except ImportError:
+            if JSON_BACKEND == "orjson":
+                raise
+    return "stdlib", json.loads
+
+
+JSON_BACKEND_NAME, _json_loads = _load_json_backend()
+
+
+def decode_body(body: Any) -> Any:
+    """
+    Parse body của API Gateway (str / bytes) bằng backend JSON nhanh nhất có sẵn.
+    Lỗi cú pháp JSON được chuyển thành ValueError (=> 400).
+    """
+    if not isinstance(body, (str, bytes, bytearray)):
+        raise TypeError("Request body must be a JSON string")
+    try:
+        return _json_loads(body)
+    except ValueError as e:  # orjson.JSONDecodeError và json.JSONDecodeError đều là ValueError
+        raise ValueError(f"Invalid JSON body: {e}") from e
+
+
+def _number(field: str, spec: Dict[str, Any]) -> Validator:
+    minimum: Optional[float] = spec.get("min")
+    exclusive: bool = spec.get("exclusive_min", False)
+
+    def validate(value: Any) -> float:
+        # bool là subclass của int => loại riêng
+        if isinstance(value, bool):
+            raise TypeError(f"{field} must be numeric")
+        if isinstance(value, str):
+            try:
+                value = float(value)
+            except ValueError:
+                raise TypeError(f"{field} must be numeric") from None
+        elif not isinstance(value, (int, float)):
+            raise TypeError(f"{field} must be numeric")
+        value = float(value)
+        if not math.isfinite(value):
+            raise ValueError(f"{field} must be finite")
+        if minimum is not None and (value <= minimum if exclusive else value < minimum):
+            if field == "amount":
+                raise ValueError("Amount must be positive")
+            raise ValueError(f"{field} must be {'>' if exclusive else '>='} {minimum}")
+        return value
+
+    return validate
+
+
+def _integer(field: str, spec: Dict[str, Any]) -> Validator:
+    minimum: Optional[int] = spec.get("min")
+
+    def validate(value: Any) -> int:
+        if isinstance(value, bool):
+            raise TypeError(f"{field} must be an integer")
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        elif isinstance(value, str) and value.lstrip("-").isdigit():
+            value = int(value)
+        if not isinstance(value, int):
+            raise TypeError(f"{field} must be an integer")
+        if minimum is not None and value < minimum:
+            raise ValueError(f"{field} must be >= {minimum}")
+        return value
+
+    return validate
+
+
+def _string(field: str, spec: Dict[str, Any]) -> Validator:
+    min_length: int = spec.get("min_length", 0)
+    max_length: int = spec.get("max_length", 1 << 30)
+
+    def validate(value: Any) -> str:
+        if not isinstance(value, str):
+            raise TypeError(f"{field} must be a string")
+        if not min_length <= len(value) <= max_length:
+            raise ValueError(f"{field} length must be between {min_length} and {max_length}")
+        return value
+
+    return validate
+
+
+def _enum(field: str, spec: Dict[str, Any]) -> Validator:
+    allowed = frozenset(spec["values"])
+
+    def validate(value: Any) -> str:
+        if value not in allowed:
+            raise ValueError(f"{field} must be one of {sorted(allowed)}")
+        return value
+
+    return validate
+
+
+_VALIDATOR_FACTORIES: Dict[str, Callable[[str, Dict[str, Any]], Validator]] = {
+    "number": _number,
+    "int": _integer,
+    "str": _string,
+    "enum": _enum,
+}
+
+
+class CompiledSchema:
+    """
+    Biên dịch schema 1 lần (lúc import) thành list closure kiểm tra từng field.
+    validate() trả về record đã chuẩn hoá: chỉ gồm field trong schema, đúng thứ tự, số đã ép về float / int.
+    """
+
+    def __init__(self, schema: Dict[str, Dict[str, Any]]) -> None:
+        self.fields: List[Tuple[str, bool, Validator]] = [
+            (field, spec["required"], _VALIDATOR_FACTORIES[spec["type"]](field, spec))
+            for field, spec in schema.items()
+        ]
+        self.known_fields = frozenset(schema)
+
+    def validate(self, txn: Any) -> Dict[str, Any]:
+        if not isinstance(txn, dict):
+            raise TypeError("Transaction must be a JSON object")
+
+        normalized: Dict[str, Any] = {}
+        for field, required, validator in self.fields:
+            if field in txn:
+                normalized[field] = validator(txn[field])
+            elif required:
+                raise KeyError(f"Missing field: {field}")
+
+        if len(normalized) != len(txn):
+            unknown = sorted(set(txn) - self.known_fields)
+            raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+        return normalized
+
+
+transaction_schema: CompiledSchema = CompiledSchema(TRANSACTION_SCHEMA)
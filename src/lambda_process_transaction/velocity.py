@@ -0,0 +1,91 @@
+import math
+import os
+from typing import Any, Dict, List, Tuple
+
+# Biến môi trường
+# VELOCITY_RULES là JSON list, ví dụ:
+# [
+#   {"name": "UserOver3PerSecond",  "fields": ["nameOrig"],             "window": 1,    "limit": 3},
+#   {"name": "SpawmOver5PerMinute", "fields": ["type", "nameOrig", "nameDest"], "window": 60, "limit": 5},
+#   {"name": "DeviceOver100PerHour", "fields": ["nameDest"],            "window": 3600, "limit": 100}
+# ]
+# fields chọn chiều đếm: user (nameOrig), device (nameDest), user+device, có thể kèm type
+DEFAULT_VELOCITY_RULES: List[Dict[str, Any]] = [
+    {"name": "SpawmOver5PerMinute", "fields": ["type", "nameOrig", "nameDest"], "window": 60, "limit": 5},
+]
+VELOCITY_RULES: str = os.getenv("VELOCITY_RULES", "")
+
+VELOCITY_KEY_PREFIX: str = "velocity"
+
+# 1 lệnh Redis = (tên method của redis client / pipeline, args, kwargs)
+RedisCommand = Tuple[str, Tuple[Any, ...], Dict[str, Any]]
+
+
+class VelocityRule:
+    """
+    Sliding window counter xấp xỉ: mỗi cửa sổ giữ 2 bucket (hiện tại + trước đó),
+    count ≈ prev * (phần còn lại của cửa sổ trước) + current.
+    => không còn burst gấp đôi ở ranh giới cửa sổ như fixed window, mỗi identity chỉ tốn 2 key.
+    """
+
+    key_prefix: str = VELOCITY_KEY_PREFIX
+
+    def __init__(self, name: str, fields: List[str], window: float, limit: int) -> None:
+        if window <= 0:
+            raise ValueError(f"Velocity rule {name}: window must be positive")
+        if not fields:
+            raise ValueError(f"Velocity rule {name}: fields must not be empty")
+        self.name: str = name
+        self.fields: List[str] = list(fields)
+        self.window: float = float(window)
+        self.limit: int = int(limit)
+        # bucket trước phải còn sống suốt cửa sổ hiện tại
+        self.ttl_seconds: int = max(1, math.ceil(self.window * 2))
+
+    def identity(self, txn: Dict[str, Any]) -> str:
+        return ":".join(str(txn[field]) for field in self.fields)
+
+    def keys(self, txn: Dict[str, Any], now: float) -> Tuple[str, str]:
+        bucket = int(now // self.window)
+        base = f"{self.key_prefix}:{self.name}:{self.identity(txn)}"
+        return f"{base}:{bucket}", f"{base}:{bucket - 1}"
+
+    def estimate(self, current: int, previous: int, now: float) -> float:
+        elapsed_ratio = (now % self.window) / self.window
+        return previous * (1.0 - elapsed_ratio) + current
+
+
+class VelocityLimiter:
+    """
+    Gom lệnh của mọi velocity rule thành list RedisCommand để check_rules đẩy chung vào 1 pipeline.
+    Mỗi rule tốn 3 lệnh: INCR bucket hiện tại, EXPIRE NX, GET bucket trước.
+    """
+
+    COMMANDS_PER_RULE: int = 3
+
+    def __init__(self, rules: List[VelocityRule]) -> None:
+        self.rules: List[VelocityRule] = rules
+
+    def rule_names(self) -> List[str]:
+        return [rule.name for rule in self.rules]
+
+    def commands(self, txn: Dict[str, Any], now: float) -> List[RedisCommand]:
+        commands: List[RedisCommand] = []
+        for rule in self.rules:
+            current_key, previous_key = rule.keys(txn, now)
+            commands.append(("incr", (current_key,), {}))
+            commands.append(("expire", (current_key, rule.ttl_seconds), {"nx": True}))
+            commands.append(("get", (previous_key,), {}))
+        return commands
+
+    def evaluate(self, replies: List[Any], now: float) -> Dict[str, bool]:
+        """
+        replies: kết quả Redis theo đúng thứ tự của commands().
+        """
+        result: Dict[str, bool] = {}
+        for i, rule in enumerate(self.rules):
+            current, _, previous = replies[i * self.COMMANDS_PER_RULE:(i + 1) * self.COMMANDS_PER_RULE]
+            count = rule.estimate(int(current), int(previous or 0), now)
+            result[rule.name] = count > rule.limit
+        return result
+
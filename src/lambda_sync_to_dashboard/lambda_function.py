@@ -4,6 +4,7 @@ import requests
 from requests.auth import HTTPBasicAuth
 from boto3.dynamodb.types import TypeDeserializer
 from datetime import datetime
+from instrumentation import stage_timer
 
 # Environment variables
 OS_HOST = os.environ['OS_HOST']           # ví dụ: search-fraud-dashboard-domain-xxxx.es.amazonaws.com
@@ -32,6 +33,7 @@ def unmarshall(dynamo_obj):
 
 def lambda_handler(event, context):
     print("===== Lambda START =====")
+    stage_timer.start()
     print("Event received:")
     print(json.dumps(event, indent=2))
 
@@ -49,7 +51,8 @@ def lambda_handler(event, context):
                 new_image = record['dynamodb']['NewImage']
                 print("NewImage raw:", new_image)
 
-                doc = unmarshall(new_image)
+                with stage_timer.stage("unmarshall"):
+                    doc = unmarshall(new_image)
                 doc_id = doc.get('transactionId')
 
                 if not doc_id:
@@ -60,12 +63,13 @@ def lambda_handler(event, context):
                 print(f"Final request URL: {url}")
                 print(f"Sending document to OpenSearch: {doc}")
 
-                response = requests.put(
-                    url,
-                    auth=HTTPBasicAuth(OS_USER, OS_PASSWORD),
-                    json=doc,
-                    headers=headers
-                )
+                with stage_timer.stage("opensearch_index"):
+                    response = requests.put(
+                        url,
+                        auth=HTTPBasicAuth(OS_USER, OS_PASSWORD),
+                        json=doc,
+                        headers=headers
+                    )
 
                 print("OpenSearch Response:")
                 print(response.text)
@@ -73,6 +77,7 @@ def lambda_handler(event, context):
     except Exception as e:
         print(f"Lambda ERROR: {e}")
 
+    stage_timer.emit({"records": len(event.get('Records', []))})
     print("===== Lambda END =====")
     return {"status": "done"}
 
@@ -24,6 +24,11 @@ def scan_keys(pattern):
     return results
 
 
+# Tăng version mỗi khi sửa blacklist để near-cache trong Lambda_ProcessTransaction build lại snapshot
+def bump_blacklist_version():
+    r.incr("meta:blacklist:version")
+
+
 # ----------------------------------------------------
 # Trang chủ: danh sách tất cả blacklist keys
 # ----------------------------------------------------
@@ -65,6 +70,7 @@ def add_item(key):
     item = request.form.get("item")
     if item:
         r.sadd(f"blacklist:{key}", item)
+        bump_blacklist_version()
     return redirect(f"/key/{key}")
 
 
@@ -74,6 +80,7 @@ def add_item(key):
 @app.route("/key/<key>/delete/<item>")
 def delete_item(key, item):
     r.srem(f"blacklist:{key}", item)
+    bump_blacklist_version()
     return redirect(f"/key/{key}")
 
 